@@ -0,0 +1,291 @@
+"""
+分析阶段注册表
+每个分析模块注册为一个可插拔的阶段，声明入口函数、需要的数据列、依赖的可选库，
+以及如何把返回值整理成 /results 响应中的字段。
+请求可以只指定需要的分析；清洗完成后先检查各阶段的条件，缺少数据列或依赖库的阶段直接跳过，
+不会先计算再报错。模块和函数按名称登记，只在工作进程中执行阶段时才导入。
+每个阶段在计算图（见 dag.py）中展开为一组节点：K-means 和热力图拆分为特征、标准化、聚类等独立节点，
+其他分析整体作为一个节点；阶段输出图表数据（见 charts.py），图片在请求时才渲染
+"""
+import os
+import shutil
+import tempfile
+import importlib
+import importlib.util
+
+import charts
+from dag import Node
+
+# 未指定分析时执行的阶段（与之前的固定流程一致）
+DEFAULT_ANALYSES = ['kmeans', 'heatmap', 'funnel']
+
+
+class AnalysisStage:
+    """
+    一个可插拔的分析阶段
+
+    Args:
+        name: 阶段名，也是 /analyze?analyses= 中使用的名称
+        title: 阶段的中文名称
+        module: 分析模块名
+        function: 入口函数名，调用方式为 function(df, output_dir, **kwargs)
+        summarize: 把入口函数的返回值整理成响应字段的函数 summarize(result)
+        required_columns: 需要的数据列，每一项是可互相替代的列名元组，任意一个存在即可
+        requires: 依赖的可选库（模块名），未安装时跳过该阶段
+        check: 模块中额外的检查函数名 check(df)，返回不满足条件的原因，满足时返回 None
+        kwargs: 调用入口函数时的额外参数
+        build_nodes: 把阶段拆分为多个计算图节点的函数 build_nodes(params)，未提供时整个入口函数作为一个节点
+    """
+
+    def __init__(self, name, title, module, function, summarize, required_columns=(), requires=(),
+                 check=None, kwargs=None, build_nodes=None):
+        self.name = name
+        self.title = title
+        self.module = module
+        self.function = function
+        self.summarize = summarize
+        self.required_columns = required_columns
+        self.requires = requires
+        self.check = check
+        self.kwargs = kwargs or {}
+        self.build_nodes = build_nodes
+
+    @property
+    def charts(self):
+        """该阶段生成的图表（charts.Chart 列表）"""
+        return charts.STAGE_CHARTS.get(self.name, [])
+
+    def nodes(self, params=None):
+        """
+        该阶段在计算图中的节点，都以清洗后的数据（clean 节点）为起点
+
+        Args:
+            params: 阶段参数，覆盖入口函数的默认参数
+
+        Returns:
+            list: 节点列表，其中与阶段同名的节点输出
+                {'result': 分析结果, 'charts': 图表名 -> 图表数据, 'files': 文件名 -> 内容}
+        """
+        if self.build_nodes is not None:
+            return self.build_nodes(params or {})
+        return [Node(self.name, run_isolated, inputs=['clean'], stage=self.name, params={
+            'module': self.module,
+            'function': self.function,
+            'kwargs': {**self.kwargs, **(params or {})}
+        })]
+
+    def missing_dependencies(self):
+        """
+        检查运行环境是否安装了依赖的可选库
+
+        Returns:
+            str: 缺少依赖时的原因，满足时返回 None
+        """
+        missing_modules = [name for name in self.requires if importlib.util.find_spec(name) is None]
+        if missing_modules:
+            return f"缺少依赖库: {', '.join(missing_modules)}"
+        return None
+
+    def ineligible_reason(self, df):
+        """
+        检查数据是否满足该阶段的条件
+
+        Returns:
+            str: 不满足条件的原因，满足时返回 None
+        """
+        missing_columns = [
+            "/".join(group) for group in self.required_columns
+            if not any(column in df.columns for column in group)
+        ]
+        if missing_columns:
+            return f"缺少必要列: {', '.join(missing_columns)}"
+        if self.check is not None:
+            return getattr(importlib.import_module(self.module), self.check)(df)
+        return None
+
+
+def run_isolated(df, module, function, kwargs):
+    """
+    在临时目录中执行整个分析函数（作为计算图中的单个节点）
+
+    Returns:
+        dict: result 为分析函数的返回值，charts 为其中的图表数据，files 为生成的文件名 -> 内容
+    """
+    output_dir = tempfile.mkdtemp(prefix='stage_')
+    try:
+        result = dict(getattr(importlib.import_module(module), function)(df, output_dir, **kwargs))
+        files = {}
+        for name in os.listdir(output_dir):
+            with open(os.path.join(output_dir, name), 'rb') as f:
+                files[name] = f.read()
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return {'result': result, 'charts': result.pop('charts', None) or {}, 'files': files}
+
+
+def check_columns(df, stage):
+    """计算图节点：检查清洗后的数据是否满足阶段的条件，返回不满足的原因或 None"""
+    return STAGES[stage].ineligible_reason(df)
+
+
+def _kmeans_nodes(params):
+    # clean -> 特征 -> 标准化 -> {肘部法则 -> 最终聚类, PCA} -> 散点图数据、聚类统计
+    # 最终聚类直接使用肘部法则中拟合好的模型，修改聚类数时只重新选择，不重新拟合
+    import kmeans_cluster_analysis as km
+
+    # 未指定聚类数时按 k_score 得分自动选择，没有 k_score 时使用默认聚类数
+    n_clusters = params.get('n_clusters')
+    k_score = params.get('k_score')
+    return [
+        # 列选取和标准化比读取缓存还快，不缓存
+        Node('kmeans_features', km.build_features, ['clean'], stage='kmeans', cache=False),
+        Node('kmeans_scaled', km.standardize, ['kmeans_features'], stage='kmeans', cache=False),
+        Node('kmeans_sweep', km.elbow_sweep, ['kmeans_scaled'], params={'k_score': k_score} if k_score else None,
+             stage='kmeans'),
+        Node('kmeans_elbow', km.elbow_chart, ['kmeans_sweep'], params={'n_clusters': n_clusters}, stage='kmeans'),
+        Node('kmeans_fit', km.fit_clusters, ['kmeans_scaled', 'kmeans_sweep'], params={'n_clusters': n_clusters},
+             stage='kmeans'),
+        Node('kmeans_pca', km.project_pca, ['kmeans_scaled'], stage='kmeans'),
+        Node('kmeans_scatter', km.scatter_data, ['kmeans_pca', 'kmeans_fit'], stage='kmeans'),
+        Node('kmeans_summary', km.summarize_clusters, ['kmeans_features', 'kmeans_fit'], stage='kmeans'),
+        Node('kmeans', km.assemble_results, ['kmeans_elbow', 'kmeans_scatter', 'kmeans_summary'], stage='kmeans'),
+        # 带聚类标签的数据只在写出中间数据时需要，数据量大，不缓存
+        Node('kmeans_clustered', km.attach_clusters, ['clean', 'kmeans_fit'], cache=False)
+    ]
+
+
+def _heatmap_nodes(params):
+    # clean -> 透视表 -> 热力图数据
+    import draw_heatmap
+
+    return [
+        Node('heatmap_pivot', draw_heatmap.build_pivot, ['clean'], stage='heatmap'),
+        Node('heatmap', draw_heatmap.assemble_results, ['heatmap_pivot'], stage='heatmap')
+    ]
+
+
+def _summarize_kmeans(result):
+    return {
+        "kmeans_results": {
+            "cluster_stats": result["cluster_stats"],
+            "cluster_profiles": result["cluster_profiles"]
+        }
+    }
+
+
+def _summarize_heatmap(result):
+    return {
+        "heatmap_results": {
+            "behavior_stats": result.get("behavior_stats"),
+            "top_behaviors": result.get("top_behaviors"),
+            "error": result.get("error")
+        }
+    }
+
+
+def _summarize_funnel(result):
+    return {
+        "funnel_results": {
+            "funnel_data": result["funnel_data"]
+        }
+    }
+
+
+def _summarize_rfm(result):
+    return {
+        "rfm_results": {
+            "user_count": result.get("user_count"),
+            # value_counts 的计数为 numpy 整数，转换后才能写入JSON
+            "segments": {str(label): int(count) for label, count in (result.get("segments") or {}).items()},
+            "error": result.get("error")
+        }
+    }
+
+
+def _summarize_basket(result):
+    support = result.get("support_threshold")
+    return {
+        "basket_results": {
+            "rule_count": result.get("rule_count"),
+            "support_threshold": float(support) if support is not None else None,
+            "confidence_threshold": result.get("confidence_threshold"),
+            "frequent_itemsets_count": result.get("frequent_itemsets_count"),
+            "top_rules": result.get("top_rules"),
+            "error": result.get("error")
+        }
+    }
+
+
+def _summarize_association(result):
+    return {
+        "association_results": {
+            "rules_count": result.get("rules_count"),
+            "top_rules": result.get("top_rules"),
+            "error": result.get("error")
+        }
+    }
+
+
+# 阶段名 -> 阶段定义（按执行和展示顺序排列）
+STAGES = {
+    stage.name: stage for stage in [
+        AnalysisStage(
+            'kmeans', 'K-means用户聚类', 'kmeans_cluster_analysis', 'perform_kmeans_analysis',
+            _summarize_kmeans,
+            # 缺少的特征会以0填充，但至少需要一个行为特征才有意义
+            required_columns=[('page_views', 'add_to_cart', 'purchase', 'use_count',
+                               'days_to_first_use', 'days_since_last_use')],
+            kwargs={'save_data': False},
+            build_nodes=_kmeans_nodes
+        ),
+        AnalysisStage(
+            'heatmap', '用户行为热力图', 'draw_heatmap', 'generate_heatmap', _summarize_heatmap,
+            required_columns=[('年龄',), ('职业',), ('使用频率（次/周）',)],
+            build_nodes=_heatmap_nodes
+        ),
+        AnalysisStage(
+            'funnel', '转化漏斗分析', 'funnel_analysis_funnel_shape', 'analyze_funnel', _summarize_funnel,
+            check='check_funnel_columns'
+        ),
+        AnalysisStage(
+            'rfm', 'RFM用户价值分析', 'rfm_analysis', 'analyze_rfm', _summarize_rfm,
+            required_columns=[('user_id', 'customer_id', 'client_id', 'id'),
+                              ('purchase_date', 'order_date', 'transaction_date', 'date'),
+                              ('purchase_amount', 'amount', 'price', 'sales_amount', 'order_value')]
+        ),
+        AnalysisStage(
+            'basket', '购物篮分析', 'basket_analysis', 'analyze_basket', _summarize_basket,
+            required_columns=[('user_id', 'customer_id', 'client_id', 'id'),
+                              ('product_id', 'item_id', 'sku', 'product_code'),
+                              ('product_name', 'item_name', 'name', 'product')],
+            requires=('mlxtend', 'networkx')
+        ),
+        AnalysisStage(
+            'association', '关联规则分析', 'association_analysis', 'analyze_association',
+            _summarize_association,
+            required_columns=[('product_id', 'product_category'), ('user_id',), ('action_type', 'is_purchase')],
+            requires=('mlxtend', 'networkx')
+        )
+    ]
+}
+
+
+def resolve(analyses=None):
+    """
+    校验并规范化请求的分析列表
+
+    Args:
+        analyses: 分析名列表，None 或空列表表示默认分析
+
+    Returns:
+        list: 去重后按注册顺序排列的分析名（相同的分析组合总是得到相同的列表，便于缓存）
+
+    Raises:
+        ValueError: 包含未注册的分析名
+    """
+    if not analyses:
+        return list(DEFAULT_ANALYSES)
+    unknown = [name for name in analyses if name not in STAGES]
+    if unknown:
+        raise ValueError(f"未知的分析: {', '.join(unknown)}，可选: {', '.join(STAGES)}")
+    return [name for name in STAGES if name in analyses]
@@ -1,6 +1,5 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import networkx as nx
 from mlxtend.frequent_patterns import apriori, association_rules
 from mlxtend.preprocessing import TransactionEncoder
@@ -12,16 +11,19 @@ import base64
 from pathlib import Path
 
 # 导入自定义字体模块
-from embed_font import setup_chinese_font, get_font_prop
+from embed_font import get_font_prop
+from data_loader import load_data
+import charts
 
-def perform_association_analysis(data_path, output_dir):
-    # 使用统一的字体设置
-    font_prop = setup_chinese_font()
-    
-    print(f"关联规则分析使用字体: {plt.rcParams['font.family']}")
+def analyze_association(data, output_dir):
+    """
+    基于用户对商品的行为挖掘关联规则，规则表写入输出目录
 
-    # 读取清洗后的数据
-    df = pd.read_csv(data_path)
+    Returns:
+        dict: 分析结果，charts 为各图表的图表数据；出错时只包含 error
+    """
+    # 读取清洗后的数据（文件路径或内存中的DataFrame）
+    df = load_data(data)
     
     # 为了进行关联规则分析，我们需要将数据转换为交易记录的格式
     # 假设我们要基于产品观看、添加到购物车和购买操作来发现规则
@@ -143,13 +145,11 @@ def perform_association_analysis(data_path, output_dir):
         simplified_rules['antecedents'] = simplified_rules['antecedents'].apply(format_itemset)
         simplified_rules['consequents'] = simplified_rules['consequents'].apply(format_itemset)
         
-        # 生成关联规则的网络图 - 适合中文显示
-        plt.figure(figsize=(12, 10), facecolor='white')
-        
+        # 关联规则的网络图 - 只使用顶部规则以避免过度拥挤
         # 创建一个有向图
         G = nx.DiGraph()
         
-        # 将规则添加到图中 - 只使用顶部规则以避免过度拥挤
+        # 将规则添加到图中
         top_rules = rules.sort_values('lift', ascending=False).head(15)
         
         # 为每个规则添加节点和边
@@ -168,65 +168,33 @@ def perform_association_analysis(data_path, output_dir):
                     G.add_edge(a_item, c_item, weight=row['lift'], 
                               confidence=row['confidence'], support=row['support'])
         
-        # 设置节点位置
-        pos = nx.spring_layout(G, k=0.15, iterations=50)
-        
-        # 绘制节点
-        nx.draw_networkx_nodes(G, pos, node_color='skyblue', node_size=2000, alpha=0.8)
-        
-        # 绘制边，边的粗细表示提升度
-        for u, v, data in G.edges(data=True):
-            width = data['weight'] * 1.0  # 根据提升度调整边的宽度
-            nx.draw_networkx_edges(G, pos, edgelist=[(u, v)], width=width, alpha=0.7, 
-                                  edge_color='navy', arrows=True, arrowsize=20)
-        
-        # 添加节点标签 - 使用指定的中文字体
-        nx.draw_networkx_labels(G, pos, font_size=10, font_color='black', font_family=plt.rcParams['font.family'], font_weight='bold')
-        
-        # 添加标题
-        plt.title("商品关联规则网络图", fontproperties=font_prop, fontsize=16)
-        
-        # 保存图形
-        network_image_path = os.path.join(output_dir, 'association_network.png')
-        plt.axis('off')  # 关闭坐标轴
-        plt.tight_layout()
-        plt.savefig(network_image_path, dpi=300, bbox_inches='tight', format='png')
-        plt.close()
-        
-        # 创建气泡图，展示关联规则的支持度、置信度和提升度
-        plt.figure(figsize=(12, 8), facecolor='white')
-        
-        # 使用散点图展示规则，大小表示支持度，颜色表示提升度
-        scatter = plt.scatter(rules['support'], rules['confidence'], 
-                            s=rules['lift']*1000, # 将提升度转换为适当的点大小
-                            alpha=0.6, 
-                            c=rules['lift'], # 使用提升度作为颜色
-                            cmap='viridis') 
-        
-        # 添加颜色条，显示提升度
-        plt.colorbar(scatter, label='提升度 (Lift)')
-        
-        # 添加标题和轴标签 - 使用指定的中文字体
-        plt.title('关联规则气泡图', fontproperties=font_prop, fontsize=16)
-        plt.xlabel('支持度 (Support)', fontproperties=font_prop, fontsize=14)
-        plt.ylabel('置信度 (Confidence)', fontproperties=font_prop, fontsize=14)
-        
-        # 添加网格线
-        plt.grid(True, linestyle='--', alpha=0.7)
+        # 设置节点位置（固定随机种子，相同数据得到相同的布局）
+        pos = nx.spring_layout(G, k=0.15, iterations=50, seed=42)
+        network_chart = {
+            'nodes': [{'id': node, 'x': float(pos[node][0]), 'y': float(pos[node][1])} for node in G.nodes()],
+            'edges': [
+                {'source': u, 'target': v, 'lift': float(edge['weight']),
+                 'confidence': float(edge['confidence']), 'support': float(edge['support'])}
+                for u, v, edge in G.edges(data=True)
+            ]
+        }
         
-        # 保存气泡图
-        bubble_image_path = os.path.join(output_dir, 'association_bubble.png')
-        plt.tight_layout()
-        plt.savefig(bubble_image_path, dpi=300, bbox_inches='tight', format='png')
-        plt.close()
+        # 气泡图：展示关联规则的支持度、置信度和提升度
+        bubble_chart = {
+            'support': charts.compact(rules['support']),
+            'confidence': charts.compact(rules['confidence']),
+            'lift': charts.compact(rules['lift'])
+        }
         
         # 返回分析结果
         return {
             'rules_path': rules_path,
-            'network_image': network_image_path,
-            'bubble_image': bubble_image_path,
             'rules_count': len(rules),
-            'top_rules': simplified_rules.head(10).to_dict('records')
+            'top_rules': simplified_rules.head(10).to_dict('records'),
+            'charts': {
+                'association_network': network_chart,
+                'association_bubble': bubble_chart
+            }
         }
     
     except Exception as e:
@@ -235,4 +203,69 @@ def perform_association_analysis(data_path, output_dir):
         traceback.print_exc()
         return {
             'error': f"分析过程中发生错误: {str(e)}"
-        } 
\ No newline at end of file
+        } 
+
+
+def draw_network(data):
+    """绘制商品关联规则网络图（节点位置由图表数据给出）"""
+    font_prop = get_font_prop()
+    fig = charts.new_figure((12, 10))
+    ax = fig.add_subplot()
+    
+    G = nx.DiGraph()
+    for node in data['nodes']:
+        G.add_node(node['id'])
+    for edge in data['edges']:
+        G.add_edge(edge['source'], edge['target'], weight=edge['lift'])
+    pos = {node['id']: (node['x'], node['y']) for node in data['nodes']}
+    
+    # 绘制节点
+    nx.draw_networkx_nodes(G, pos, node_color='skyblue', node_size=2000, alpha=0.8, ax=ax)
+    
+    # 绘制边，边的粗细表示提升度
+    for u, v, edge in G.edges(data=True):
+        width = edge['weight'] * 1.0  # 根据提升度调整边的宽度
+        nx.draw_networkx_edges(G, pos, edgelist=[(u, v)], width=width, alpha=0.7, 
+                              edge_color='navy', arrows=True, arrowsize=20, ax=ax)
+    
+    # 添加节点标签 - 使用指定的中文字体
+    nx.draw_networkx_labels(G, pos, font_size=10, font_color='black', font_family=mpl.rcParams['font.family'], font_weight='bold', ax=ax)
+    
+    # 添加标题
+    ax.set_title("商品关联规则网络图", fontproperties=font_prop, fontsize=16)
+    ax.axis('off')  # 关闭坐标轴
+    fig.tight_layout()
+    return fig
+
+
+def draw_bubble(data):
+    """绘制关联规则气泡图：横轴为支持度，纵轴为置信度，大小和颜色表示提升度"""
+    font_prop = get_font_prop()
+    fig = charts.new_figure((12, 8))
+    ax = fig.add_subplot()
+    lift = np.asarray(data['lift'], dtype=float)
+    
+    # 使用散点图展示规则，大小表示支持度，颜色表示提升度
+    scatter = ax.scatter(data['support'], data['confidence'], 
+                        s=lift*1000, # 将提升度转换为适当的点大小
+                        alpha=0.6, 
+                        c=lift, # 使用提升度作为颜色
+                        cmap='viridis') 
+    
+    # 添加颜色条，显示提升度
+    fig.colorbar(scatter, ax=ax, label='提升度 (Lift)')
+    
+    # 添加标题和轴标签 - 使用指定的中文字体
+    ax.set_title('关联规则气泡图', fontproperties=font_prop, fontsize=16)
+    ax.set_xlabel('支持度 (Support)', fontproperties=font_prop, fontsize=14)
+    ax.set_ylabel('置信度 (Confidence)', fontproperties=font_prop, fontsize=14)
+    
+    # 添加网格线
+    ax.grid(True, linestyle='--', alpha=0.7)
+    fig.tight_layout()
+    return fig
+
+
+def perform_association_analysis(data, output_dir):
+    """执行关联规则分析并把图表保存到输出目录"""
+    return charts.write_charts(analyze_association(data, output_dir), output_dir)
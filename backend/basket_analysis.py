@@ -1,6 +1,5 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import seaborn as sns
 from mlxtend.frequent_patterns import apriori, association_rules
 from mlxtend.preprocessing import TransactionEncoder
@@ -11,16 +10,19 @@ import matplotlib as mpl
 from collections import Counter
 
 # 导入自定义字体模块
-from embed_font import setup_chinese_font, get_font_prop
+from embed_font import get_font_prop
+from data_loader import load_data
+import charts
 
-def perform_basket_analysis(data_path, output_dir, min_support=0.01, min_threshold=0.5):
-    # 使用统一的字体设置
-    font_prop = setup_chinese_font()
-    
-    print(f"购物篮分析使用字体: {plt.rcParams['font.family']}")
-    
-    # 读取清洗后的数据
-    df = pd.read_csv(data_path)
+def analyze_basket(data, output_dir, min_support=0.01, min_threshold=0.5):
+    """
+    挖掘经常一起购买的商品组合，规则表写入输出目录
+
+    Returns:
+        dict: 分析结果，charts 为各图表的图表数据；出错时只包含 error
+    """
+    # 读取清洗后的数据（文件路径或内存中的DataFrame）
+    df = load_data(data)
     
     # 检查必要的列是否存在
     required_columns = ['user_id', 'product_id', 'product_name']
@@ -53,8 +55,8 @@ def perform_basket_analysis(data_path, output_dir, min_support=0.01, min_thresho
         print(f"数据量较大 ({len(df)} 行)，随机抽样 100,000 行进行分析")
         df = df.sample(n=100000, random_state=42)
     
-    # 按用户分组创建购物篮
-    baskets = df.groupby(['user_id', 'product_name'])['product_id'].count().unstack().reset_index().fillna(0)
+    # 按用户分组创建购物篮（product_name 可能读取为 category，只保留实际出现的商品）
+    baskets = df.groupby(['user_id', 'product_name'], observed=True)['product_id'].count().unstack().reset_index().fillna(0)
     baskets = baskets.drop('user_id', axis=1)
     
     # 检查产品数量，如果太多，只保留最受欢迎的产品
@@ -63,11 +65,11 @@ def perform_basket_analysis(data_path, output_dir, min_support=0.01, min_thresho
         product_counts = df['product_name'].value_counts().head(100).index.tolist()
         mask = df['product_name'].isin(product_counts)
         df_filtered = df[mask]
-        baskets = df_filtered.groupby(['user_id', 'product_name'])['product_id'].count().unstack().reset_index().fillna(0)
+        baskets = df_filtered.groupby(['user_id', 'product_name'], observed=True)['product_id'].count().unstack().reset_index().fillna(0)
         baskets = baskets.drop('user_id', axis=1)
     
     # 将数据转换为二进制格式（购买 = 1，未购买 = 0）
-    basket_sets = baskets.applymap(lambda x: 1 if x > 0 else 0)
+    basket_sets = (baskets > 0).astype(int)
     
     # 检查数据是否足够
     if basket_sets.shape[0] < 10 or basket_sets.shape[1] < 2:
@@ -118,57 +120,27 @@ def perform_basket_analysis(data_path, output_dir, min_support=0.01, min_thresho
     rules_path = os.path.join(output_dir, 'basket_rules.csv')
     rules.to_csv(rules_path, index=False)
     
-    # 分析规则的支持度、置信度和提升度分布
-    plt.figure(figsize=(18, 6), facecolor='white')
-    
-    # 支持度分布
-    plt.subplot(1, 3, 1)
-    sns.histplot(rules['support'], kde=True, color='skyblue')
-    plt.title('支持度分布', fontproperties=font_prop, fontsize=14)
-    plt.xlabel('支持度', fontproperties=font_prop, fontsize=12)
-    plt.ylabel('频率', fontproperties=font_prop, fontsize=12)
-    
-    # 置信度分布
-    plt.subplot(1, 3, 2)
-    sns.histplot(rules['confidence'], kde=True, color='lightgreen')
-    plt.title('置信度分布', fontproperties=font_prop, fontsize=14)
-    plt.xlabel('置信度', fontproperties=font_prop, fontsize=12)
-    plt.ylabel('频率', fontproperties=font_prop, fontsize=12)
-    
-    # 提升度分布
-    plt.subplot(1, 3, 3)
-    sns.histplot(rules['lift'], kde=True, color='salmon')
-    plt.title('提升度分布', fontproperties=font_prop, fontsize=14)
-    plt.xlabel('提升度', fontproperties=font_prop, fontsize=12)
-    plt.ylabel('频率', fontproperties=font_prop, fontsize=12)
-    
-    plt.tight_layout()
-    metrics_image_path = os.path.join(output_dir, 'basket_metrics_distribution.png')
-    plt.savefig(metrics_image_path, dpi=300, bbox_inches='tight', format='png')
-    plt.close()
-    
-    # 散点图：支持度vs提升度，点大小表示置信度
-    plt.figure(figsize=(10, 8), facecolor='white')
-    plt.scatter(rules['support'], rules['lift'], alpha=0.5, s=rules['confidence']*100, c='skyblue')
-    plt.title('关联规则分布：支持度、提升度和置信度', fontproperties=font_prop, fontsize=14)
-    plt.xlabel('支持度', fontproperties=font_prop, fontsize=12)
-    plt.ylabel('提升度', fontproperties=font_prop, fontsize=12)
-    plt.grid(True, linestyle='--', alpha=0.7)
-    
-    # 添加标注
-    for i, row in rules.sort_values('lift', ascending=False).head(5).iterrows():
-        plt.annotate(
-            f"{row['antecedents']} -> {row['consequents']}",
-            xy=(row['support'], row['lift']),
-            xytext=(5, 5),
-            textcoords='offset points',
-            fontproperties=font_prop,
-            fontsize=8
-        )
+    # 规则的支持度、置信度和提升度分布
+    metrics_chart = {
+        'support': charts.histogram(rules['support']),
+        'confidence': charts.histogram(rules['confidence']),
+        'lift': charts.histogram(rules['lift'])
+    }
     
-    scatter_image_path = os.path.join(output_dir, 'basket_scatter.png')
-    plt.savefig(scatter_image_path, dpi=300, bbox_inches='tight', format='png')
-    plt.close()
+    # 散点图：支持度vs提升度，点大小表示置信度，标注提升度最高的5条规则
+    scatter_chart = {
+        'support': charts.compact(rules['support']),
+        'lift': charts.compact(rules['lift']),
+        'confidence': charts.compact(rules['confidence']),
+        'annotations': [
+            {
+                'label': f"{row['antecedents']} -> {row['consequents']}",
+                'support': float(row['support']),
+                'lift': float(row['lift'])
+            }
+            for _, row in rules.sort_values('lift', ascending=False).head(5).iterrows()
+        ]
+    }
     
     # 创建网络图表示关联规则
     import networkx as nx
@@ -192,32 +164,12 @@ def perform_basket_analysis(data_path, output_dir, min_support=0.01, min_thresho
         # 添加边，权重为提升度
         G.add_edge(antecedent, consequent, weight=row['lift'], confidence=row['confidence'])
     
-    # 创建图形
-    plt.figure(figsize=(12, 10), facecolor='white')
-    
-    # 使用spring布局
-    pos = nx.spring_layout(G)
-    
-    # 根据提升度计算边的宽度
-    edge_widths = [G[u][v]['weight'] / 2 for u, v in G.edges()]
-    
-    # 绘制节点和边
-    nx.draw_networkx_nodes(G, pos, node_size=1500, node_color='lightblue', alpha=0.8)
-    nx.draw_networkx_edges(G, pos, width=edge_widths, edge_color='gray', alpha=0.6)
-    
-    # 添加节点标签
-    labels = {node: node for node in G.nodes()}
-    nx.draw_networkx_labels(G, pos, labels=labels, font_size=8, font_family=plt.rcParams['font.family'])
-    
-    # 添加边标签（显示提升度）
-    edge_labels = {(u, v): f"{G[u][v]['weight']:.2f}" for u, v in G.edges()}
-    nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, font_size=8, font_family=plt.rcParams['font.family'])
-    
-    plt.title('产品关联网络图 (Top 15)', fontproperties=font_prop, fontsize=16)
-    plt.axis('off')
-    network_image_path = os.path.join(output_dir, 'basket_network.png')
-    plt.savefig(network_image_path, dpi=300, bbox_inches='tight', format='png')
-    plt.close()
+    # 使用spring布局（固定随机种子，相同数据得到相同的布局）
+    pos = nx.spring_layout(G, seed=42)
+    network_chart = {
+        'nodes': [{'id': node, 'x': float(pos[node][0]), 'y': float(pos[node][1])} for node in G.nodes()],
+        'edges': [{'source': u, 'target': v, 'lift': float(G[u][v]['weight'])} for u, v in G.edges()]
+    }
     
     # 计算每个产品在关联规则中的出现频率
     product_occurrences = Counter()
@@ -234,27 +186,11 @@ def perform_basket_analysis(data_path, output_dir, min_support=0.01, min_thresho
             product_occurrences[product] += 1
     
     # 选择出现频率最高的10个产品
-    top_products = pd.DataFrame(product_occurrences.most_common(10), columns=['product', 'frequency'])
-    
-    # 产品频率柱状图
-    plt.figure(figsize=(12, 8), facecolor='white')
-    bars = plt.bar(top_products['product'], top_products['frequency'], color=sns.color_palette('pastel'))
-    plt.title('关联规则中最常出现的产品', fontproperties=font_prop, fontsize=14)
-    plt.xlabel('产品', fontproperties=font_prop, fontsize=12)
-    plt.ylabel('出现频率', fontproperties=font_prop, fontsize=12)
-    plt.xticks(rotation=45, ha='right', fontproperties=font_prop)
-    plt.tight_layout()
-    
-    # 添加数值标签
-    for bar in bars:
-        height = bar.get_height()
-        plt.text(bar.get_x() + bar.get_width()/2., height + 0.1,
-                 f'{height}',
-                 ha='center', va='bottom', fontproperties=font_prop, fontsize=10)
-    
-    top_products_image_path = os.path.join(output_dir, 'basket_top_products.png')
-    plt.savefig(top_products_image_path, dpi=300, bbox_inches='tight', format='png')
-    plt.close()
+    top_products = product_occurrences.most_common(10)
+    top_products_chart = {
+        'products': [product for product, _ in top_products],
+        'frequency': [count for _, count in top_products]
+    }
     
     # 创建热图显示项目之间的共现关系
     # 选择最常出现的前15个产品
@@ -278,33 +214,155 @@ def perform_basket_analysis(data_path, output_dir, min_support=0.01, min_thresho
                 if p1 != p2:  # 避免自我关联
                     cooccurrence_matrix.loc[p1, p2] += 1
     
-    # 创建热图
-    plt.figure(figsize=(12, 10), facecolor='white')
-    mask = np.triu(np.ones_like(cooccurrence_matrix, dtype=bool))  # 创建上三角掩码
-    
-    sns.heatmap(cooccurrence_matrix, annot=True, fmt='d', cmap='YlGnBu', 
-                linewidths=0.5, mask=mask, cbar_kws={'label': '共现次数'})
-    
-    plt.title('产品共现热图', fontproperties=font_prop, fontsize=16)
-    plt.xticks(rotation=45, ha='right', fontproperties=font_prop)
-    plt.yticks(fontproperties=font_prop)
-    plt.tight_layout()
-    
-    cooccurrence_image_path = os.path.join(output_dir, 'basket_cooccurrence.png')
-    plt.savefig(cooccurrence_image_path, dpi=300, bbox_inches='tight', format='png')
-    plt.close()
+    cooccurrence_chart = {
+        'labels': most_common_products,
+        'matrix': [charts.compact(row) for row in cooccurrence_matrix.to_numpy()]
+    }
     
     # 返回分析结果
     return {
         'rules_path': rules_path,
-        'metrics_image': metrics_image_path,
-        'scatter_image': scatter_image_path,
-        'network_image': network_image_path,
-        'top_products_image': top_products_image_path,
-        'cooccurrence_image': cooccurrence_image_path,
         'rule_count': len(rules),
         'support_threshold': adjusted_min_support,
         'confidence_threshold': min_threshold,
         'frequent_itemsets_count': len(frequent_itemsets),
-        'top_rules': rules.sort_values('lift', ascending=False).head(5)[['antecedents', 'consequents', 'lift', 'confidence']].to_dict('records')
-    } 
\ No newline at end of file
+        'top_rules': rules.sort_values('lift', ascending=False).head(5)[['antecedents', 'consequents', 'lift', 'confidence']].to_dict('records'),
+        'charts': {
+            'basket_metrics': metrics_chart,
+            'basket_scatter': scatter_chart,
+            'basket_network': network_chart,
+            'basket_top_products': top_products_chart,
+            'basket_cooccurrence': cooccurrence_chart
+        }
+    }
+
+
+def draw_metrics(data):
+    """绘制规则的支持度、置信度和提升度分布"""
+    font_prop = get_font_prop()
+    fig = charts.new_figure((18, 6))
+    
+    panels = [
+        ('support', 'skyblue', '支持度分布', '支持度'),          # 支持度分布
+        ('confidence', 'lightgreen', '置信度分布', '置信度'),    # 置信度分布
+        ('lift', 'salmon', '提升度分布', '提升度')               # 提升度分布
+    ]
+    for i, (key, color, title, xlabel) in enumerate(panels):
+        ax = fig.add_subplot(1, 3, i + 1)
+        charts.draw_histogram(ax, data[key], color)
+        ax.set_title(title, fontproperties=font_prop, fontsize=14)
+        ax.set_xlabel(xlabel, fontproperties=font_prop, fontsize=12)
+        ax.set_ylabel('频率', fontproperties=font_prop, fontsize=12)
+    
+    fig.tight_layout()
+    return fig
+
+
+def draw_scatter(data):
+    """绘制支持度-提升度散点图，点大小表示置信度"""
+    font_prop = get_font_prop()
+    fig = charts.new_figure((10, 8))
+    ax = fig.add_subplot()
+    ax.scatter(data['support'], data['lift'], alpha=0.5, s=np.asarray(data['confidence'], dtype=float)*100, c='skyblue')
+    ax.set_title('关联规则分布：支持度、提升度和置信度', fontproperties=font_prop, fontsize=14)
+    ax.set_xlabel('支持度', fontproperties=font_prop, fontsize=12)
+    ax.set_ylabel('提升度', fontproperties=font_prop, fontsize=12)
+    ax.grid(True, linestyle='--', alpha=0.7)
+    
+    # 添加标注
+    for annotation in data['annotations']:
+        ax.annotate(
+            annotation['label'],
+            xy=(annotation['support'], annotation['lift']),
+            xytext=(5, 5),
+            textcoords='offset points',
+            fontproperties=font_prop,
+            fontsize=8
+        )
+    return fig
+
+
+def draw_network(data):
+    """绘制产品关联网络图（节点位置由图表数据给出）"""
+    import networkx as nx
+    
+    font_prop = get_font_prop()
+    G = nx.DiGraph()
+    for node in data['nodes']:
+        G.add_node(node['id'])
+    for edge in data['edges']:
+        G.add_edge(edge['source'], edge['target'], weight=edge['lift'])
+    pos = {node['id']: (node['x'], node['y']) for node in data['nodes']}
+    
+    # 创建图形
+    fig = charts.new_figure((12, 10))
+    ax = fig.add_subplot()
+    
+    # 根据提升度计算边的宽度
+    edge_widths = [G[u][v]['weight'] / 2 for u, v in G.edges()]
+    
+    # 绘制节点和边
+    nx.draw_networkx_nodes(G, pos, node_size=1500, node_color='lightblue', alpha=0.8, ax=ax)
+    nx.draw_networkx_edges(G, pos, width=edge_widths, edge_color='gray', alpha=0.6, ax=ax)
+    
+    # 添加节点标签
+    labels = {node: node for node in G.nodes()}
+    nx.draw_networkx_labels(G, pos, labels=labels, font_size=8, font_family=mpl.rcParams['font.family'], ax=ax)
+    
+    # 添加边标签（显示提升度）
+    edge_labels = {(u, v): f"{G[u][v]['weight']:.2f}" for u, v in G.edges()}
+    nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, font_size=8,
+                                 font_family=mpl.rcParams['font.family'], ax=ax)
+    
+    ax.set_title('产品关联网络图 (Top 15)', fontproperties=font_prop, fontsize=16)
+    ax.axis('off')
+    return fig
+
+
+def draw_top_products(data):
+    """绘制关联规则中最常出现的产品柱状图"""
+    font_prop = get_font_prop()
+    fig = charts.new_figure((12, 8))
+    ax = fig.add_subplot()
+    bars = ax.bar(data['products'], data['frequency'], color=sns.color_palette('pastel'))
+    ax.set_title('关联规则中最常出现的产品', fontproperties=font_prop, fontsize=14)
+    ax.set_xlabel('产品', fontproperties=font_prop, fontsize=12)
+    ax.set_ylabel('出现频率', fontproperties=font_prop, fontsize=12)
+    for label in ax.get_xticklabels():
+        label.set(rotation=45, ha='right', fontproperties=font_prop)
+    fig.tight_layout()
+    
+    # 添加数值标签
+    for bar in bars:
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width()/2., height + 0.1,
+                f'{int(height)}',
+                ha='center', va='bottom', fontproperties=font_prop, fontsize=10)
+    return fig
+
+
+def draw_cooccurrence(data):
+    """绘制产品共现热图"""
+    font_prop = get_font_prop()
+    cooccurrence_matrix = pd.DataFrame(data['matrix'], index=data['labels'], columns=data['labels'])
+    
+    # 创建热图
+    fig = charts.new_figure((12, 10))
+    ax = fig.add_subplot()
+    mask = np.triu(np.ones_like(cooccurrence_matrix, dtype=bool))  # 创建上三角掩码
+    
+    sns.heatmap(cooccurrence_matrix, annot=True, fmt='d', cmap='YlGnBu', 
+                linewidths=0.5, mask=mask, cbar_kws={'label': '共现次数'}, ax=ax)
+    
+    ax.set_title('产品共现热图', fontproperties=font_prop, fontsize=16)
+    for label in ax.get_xticklabels():
+        label.set(rotation=45, ha='right', fontproperties=font_prop)
+    for label in ax.get_yticklabels():
+        label.set_fontproperties(font_prop)
+    fig.tight_layout()
+    return fig
+
+
+def perform_basket_analysis(data, output_dir, min_support=0.01, min_threshold=0.5):
+    """执行购物篮分析并把图表保存到输出目录"""
+    return charts.write_charts(analyze_basket(data, output_dir, min_support, min_threshold), output_dir)
@@ -0,0 +1,5 @@
+"""
+性能基准测试
+generators 为每种分析输入生成可复现的模拟营销数据，run 按数据规模分档对各分析函数计时，
+结果保存为JSON，便于在不同提交之间对比
+"""
@@ -0,0 +1,180 @@
+"""
+模拟营销数据生成器
+每种分析需要的输入格式对应一个生成器，相同的 (行数, 随机种子) 总是生成相同的数据：
+  user_behavior  用户行为数据（K-means、热力图、漏斗图、数据清洗），与上传的用户数据列一致，包含脏数据
+  transactions   交易记录（RFM分析）：user_id, purchase_date, purchase_amount
+  baskets        购物篮记录（购物篮分析）：user_id, product_id, product_name
+  action_logs    用户行为日志（关联规则分析）：user_id, product_id, action_type
+数据分块生成并追加写入CSV，生成千万行以上的数据也不会占用过多内存
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+# 每块生成的行数
+CHUNK_ROWS = 1_000_000
+
+OCCUPATIONS = ['初中生', '大学生', '高中生', '教师', '教培机构人员', '公务员', '运营人员', '产品经理',
+               '销售经理', '设计师', '程序员', '自由职业']
+OCCUPATION_WEIGHTS = [0.24, 0.22, 0.2, 0.07, 0.07, 0.04, 0.03, 0.03, 0.03, 0.03, 0.02, 0.02]
+MAIN_TIMES = ['17:00-19:00', '9:00-11:00', '20:00-21:30', '15:00-17:00', '20:30-22:00', '19:00-21:00']
+TIME_RANGES = ['19:00-22:00', '18:00-21:00', '07:00-09:00', '20:00-23:00', '18:00-20:00', '12:00-14:00',
+               '20:00-22:00']
+# 脏数据中出现的异常取值
+DIRTY_TIME_RANGES = ['午午午', '随机时间', '时间裂缝']
+DIRTY_OCCUPATIONS = ['夜猫分析师']
+
+PRODUCTS = ['手机', '耳机', '充电器', '手机壳', '平板', '键盘', '鼠标', '显示器', '笔记本', '音箱',
+            '智能手表', '移动电源', '数据线', '路由器', '摄像头', '打印机', 'U盘', '硬盘', '台灯', '背包']
+ACTION_TYPES = ['浏览', '收藏', '加购', '购买']
+ACTION_WEIGHTS = [0.6, 0.1, 0.2, 0.1]
+
+
+def _rng(seed, chunk_index):
+    # 每一块使用独立的随机序列，分块大小不影响生成结果的可复现性
+    return np.random.default_rng([seed, chunk_index])
+
+
+def user_behavior(rows, seed=0, start=0, dirty_ratio=0.1):
+    """
+    生成用户行为数据
+
+    Args:
+        rows: 行数
+        seed: 随机种子
+        start: 起始行号（用于分块生成，user_id 从 start + 1 开始）
+        dirty_ratio: 脏数据比例
+    """
+    rng = _rng(seed, start // CHUNK_ROWS)
+    add_to_cart = (rng.random(rows) < 0.4).astype(np.int64)
+    purchase = add_to_cart * (rng.random(rows) < 0.4)
+    df = pd.DataFrame({
+        'user_id': np.arange(start + 1, start + rows + 1, dtype=np.float64),
+        'page_views': np.ones(rows, dtype=np.int64),
+        'add_to_cart': add_to_cart,
+        'purchase': purchase.astype(np.int64),
+        'use_count': (purchase * (rng.random(rows) < 0.9)).astype(np.int64),
+        'days_to_first_use': rng.integers(0, 8, rows).astype(np.float64),
+        'days_since_last_use': rng.gamma(1.8, 80, rows).round(),
+        '年龄': rng.integers(12, 60, rows),
+        '职业': rng.choice(OCCUPATIONS, rows, p=OCCUPATION_WEIGHTS),
+        '性别': rng.choice(['女', '男'], rows),
+        '使用频率（次/周）': rng.integers(1, 11, rows),
+        '主要使用时间': rng.choice(MAIN_TIMES, rows),
+        '使用时间段': rng.choice(TIME_RANGES, rows),
+        '是否脏数据': '否'
+    })
+
+    # 脏数据：异常年龄、异常使用频率、无意义的时间段和缺失值
+    dirty = rng.random(rows) < dirty_ratio
+    count = int(dirty.sum())
+    if count:
+        df.loc[dirty, '是否脏数据'] = '是'
+        df.loc[dirty, '年龄'] = rng.choice([-10, 0, 150, 200], count)
+        df.loc[dirty, '使用频率（次/周）'] = rng.choice([0, 50, 99], count)
+        df.loc[dirty, '使用时间段'] = rng.choice(DIRTY_TIME_RANGES, count)
+        df.loc[dirty, '职业'] = rng.choice(OCCUPATIONS + DIRTY_OCCUPATIONS, count)
+        for column in ['user_id', 'days_to_first_use', 'days_since_last_use', '性别', '主要使用时间']:
+            missing = dirty & (rng.random(rows) < 0.5)
+            df.loc[missing, column] = np.nan
+    return df
+
+
+def transactions(rows, seed=0, start=0, users=None):
+    """
+    生成交易记录
+
+    Args:
+        rows: 行数
+        seed: 随机种子
+        start: 起始行号（用于分块生成）
+        users: 用户数，默认约为行数的五分之一
+    """
+    rng = _rng(seed, start // CHUNK_ROWS)
+    users = users or max(rows // 5, 10)
+    end = pd.Timestamp('2024-12-31')
+    days = rng.integers(0, 365, rows)
+    return pd.DataFrame({
+        # 少数用户贡献大部分交易
+        'user_id': (rng.zipf(1.5, rows) % users) + 1,
+        'purchase_date': (end - pd.to_timedelta(days, unit='D')).strftime('%Y-%m-%d'),
+        'purchase_amount': rng.lognormal(4, 1, rows).round(2)
+    })
+
+
+def baskets(rows, seed=0, start=0, users=None):
+    """
+    生成购物篮记录
+
+    Args:
+        rows: 行数
+        seed: 随机种子
+        start: 起始行号（用于分块生成）
+        users: 用户数，默认约为行数的四分之一
+    """
+    rng = _rng(seed, start // CHUNK_ROWS)
+    users = users or max(rows // 4, 10)
+    # 热门商品被购买的概率更高
+    weights = 1 / np.arange(1, len(PRODUCTS) + 1)
+    product_index = rng.choice(len(PRODUCTS), rows, p=weights / weights.sum())
+    return pd.DataFrame({
+        'user_id': rng.integers(1, users + 1, rows),
+        'product_id': product_index + 1001,
+        'product_name': np.array(PRODUCTS)[product_index]
+    })
+
+
+def action_logs(rows, seed=0, start=0, users=None):
+    """
+    生成用户行为日志
+
+    Args:
+        rows: 行数
+        seed: 随机种子
+        start: 起始行号（用于分块生成）
+        users: 用户数，默认约为行数的五分之一
+    """
+    rng = _rng(seed, start // CHUNK_ROWS)
+    users = users or max(rows // 5, 10)
+    return pd.DataFrame({
+        'user_id': rng.integers(1, users + 1, rows),
+        'product_id': rng.integers(1001, 1001 + len(PRODUCTS), rows),
+        'action_type': rng.choice(ACTION_TYPES, rows, p=ACTION_WEIGHTS)
+    })
+
+
+# 数据格式名 -> 生成函数
+GENERATORS = {
+    'user_behavior': user_behavior,
+    'transactions': transactions,
+    'baskets': baskets,
+    'action_logs': action_logs
+}
+
+
+def generate(schema, rows, seed=0):
+    """一次性生成指定格式的 DataFrame（适合较小的数据量）"""
+    return pd.concat(
+        [GENERATORS[schema](min(CHUNK_ROWS, rows - start), seed=seed, start=start)
+         for start in range(0, rows, CHUNK_ROWS)],
+        ignore_index=True
+    )
+
+
+def write_csv(schema, rows, path, seed=0):
+    """
+    分块生成数据并写入CSV，文件已存在时直接返回
+
+    Returns:
+        str: CSV文件路径
+    """
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    for start in range(0, rows, CHUNK_ROWS):
+        chunk = GENERATORS[schema](min(CHUNK_ROWS, rows - start), seed=seed, start=start)
+        chunk.to_csv(tmp_path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,135 @@
+"""
+峰值内存预算检查
+在固定的输入规模下执行每个分析，用 tracemalloc 记录分析过程中的峰值分配，
+超过 memory_budgets.json 中配置的预算时以非零退出码结束，用于在上线前发现内存回归。
+
+用法（在 backend 目录下执行）：
+    python -m benchmarks.memory                    # 按预算文件检查
+    python -m benchmarks.memory --analyses kmeans  # 只检查部分分析
+    python -m benchmarks.memory --update           # 以本次测量值（加余量）重写预算
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+from benchmarks.run import ANALYSES, BENCH_DIR, git_commit, ensure_dataset, run_in_subprocess
+
+BUDGET_FILE = os.path.join(BENCH_DIR, 'memory_budgets.json')
+
+# 使用 --update 重写预算时在测量值基础上预留的余量，以及预算下限（MB），避免小预算因库版本差异误报
+UPDATE_HEADROOM = 1.25
+MIN_BUDGET_MB = 8
+
+MB = 1024 * 1024
+
+
+def load_budgets(path=BUDGET_FILE):
+    """
+    读取预算文件
+
+    Returns:
+        dict: rows（输入行数）、seed（随机种子）、budgets_mb（分析名 -> 峰值分配预算，单位MB）
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def check_budgets(config, analyses=None, scale=1.0, timeout=1800):
+    """
+    执行分析并与预算比较
+
+    Args:
+        config: load_budgets 返回的配置
+        analyses: 要检查的分析名，默认检查预算文件中的全部分析
+        scale: 预算倍数，可以临时放宽或收紧预算
+        timeout: 单个分析的超时时间（秒）
+
+    Returns:
+        list: 每个分析的检查结果，status 为 pass / over_budget / missing_dependency / error / no_budget
+    """
+    rows, seed = config['rows'], config.get('seed', 0)
+    results = []
+    for analysis in analyses or list(config['budgets_mb']):
+        budget_mb = config['budgets_mb'].get(analysis)
+        schema = ANALYSES[analysis][2]
+        path = ensure_dataset(schema, rows, seed)
+        print(f"测量 {analysis}（{rows} 行）...")
+        case = run_in_subprocess(analysis, path, timeout, trace_memory=True)
+
+        peak = case.get('peak_traced_bytes')
+        item = {
+            'analysis': analysis,
+            'rows': rows,
+            'peak_mb': round(peak / MB, 1) if peak is not None else None,
+            'peak_rss_mb': round(case['peak_rss_bytes'] / MB, 1) if case.get('peak_rss_bytes') else None,
+            'budget_mb': round(budget_mb * scale, 1) if budget_mb is not None else None,
+            'wall_seconds': case.get('wall_seconds')
+        }
+        if peak is None:
+            error = case.get('error') or ''
+            # 缺少可选依赖（如 mlxtend、networkx）时无法测量，有预算的分析因此视为失败，需要安装依赖后再检查
+            item['status'] = 'missing_dependency' if 'ModuleNotFoundError' in error else 'error'
+            item['error'] = error
+        elif budget_mb is None:
+            item['status'] = 'no_budget'
+        else:
+            item['status'] = 'pass' if peak <= budget_mb * scale * MB else 'over_budget'
+        print(f"  {item['status']}  峰值 {item['peak_mb']} MB / 预算 {item['budget_mb']} MB")
+        results.append(item)
+    return results
+
+
+def update_budgets(config, results, path=BUDGET_FILE):
+    """以测量到的峰值加余量重写预算文件（只更新测量成功的分析）"""
+    for item in results:
+        if item['peak_mb'] is not None:
+            config['budgets_mb'][item['analysis']] = max(MIN_BUDGET_MB, round(item['peak_mb'] * UPDATE_HEADROOM))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+    print(f"预算已更新: {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="分析函数峰值内存预算检查")
+    parser.add_argument('--budgets', default=BUDGET_FILE, help="预算文件路径")
+    parser.add_argument('--analyses', help=f"要检查的分析，逗号分隔：{', '.join(ANALYSES)}")
+    parser.add_argument('--rows', type=int, help="覆盖预算文件中的输入行数（预算不会随之缩放）")
+    parser.add_argument('--scale', type=float, default=float(os.environ.get('MEMORY_BUDGET_SCALE', 1.0)),
+                        help="预算倍数，也可以通过环境变量 MEMORY_BUDGET_SCALE 设置")
+    parser.add_argument('--timeout', type=int, default=1800, help="单个分析的超时时间（秒）")
+    parser.add_argument('--output', help="把检查结果保存为JSON")
+    parser.add_argument('--update', action='store_true', help="以本次测量值（加余量）重写预算文件")
+    args = parser.parse_args(argv)
+
+    config = load_budgets(args.budgets)
+    if args.rows:
+        config['rows'] = args.rows
+    analyses = args.analyses.split(',') if args.analyses else None
+    unknown = [name for name in analyses or [] if name not in ANALYSES]
+    if unknown:
+        parser.error(f"未知的分析: {', '.join(unknown)}")
+
+    results = check_budgets(config, analyses, scale=args.scale, timeout=args.timeout)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'commit': git_commit(),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'scale': args.scale,
+                'results': results
+            }, f, ensure_ascii=False, indent=2)
+    if args.update:
+        update_budgets(config, results, args.budgets)
+        return 0
+
+    failures = [item for item in results if item['status'] in ('over_budget', 'missing_dependency', 'error')]
+    for item in failures:
+        print(f"[失败] {item['analysis']}: {item['status']} {item.get('error') or ''}".rstrip())
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
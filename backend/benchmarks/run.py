@@ -0,0 +1,241 @@
+"""
+基准测试运行器
+按数据规模分档生成模拟数据，对各分析函数计时，结果保存为JSON。
+每个 (分析, 规模) 组合在独立的子进程中执行，峰值内存互不影响，超时的组合会被终止。
+
+用法（在 backend 目录下执行）：
+    python -m benchmarks.run --tiers 10k,100k,1m
+    python -m benchmarks.run --tiers 50m --analyses clean_data,kmeans --timeout 3600
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+
+from benchmarks import generators
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+# 生成的数据缓存目录和结果输出目录
+DATA_DIR = os.path.join(BENCH_DIR, 'data')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+# 预设的数据规模
+TIERS = {
+    'small': 10_000,
+    'medium': 100_000,
+    'large': 1_000_000,
+    'xlarge': 10_000_000,
+    'huge': 50_000_000
+}
+DEFAULT_TIERS = ['small', 'medium']
+
+# 分析名 -> (模块, 函数, 输入数据格式, 额外参数)
+ANALYSES = {
+    'clean_data': ('clean_data', 'clean_data', 'user_behavior', {}),
+    'kmeans': ('kmeans_cluster_analysis', 'perform_kmeans_analysis', 'user_behavior', {}),
+    'heatmap': ('draw_heatmap', 'generate_heatmap', 'user_behavior', {}),
+    'funnel': ('funnel_analysis_funnel_shape', 'generate_funnel', 'user_behavior', {}),
+    'rfm': ('rfm_analysis', 'perform_rfm_analysis', 'transactions', {}),
+    'basket': ('basket_analysis', 'perform_basket_analysis', 'baskets', {}),
+    'association': ('association_analysis', 'perform_association_analysis', 'action_logs', {})
+}
+
+
+def parse_rows(value):
+    """解析规模：预设名（small/medium/...）或带 k/m 后缀的行数（10k、1m、50m）"""
+    value = value.strip().lower()
+    if value in TIERS:
+        return TIERS[value]
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(value[-1:], 1)
+    digits = value[:-1] if multiplier > 1 else value
+    return int(float(digits) * multiplier)
+
+
+def dataset_path(schema, rows, seed):
+    return os.path.join(DATA_DIR, f"{schema}_{rows}_{seed}.csv")
+
+
+def ensure_dataset(schema, rows, seed=0):
+    """返回指定格式和规模的数据文件路径，不存在时先生成"""
+    path = dataset_path(schema, rows, seed)
+    if not os.path.exists(path):
+        print(f"生成 {schema} 数据: {rows} 行")
+        generators.write_csv(schema, rows, path, seed=seed)
+    return path
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_case(analysis, input_path, output_dir, trace_memory=False):
+    """
+    在当前进程中执行一次分析并计时（由子进程调用）
+
+    Args:
+        analysis: 分析名
+        input_path: 输入CSV路径
+        output_dir: 分析结果输出目录
+        trace_memory: 是否用 tracemalloc 记录分析过程中的峰值分配（会明显拖慢执行，
+            且先预热执行一次，耗时不包含一次性的初始化）
+
+    Returns:
+        dict: 耗时、CPU时间、峰值内存、分析函数是否返回错误以及各步骤指标
+    """
+    import importlib
+    import metrics
+    from stage_executor import init_worker
+
+    # 与分析工作进程相同的初始化，模块导入不计入耗时
+    init_worker()
+    module_name, func_name, _, kwargs = ANALYSES[analysis]
+    func = getattr(importlib.import_module(module_name), func_name)
+
+    def call(target_dir):
+        if analysis == 'clean_data':
+            func(input_path, os.path.join(target_dir, 'cleaned_data.csv'))
+            return None
+        result = func(input_path, target_dir, **kwargs)
+        return result.get('error') if isinstance(result, dict) else None
+
+    if trace_memory:
+        import tracemalloc
+        # 先完整执行一次（不记录）：分析函数内延迟导入的库、matplotlib 配置和字体、渲染线程等
+        # 一次性的初始化都在这里完成，记录的是复用的工作进程中一次分析的分配
+        warm_dir = tempfile.mkdtemp(dir=output_dir)
+        try:
+            call(warm_dir)
+        finally:
+            shutil.rmtree(warm_dir, ignore_errors=True)
+    metrics.drain()
+    if trace_memory:
+        tracemalloc.start()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    error = call(output_dir)
+    wall_seconds = time.perf_counter() - wall_start
+    cpu_seconds = time.process_time() - cpu_start
+    peak_traced = None
+    if trace_memory:
+        _, peak_traced = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        'status': 'error' if error else 'ok',
+        'error': error,
+        'wall_seconds': round(wall_seconds, 4),
+        'cpu_seconds': round(cpu_seconds, 4),
+        # 每个用例在单独的子进程中执行，进程的高水位即该用例的峰值
+        'peak_rss_bytes': metrics.max_rss_bytes(),
+        # 分析过程中 Python 和 numpy/pandas 分配的峰值内存（不含解释器、已导入模块和预热时完成的初始化）
+        'peak_traced_bytes': peak_traced,
+        'steps': metrics.drain()
+    }
+
+
+def run_in_subprocess(analysis, input_path, timeout, trace_memory=False):
+    """在独立子进程中执行一次分析，返回 run_case 的结果"""
+    output_dir = tempfile.mkdtemp(prefix=f'bench_{analysis}_')
+    command = [sys.executable, '-m', 'benchmarks.run', '--case', analysis, '--input', input_path,
+               '--output-dir', output_dir]
+    if trace_memory:
+        command.append('--trace-memory')
+    try:
+        proc = subprocess.run(
+            command,
+            cwd=BACKEND_DIR, capture_output=True, text=True, timeout=timeout
+        )
+    except subprocess.TimeoutExpired:
+        return {'status': 'timeout', 'error': f"超过 {timeout} 秒未完成"}
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    # 子进程最后一行输出为JSON结果，之前的输出是分析函数的日志
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        stderr = proc.stderr.strip().splitlines()
+        return {'status': 'failed', 'error': stderr[-1] if stderr else f"退出码 {proc.returncode}"}
+    return json.loads(lines[-1])
+
+
+def run_benchmarks(tiers, analyses, seed=0, timeout=1800):
+    """
+    按规模分档执行基准测试
+
+    Args:
+        tiers: 规模列表（预设名或行数）
+        analyses: 分析名列表
+        seed: 数据生成的随机种子
+        timeout: 单个组合的超时时间（秒）
+
+    Returns:
+        dict: 运行环境信息和每个 (分析, 规模) 组合的结果
+    """
+    results = []
+    for tier in tiers:
+        rows = parse_rows(str(tier))
+        for analysis in analyses:
+            schema = ANALYSES[analysis][2]
+            path = ensure_dataset(schema, rows, seed)
+            print(f"运行 {analysis}（{rows} 行）...")
+            case = run_in_subprocess(analysis, path, timeout)
+            case.update({'analysis': analysis, 'tier': str(tier), 'rows': rows, 'schema': schema})
+            print(f"  {case['status']}  {case.get('wall_seconds', '-')}s")
+            results.append(case)
+
+    return {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+        'results': results
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="营销数据分析基准测试")
+    parser.add_argument('--tiers', default=','.join(DEFAULT_TIERS),
+                        help=f"数据规模，逗号分隔，可用预设 {', '.join(TIERS)} 或 10k/1m 等行数")
+    parser.add_argument('--analyses', default='all', help=f"要测试的分析，逗号分隔：{', '.join(ANALYSES)}")
+    parser.add_argument('--seed', type=int, default=0, help="数据生成的随机种子")
+    parser.add_argument('--timeout', type=int, default=1800, help="单个组合的超时时间（秒）")
+    parser.add_argument('--output', help="结果JSON路径，默认保存到 benchmarks/results/")
+    # 以下参数由运行器内部使用：在子进程中执行单个组合
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    parser.add_argument('--input', help=argparse.SUPPRESS)
+    parser.add_argument('--output-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--trace-memory', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        result = run_case(args.case, args.input, args.output_dir, trace_memory=args.trace_memory)
+        print(json.dumps(result, ensure_ascii=False))
+        return 0
+
+    analyses = list(ANALYSES) if args.analyses == 'all' else args.analyses.split(',')
+    unknown = [name for name in analyses if name not in ANALYSES]
+    if unknown:
+        parser.error(f"未知的分析: {', '.join(unknown)}")
+
+    report = run_benchmarks(args.tiers.split(','), analyses, seed=args.seed, timeout=args.timeout)
+    output = args.output or os.path.join(RESULTS_DIR, f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,316 @@
+"""
+图表注册表
+每个分析先计算出绘图所需的数据（图表数据，紧凑的JSON），再由各模块的 draw_* 函数据此绘制图片。
+分析流程只把图表数据写入会话目录，图片在第一次请求时才按所需的分辨率渲染（见 render_cache.py）；
+/analyze?render=data 时结果中同时返回图表数据，由前端自行绘制。
+draw_* 函数在 new_figure() 创建的独立 Figure（Agg画布）上绘图，不使用 pyplot 的全局状态，
+多个图表可以在线程中同时渲染。本模块只登记图表，matplotlib 在第一次渲染时才导入
+"""
+import io
+import os
+import json
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# 图表的输出模式
+RENDER_PNG = 'png'
+RENDER_DATA = 'data'
+RENDER_MODES = (RENDER_PNG, RENDER_DATA)
+
+# 渲染PNG使用的分辨率
+DEFAULT_DPI = 300
+
+# 图表数据中浮点数保留的有效位数
+FLOAT_DIGITS = 4
+
+# 单独调用分析函数时同时渲染图表的线程数
+RENDER_THREADS = int(os.environ.get('CHART_RENDER_THREADS', 4))
+
+# 散点图最多绘制的点数，超过时按聚类分层抽样，并附上全部数据的密度网格
+SCATTER_MAX_POINTS = int(os.environ.get('CHART_SCATTER_MAX_POINTS', 20000))
+# 密度网格每个方向的分箱数
+DENSITY_BINS = 100
+# 计算核密度估计时每次处理的样本数，限制 曲线点数 x 样本数 的中间数组大小
+KDE_CHUNK = 4096
+
+
+class Chart:
+    """
+    一个图表
+
+    Args:
+        key: 图表名，也是 image_urls / charts 中的键
+        file_name: 渲染后的图片文件名
+        module: 绘图函数所在模块
+        draw: 绘图函数名 draw(data)，把图表数据绘制在新建的 Figure 上并返回该 Figure
+        result_key: 单独调用分析函数（perform_*）时结果中图片路径的键
+    """
+
+    def __init__(self, key, file_name, module, draw, result_key):
+        self.key = key
+        self.file_name = file_name
+        self.module = module
+        self.draw = draw
+        self.result_key = result_key
+
+
+# 图表名 -> 图表定义，按分析阶段分组
+STAGE_CHARTS = {
+    'kmeans': [
+        Chart('kmeans_elbow', 'kmeans_elbow.png', 'kmeans_cluster_analysis', 'draw_elbow', 'elbow_image'),
+        Chart('kmeans_clusters', 'kmeans_clusters.png', 'kmeans_cluster_analysis', 'draw_clusters',
+              'cluster_image')
+    ],
+    'heatmap': [
+        Chart('heatmap', 'user_behavior_heatmap.png', 'draw_heatmap', 'draw_heatmap', 'heatmap_image')
+    ],
+    'funnel': [
+        Chart('funnel', 'conversion_funnel.png', 'funnel_analysis_funnel_shape', 'draw_funnel', 'funnel_image')
+    ],
+    'rfm': [
+        Chart('rfm_distribution', 'rfm_distribution.png', 'rfm_analysis', 'draw_distribution',
+              'distribution_image'),
+        Chart('rfm_segments', 'rfm_segments.png', 'rfm_analysis', 'draw_segments', 'segment_image'),
+        Chart('rfm_elbow', 'rfm_elbow.png', 'rfm_analysis', 'draw_elbow', 'elbow_image'),
+        Chart('rfm_clusters', 'rfm_clusters_3d.png', 'rfm_analysis', 'draw_clusters', 'cluster_image'),
+        Chart('rfm_business_segments', 'rfm_business_segments.png', 'rfm_analysis', 'draw_business_segments',
+              'business_segment_image'),
+        Chart('rfm_radar', 'rfm_radar.png', 'rfm_analysis', 'draw_radar', 'radar_image')
+    ],
+    'basket': [
+        Chart('basket_metrics', 'basket_metrics_distribution.png', 'basket_analysis', 'draw_metrics',
+              'metrics_image'),
+        Chart('basket_scatter', 'basket_scatter.png', 'basket_analysis', 'draw_scatter', 'scatter_image'),
+        Chart('basket_network', 'basket_network.png', 'basket_analysis', 'draw_network', 'network_image'),
+        Chart('basket_top_products', 'basket_top_products.png', 'basket_analysis', 'draw_top_products',
+              'top_products_image'),
+        Chart('basket_cooccurrence', 'basket_cooccurrence.png', 'basket_analysis', 'draw_cooccurrence',
+              'cooccurrence_image')
+    ],
+    'association': [
+        Chart('association_network', 'association_network.png', 'association_analysis', 'draw_network',
+              'network_image'),
+        Chart('association_bubble', 'association_bubble.png', 'association_analysis', 'draw_bubble',
+              'bubble_image')
+    ]
+}
+
+CHARTS = {chart.key: chart for charts in STAGE_CHARTS.values() for chart in charts}
+# 图片文件名 -> 图表定义
+FILES = {chart.file_name: chart for chart in CHARTS.values()}
+
+
+def compact(values, digits=FLOAT_DIGITS):
+    """
+    把数值序列转换为JSON友好的列表：浮点数保留有效位数，NaN 转换为 None
+
+    Args:
+        values: 列表、numpy数组或 Series
+    """
+    result = []
+    for value in list(values):
+        if value is None:
+            result.append(None)
+        elif isinstance(value, (bool, int)) or (hasattr(value, 'dtype') and value.dtype.kind in 'biu'):
+            result.append(int(value))
+        else:
+            value = float(value)
+            result.append(None if value != value else float(f"{value:.{digits}g}"))
+    return result
+
+
+def histogram(values, kde_points=200):
+    """
+    计算直方图和核密度估计曲线（与 seaborn.histplot(kde=True) 使用相同的分箱和带宽规则）
+
+    Returns:
+        dict: edges 为分箱边界，counts 为各箱计数，kde_x / kde_y 为按计数缩放后的密度曲线
+    """
+    import numpy as np
+
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return {'edges': [], 'counts': [], 'kde_x': [], 'kde_y': []}
+    counts, edges = np.histogram(values, bins='auto')
+    kde_x, kde_y = [], []
+    if len(values) > 1 and values.std() > 0:
+        # histplot 的密度曲线只画在数据范围内
+        kde_x = np.linspace(values.min(), values.max(), kde_points)
+        # 密度乘以样本数和箱宽，与计数在同一尺度上
+        kde_y = gaussian_kde(values, kde_x) * len(values) * (edges[1] - edges[0])
+    return {
+        'edges': compact(edges),
+        'counts': compact(counts),
+        'kde_x': compact(kde_x),
+        'kde_y': compact(kde_y)
+    }
+
+
+def gaussian_kde(values, points):
+    """
+    一维高斯核密度估计，带宽按 Scott 规则（与 scipy.stats.gaussian_kde 的默认设置相同）。
+    按 KDE_CHUNK 分块累加，不导入 scipy，也不创建 曲线点数 x 样本数 的完整矩阵
+
+    Args:
+        values: 样本（不含 NaN 的 numpy 数组）
+        points: 要计算密度的位置
+
+    Returns:
+        ndarray: 各位置的概率密度
+    """
+    import numpy as np
+
+    bandwidth = values.std(ddof=1) * len(values) ** -0.2
+    density = np.zeros(len(points))
+    for start in range(0, len(values), KDE_CHUNK):
+        z = (points[:, None] - values[None, start:start + KDE_CHUNK]) / bandwidth
+        density += np.exp(-0.5 * z * z).sum(axis=1)
+    return density / (len(values) * bandwidth * np.sqrt(2 * np.pi))
+
+
+def stratified_sample(labels, max_points=SCATTER_MAX_POINTS, seed=42):
+    """
+    按聚类分层抽样：每个聚类按相同比例抽取，至少保留一个点，固定随机种子使相同数据得到相同的图表数据
+
+    Args:
+        labels: 每个点的聚类标签
+        max_points: 最多保留的点数
+
+    Returns:
+        tuple: (按原顺序排列的抽样下标, 抽样比例)；点数未超过上限时返回 (None, 1.0)
+    """
+    import numpy as np
+
+    labels = np.asarray(labels)
+    if max_points <= 0 or len(labels) <= max_points:
+        return None, 1.0
+    fraction = max_points / len(labels)
+    rng = np.random.default_rng(seed)
+    indices = []
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        size = max(1, int(round(len(members) * fraction)))
+        indices.append(rng.choice(members, size=size, replace=False))
+    return np.sort(np.concatenate(indices)), fraction
+
+
+def density_grid(x, y, bins=DENSITY_BINS):
+    """
+    全部点的二维密度网格（计数），用于在抽样散点下绘制整体分布
+
+    Returns:
+        dict: x_edges / y_edges 为分箱边界，counts[i][j] 为第 i 行（y方向）第 j 列（x方向）的点数
+    """
+    import numpy as np
+
+    counts, x_edges, y_edges = np.histogram2d(np.asarray(x, dtype=float), np.asarray(y, dtype=float), bins=bins)
+    return {
+        'x_edges': compact(x_edges),
+        'y_edges': compact(y_edges),
+        'counts': counts.T.astype(int).tolist()
+    }
+
+
+def sample_note(sample):
+    """抽样散点图的说明文字"""
+    return f"抽样显示 {sample['fraction']:.1%} 的用户（共 {sample['total']} 人）"
+
+
+def new_figure(figsize):
+    """
+    创建一个不属于 pyplot 的 Figure，绑定独立的Agg画布
+
+    Args:
+        figsize: 图形尺寸（英寸）
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=figsize, facecolor='white')
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def draw_histogram(ax, data, color):
+    """在坐标轴上绘制 histogram() 计算的直方图和密度曲线"""
+    import numpy as np
+
+    edges = np.asarray(data['edges'], dtype=float)
+    if len(edges) > 1:
+        ax.bar(edges[:-1], data['counts'], width=np.diff(edges), align='edge', color=color, alpha=0.5,
+               edgecolor='white')
+    if data['kde_x']:
+        ax.plot(data['kde_x'], data['kde_y'], color=color, linewidth=2)
+
+
+def render_chart(data, chart, dpi=DEFAULT_DPI):
+    """
+    把图表数据渲染为PNG，可以在多个线程中同时调用
+
+    Args:
+        data: 图表数据，None 表示该图表没有生成（例如分析出错）
+        chart: 图表名
+        dpi: 分辨率
+
+    Returns:
+        bytes: PNG内容，没有图表数据时返回 None
+    """
+    if data is None:
+        return None
+    from embed_font import get_font_prop
+
+    # 第一次渲染时设置 matplotlib 的全局配置并加载字体，之后只读
+    get_font_prop()
+    spec = CHARTS[chart]
+    fig = getattr(importlib.import_module(spec.module), spec.draw)(data)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, dpi=dpi, bbox_inches='tight', format='png', facecolor='white')
+    return buffer.getvalue()
+
+
+def data_file_name(chart):
+    """图表数据在会话目录中的文件名"""
+    return f"{chart}.chart.json"
+
+
+def write_chart_data(session_dir, chart_data):
+    """
+    把图表数据写入会话目录，供按需渲染使用
+
+    Args:
+        chart_data: 图表名 -> 图表数据
+    """
+    for key, data in chart_data.items():
+        with open(os.path.join(session_dir, data_file_name(key)), 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+
+
+def write_charts(result, output_dir, dpi=DEFAULT_DPI):
+    """
+    把分析结果中的图表数据渲染为图片写入输出目录（单独调用分析函数时使用），
+    图片路径以 Chart.result_key 记录在结果中
+
+    Returns:
+        dict: 去掉图表数据、加上图片路径后的结果
+    """
+    result = dict(result)
+    chart_data = result.pop('charts', None) or {}
+
+    def render(key):
+        with metrics.step(f"render_{key}"):
+            return render_chart(chart_data[key], key, dpi=dpi)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(RENDER_THREADS, len(chart_data)))) as executor:
+        rendered = dict(zip(chart_data, executor.map(render, chart_data)))
+    for key, content in rendered.items():
+        if content is None:
+            continue
+        spec = CHARTS[key]
+        path = os.path.join(output_dir, spec.file_name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        result[spec.result_key] = path
+    return result
@@ -1,66 +1,315 @@
 import pandas as pd
+import numpy as np
 import os
 
-def clean_data(input_file_path, output_file_path):
+from data_loader import read_csv
+
+# 超过该大小（字节）的文件分块清洗，内存占用与文件大小无关
+CHUNK_THRESHOLD_BYTES = int(os.environ.get('CLEAN_CHUNK_THRESHOLD_BYTES', 512 * 1024 * 1024))
+# 分块清洗时每块的行数
+CHUNK_ROWS = int(os.environ.get('CLEAN_CHUNK_ROWS', 100000))
+
+# 异常值判断使用的标准差倍数
+OUTLIER_SIGMA = 3
+
+def clean_frame(df):
     """
-    根据用户提供的代码执行数据清洗操作
-    
+    对内存中的数据执行清洗操作
+
     Args:
-        input_file_path: 输入文件路径
-        output_file_path: 输出文件路径
-    
+        df: 原始数据 DataFrame
+
     Returns:
-        dict: 包含清洗统计信息的字典
+        tuple: (清洗后的 DataFrame, 包含清洗统计信息的字典)
     """
-    # 1️⃣ 读取数据
-    print(f"正在读取文件: {input_file_path}")
-    df = pd.read_csv(input_file_path)
-    
-    # 2️⃣ 记录原始数据情况
+    # 1️⃣ 记录原始数据情况
     original_rows = len(df)
     print(f"原始数据总行数：{original_rows}")
-    
+
     # 检查是否存在"是否脏数据"列
     if '是否脏数据' in df.columns:
         dirty_rows = df[df['是否脏数据'] == '是'].shape[0]
         print(f"脏数据标记为'是'的行数：{dirty_rows}")
-        
-        # 3️⃣ 清洗数据：删除标记为"是"的脏数据
+
+        # 2️⃣ 清洗数据：删除标记为"是"的脏数据
         df_cleaned = df[df['是否脏数据'] != '是'].copy()
-        
-        # 4️⃣ 删除"是否脏数据"辅助列
+
+        # 3️⃣ 删除"是否脏数据"辅助列
         df_cleaned.drop(columns=['是否脏数据'], inplace=True)
     else:
         print("未找到'是否脏数据'列，将检查空值和异常值进行基本清洗")
         # 执行基本清洗 - 删除所有列均为空的行
         df_cleaned = df.dropna(how='all').copy()
-        
+
         # 对于数值列，将异常值（超过3个标准差）替换为平均值
         numeric_cols = df.select_dtypes(include=['number']).columns
         for col in numeric_cols:
-            mean_val = df[col].mean()
-            std_val = df[col].std()
+            # 读取时缩减过类型的列（int8、float32）按 float64 计算统计量
+            values = df[col].astype(float)
+            mean_val = values.mean()
+            std_val = values.std()
             # 识别异常值
-            outliers = (df[col] > mean_val + 3*std_val) | (df[col] < mean_val - 3*std_val)
-            # 替换异常值
-            df_cleaned.loc[outliers, col] = mean_val
-    
-    # 5️⃣ 保存清洗后的数据
-    # 确保输出目录存在
-    os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
-    df_cleaned.to_csv(output_file_path, index=False)
-    
-    # 打印清洗结果
+            outliers = (values > mean_val + OUTLIER_SIGMA*std_val) | (values < mean_val - OUTLIER_SIGMA*std_val)
+            # 替换异常值（整数列先转换为浮点数，才能写入平均值）
+            if outliers.any():
+                df_cleaned[col] = df_cleaned[col].astype(float)
+                df_cleaned.loc[outliers, col] = mean_val
+
     cleaned_rows = len(df_cleaned)
-    print(f"✅ 清洗完成，结果已保存为：{output_file_path}")
     print(f"清洗后总行数：{cleaned_rows}")
-    
+
     # 返回清洗统计信息
-    stats = {
+    return df_cleaned, _clean_stats(original_rows, cleaned_rows)
+
+def _clean_stats(original_rows, cleaned_rows):
+    return {
         "original_rows": original_rows,
         "cleaned_rows": cleaned_rows,
         "removed_rows": original_rows - cleaned_rows,
         "percent_kept": round((cleaned_rows / original_rows) * 100, 2) if original_rows > 0 else 0
     }
-    
-    return stats 
\ No newline at end of file
+
+
+class RunningStats:
+    """
+    逐块累计一列数值的个数、均值和离差平方和（Welford 算法，按块合并使用 Chan 等人的公式），
+    数值稳定，结果与一次性计算 mean() / std() 一致
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        """合并一块数据（忽略空值）"""
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        count = len(values)
+        mean = values.mean()
+        m2 = ((values - mean) ** 2).sum()
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+    def mean_value(self):
+        return self.mean if self.count > 0 else np.nan
+
+    def std_value(self):
+        """样本标准差（与 pandas 的 std() 相同，自由度为 n-1）"""
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+
+def column_stats(df):
+    """
+    原始数据中各数值列的统计量，用于之后追加的数据判断异常值（见 clean_batch）
+
+    Returns:
+        dict: 数值列 -> RunningStats
+    """
+    stats = {}
+    for col in df.select_dtypes(include=['number']).columns:
+        stats[col] = RunningStats()
+        stats[col].update(df[col])
+    return stats
+
+
+def clean_batch(df, stats):
+    """
+    清洗追加的一批数据，已有的数据不重新清洗
+
+    有"是否脏数据"列时与 clean_frame 相同；否则先把这批数据计入各数值列的累计统计量，
+    再按累计的均值和标准差把这批数据中的异常值替换为累计均值
+
+    Args:
+        df: 新增的原始数据
+        stats: 之前全部数据的 column_stats（原地更新）
+
+    Returns:
+        tuple: (清洗后的 DataFrame, 这批数据的清洗统计)
+    """
+    if '是否脏数据' in df.columns:
+        return clean_frame(df)
+    original_rows = len(df)
+    print(f"追加数据行数：{original_rows}")
+    df_cleaned = df.dropna(how='all').copy()
+    for col, running in stats.items():
+        values = pd.to_numeric(df[col], errors='coerce').astype(float)
+        running.update(values)
+        mean_val, std_val = running.mean_value(), running.std_value()
+        outliers = (values > mean_val + OUTLIER_SIGMA*std_val) | (values < mean_val - OUTLIER_SIGMA*std_val)
+        if outliers.any():
+            df_cleaned[col] = pd.to_numeric(df_cleaned[col], errors='coerce').astype(float)
+            df_cleaned.loc[outliers, col] = mean_val
+    print(f"清洗后行数：{len(df_cleaned)}")
+    return df_cleaned, _clean_stats(original_rows, len(df_cleaned))
+
+
+def _is_number(dtype):
+    # 与 select_dtypes(include=['number']) 一致，布尔列不算数值列
+    return pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+
+
+class ColumnTypes:
+    """
+    逐块确定各列在整个文件中的类型，结果与一次性读取整个文件时 pandas 推断的类型一致：
+    只有每一块都是数值的列才会被解析为数值列，任意一块是浮点数则整列为浮点数，
+    只有每一块都是布尔值的列才是布尔列
+    """
+
+    def __init__(self):
+        self.columns = None
+        self.numeric = set()
+        self.float_columns = set()
+        self.boolean = set()
+
+    def update(self, chunk):
+        """合并一块数据的列类型"""
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+            self.numeric = set(self.columns)
+            self.boolean = set(self.columns)
+        self.numeric &= {col for col in self.columns if _is_number(chunk[col].dtype)}
+        self.float_columns |= {col for col in self.columns if pd.api.types.is_float_dtype(chunk[col].dtype)}
+        self.boolean &= {col for col in self.columns if pd.api.types.is_bool_dtype(chunk[col].dtype)}
+
+    def dtype(self, col):
+        """整列的 pandas 类型名称"""
+        if col in self.numeric:
+            return 'float64' if col in self.float_columns else 'int64'
+        if col in self.boolean:
+            return 'bool'
+        return 'object'
+
+
+def _scan_columns(input_file_path, chunksize, collect_stats=True):
+    """
+    第一遍扫描：确定各列在整个文件中的类型，并累计数值列的统计量
+
+    Args:
+        collect_stats: 是否累计数值列的统计量（只确定类型时不需要）
+
+    Returns:
+        tuple: (列名列表, 总行数, 数值列 -> RunningStats, 需要读取为浮点数的数值列)
+    """
+    types, original_rows, stats = ColumnTypes(), 0, {}
+    for chunk in pd.read_csv(input_file_path, chunksize=chunksize):
+        types.update(chunk)
+        original_rows += len(chunk)
+        for col in types.numeric:
+            column_stats = stats.setdefault(col, RunningStats())
+            if collect_stats:
+                column_stats.update(chunk[col])
+    if types.columns is None:
+        # 空文件：只有表头
+        return list(pd.read_csv(input_file_path, nrows=0).columns), 0, {}, set()
+    stats = {col: stats[col] for col in types.columns if col in types.numeric}
+    return types.columns, original_rows, stats, types.float_columns & types.numeric
+
+
+def clean_data_chunked(input_file_path, output_file_path, chunksize=CHUNK_ROWS):
+    """
+    分块清洗CSV文件，只在内存中保留一块数据，结果与 clean_frame 一致
+
+    先扫描一遍，确定各列在整个文件中的类型（逐块读取时各块推断的类型可能不同），
+    没有"是否脏数据"列时同时累计各数值列的均值和标准差；
+    第二遍按统一的类型逐块读取，删除脏数据（或删除全空行、把超过3个标准差的异常值替换为均值）后追加写出
+
+    Args:
+        input_file_path: 输入文件路径
+        output_file_path: 输出文件路径
+        chunksize: 每块的行数
+
+    Returns:
+        dict: 包含清洗统计信息的字典
+    """
+    header = pd.read_csv(input_file_path, nrows=0)
+    flagged = '是否脏数据' in header.columns
+    bounds = {}
+    if flagged:
+        print("分块清洗：删除标记为'是'的脏数据")
+    else:
+        print("未找到'是否脏数据'列，分块统计数值列后检查空值和异常值")
+    columns, original_rows, stats, float_columns = _scan_columns(input_file_path, chunksize,
+                                                                 collect_stats=not flagged)
+    if not flagged:
+        for col, column_stats in stats.items():
+            mean_val, std_val = column_stats.mean_value(), column_stats.std_value()
+            lower, upper = mean_val - OUTLIER_SIGMA * std_val, mean_val + OUTLIER_SIGMA * std_val
+            # 整个文件中存在异常值的列整列转换为浮点数，与 clean_frame 一致
+            if column_stats.max > upper or column_stats.min < lower:
+                bounds[col] = (lower, upper, mean_val)
+                float_columns.add(col)
+    # 第二遍按整个文件的类型读取：非数值列保持原文，浮点数列在每一块中都是浮点数
+    dtypes = {col: str for col in columns if col not in stats}
+    dtypes.update({col: float for col in float_columns})
+
+    os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+    dirty_rows, cleaned_rows, first = 0, 0, True
+    with open(output_file_path, 'w', encoding='utf-8', newline='') as f:
+        for chunk in pd.read_csv(input_file_path, chunksize=chunksize, dtype=dtypes):
+            if flagged:
+                dirty = chunk['是否脏数据'] == '是'
+                dirty_rows += int(dirty.sum())
+                chunk = chunk[~dirty].drop(columns=['是否脏数据'])
+            else:
+                chunk = chunk.dropna(how='all')
+                for col, (lower, upper, mean_val) in bounds.items():
+                    outliers = (chunk[col] > upper) | (chunk[col] < lower)
+                    chunk.loc[outliers, col] = mean_val
+            cleaned_rows += len(chunk)
+            chunk.to_csv(f, header=first, index=False)
+            first = False
+        if first:
+            # 没有数据行时也写出表头
+            columns = [col for col in header.columns if col != '是否脏数据']
+            pd.DataFrame(columns=columns).to_csv(f, index=False)
+
+    print(f"原始数据总行数：{original_rows}")
+    if flagged:
+        print(f"脏数据标记为'是'的行数：{dirty_rows}")
+    print(f"清洗后总行数：{cleaned_rows}")
+    return _clean_stats(original_rows, cleaned_rows)
+
+
+def clean_data(input_file_path, output_file_path, chunksize=None):
+    """
+    根据用户提供的代码执行数据清洗操作
+
+    Args:
+        input_file_path: 输入文件路径
+        output_file_path: 输出文件路径
+        chunksize: 分块清洗时每块的行数；未指定时超过 CHUNK_THRESHOLD_BYTES 的文件自动按 CHUNK_ROWS 分块
+
+    Returns:
+        dict: 包含清洗统计信息的字典
+    """
+    if chunksize is None and os.path.getsize(input_file_path) > CHUNK_THRESHOLD_BYTES:
+        chunksize = CHUNK_ROWS
+    if chunksize:
+        print(f"正在分块读取文件: {input_file_path}（每块 {chunksize} 行）")
+        stats = clean_data_chunked(input_file_path, output_file_path, chunksize)
+        print(f"✅ 清洗完成，结果已保存为：{output_file_path}")
+        return stats
+
+    # 读取数据
+    print(f"正在读取文件: {input_file_path}")
+    df = read_csv(input_file_path)
+
+    df_cleaned, stats = clean_frame(df)
+
+    # 保存清洗后的数据
+    # 确保输出目录存在
+    os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+    df_cleaned.to_csv(output_file_path, index=False)
+    print(f"✅ 清洗完成，结果已保存为：{output_file_path}")
+
+    return stats
@@ -0,0 +1,149 @@
+"""
+K-means 聚类数选择（肘部法则）
+K-means 分析和 RFM 分析共用：对一组候选聚类数分别拟合，返回各自的惯性值和拟合好的模型。
+  - 各个聚类数在线程池中同时拟合，每个拟合分到一部分 OpenMP 线程，总线程数不超过 KMEANS_SWEEP_THREADS；
+    性能剖析时在当前线程中依次拟合，使 cProfile 能记录到
+  - 样本数超过 KMEANS_MINIBATCH_ROWS 时改用 MiniBatchKMeans
+  - 保留每个聚类数的模型，最终聚类直接使用选定聚类数的模型，不需要重新拟合
+  - 可选地在抽样上计算轮廓系数或 Calinski-Harabasz 指数，按得分自动选择聚类数
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import charts
+import profiling
+
+# 同时拟合的线程总数
+SWEEP_THREADS = int(os.environ.get('KMEANS_SWEEP_THREADS', os.cpu_count() or 1))
+# 样本数超过该值时使用 MiniBatchKMeans，设为0时总是使用 KMeans
+MINIBATCH_ROWS = int(os.environ.get('KMEANS_MINIBATCH_ROWS', 200000))
+# 计算聚类得分时抽样的行数（轮廓系数的计算量与样本数的平方成正比）
+SCORE_SAMPLE_ROWS = int(os.environ.get('KMEANS_SCORE_SAMPLE_ROWS', 10000))
+
+# 可选的聚类得分，都是越大越好
+SCORES = ('silhouette', 'calinski_harabasz')
+SCORE_LABELS = {'silhouette': '轮廓系数', 'calinski_harabasz': 'Calinski-Harabasz 指数'}
+# MiniBatchKMeans 每批的样本数
+MINIBATCH_SIZE = 4096
+
+
+def make_model(n_clusters, n_rows, n_init=10):
+    """
+    创建聚类模型
+
+    Args:
+        n_rows: 样本数，超过 MINIBATCH_ROWS 时使用 MiniBatchKMeans
+        n_init: 以不同初始中心运行的次数，None 时使用 sklearn 的默认值
+    """
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+
+    kwargs = {} if n_init is None else {'n_init': n_init}
+    if MINIBATCH_ROWS and n_rows > MINIBATCH_ROWS:
+        return MiniBatchKMeans(n_clusters=n_clusters, random_state=42, batch_size=MINIBATCH_SIZE,
+                               n_init=3 if n_init is None else min(n_init, 3))
+    return KMeans(n_clusters=n_clusters, random_state=42, **kwargs)
+
+
+def score_labels(X, labels, score):
+    """
+    在抽样上计算聚类得分，聚类数小于2或抽样中只有一个聚类时返回 None
+    """
+    from sklearn.metrics import calinski_harabasz_score, silhouette_score
+
+    if len(X) > SCORE_SAMPLE_ROWS:
+        indices = np.random.default_rng(42).choice(len(X), SCORE_SAMPLE_ROWS, replace=False)
+        X, labels = X[indices], labels[indices]
+    if not 2 <= len(np.unique(labels)) < len(X):
+        return None
+    if score == 'silhouette':
+        return float(silhouette_score(X, labels))
+    return float(calinski_harabasz_score(X, labels))
+
+
+def sweep(X, k_values, n_init=10, score=None):
+    """
+    对每个候选聚类数拟合模型
+
+    Args:
+        X: 标准化后的特征
+        k_values: 候选聚类数（超过样本数的会被忽略）
+        n_init: 见 make_model
+        score: 要计算的聚类得分（SCORES 之一），None 时不计算
+
+    Returns:
+        dict: k、inertia 为各聚类数及其惯性值，models 为聚类数 -> 拟合后的模型，
+            指定 score 时 scores 为各聚类数的得分（聚类数为1时为 None）
+    """
+    from threadpoolctl import threadpool_limits
+
+    k_values = [k for k in k_values if k <= len(X)]
+    # cProfile 只记录当前线程，剖析时不使用线程池
+    workers = 1 if profiling.active() else max(1, min(SWEEP_THREADS, len(k_values)))
+    threads = max(1, SWEEP_THREADS // workers)
+
+    def fit(k):
+        # 每个线程中的 OpenMP 线程数单独设置，几个拟合同时进行时不会超过总线程数
+        with threadpool_limits(limits=threads, user_api='openmp'):
+            return make_model(k, len(X), n_init).fit(X)
+
+    if workers == 1:
+        models = [make_model(k, len(X), n_init).fit(X) for k in k_values]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            models = list(executor.map(fit, k_values))
+    result = {
+        'k': k_values,
+        'inertia': [model.inertia_ for model in models],
+        'models': dict(zip(k_values, models))
+    }
+    if score is not None:
+        result['score'] = score
+        result['scores'] = [score_labels(X, model.labels_, score) for model in models]
+    return result
+
+
+def choose_k(result, n_clusters=None, default=3):
+    """
+    确定最终的聚类数：指定了 n_clusters 时使用它，否则按得分最高的聚类数，没有得分时使用 default
+    """
+    if n_clusters is not None:
+        return n_clusters
+    scored = [(value, k) for k, value in zip(result['k'], result.get('scores') or []) if value is not None]
+    if not scored:
+        return default
+    return max(scored)[1]
+
+
+def final_model(result, X, n_clusters, n_init=10):
+    """选定聚类数的模型：肘部法则中已经拟合过时直接使用，否则单独拟合"""
+    model = result['models'].get(n_clusters)
+    if model is None:
+        model = make_model(n_clusters, len(X), n_init).fit(X)
+    return model
+
+
+def chart_data(result, n_clusters=None, default=3):
+    """
+    肘部法则图的图表数据；计算了聚类得分时同时给出各聚类数的得分和最终选定的聚类数
+    """
+    elbow = {'k': result['k'], 'inertia': charts.compact(result['inertia'])}
+    if 'scores' in result:
+        elbow.update({
+            'score': result['score'],
+            'scores': charts.compact(result['scores']),
+            'selected': choose_k(result, n_clusters, default)
+        })
+    return elbow
+
+
+def draw_scores(ax, elbow, font_prop):
+    """在肘部法则图右侧的坐标轴上绘制各聚类数的得分，并标出选定的聚类数"""
+    points = [(k, value) for k, value in zip(elbow['k'], elbow['scores']) if value is not None]
+    score_ax = ax.twinx()
+    if points:
+        score_ax.plot([k for k, _ in points], [value for _, value in points], 's--', color='#DB4437')
+    score_ax.set_ylabel(SCORE_LABELS.get(elbow['score'], elbow['score']), fontproperties=font_prop, fontsize=12)
+    ax.axvline(elbow['selected'], color='gray', linestyle=':', label=f"选定聚类数 {elbow['selected']}")
+    ax.legend(prop=font_prop)
@@ -0,0 +1,346 @@
+"""
+按依赖关系调度的分析计算图
+每个节点声明输入节点和参数，节点输出以 (节点名, 参数, 输入节点的键, 代码版本) 的哈希为键缓存在磁盘上。
+只计算请求的目标节点及其缓存失效的上游节点：某个参数变化时只有受影响的节点重新计算，
+输出已缓存的节点连它的上游都不需要加载。互不依赖的节点交给阶段进程池并行执行，
+阶段进程池由同一进程中先后执行的各个图共用
+"""
+import os
+import json
+import pickle
+import hashlib
+import threading
+import multiprocessing
+from multiprocessing import util
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import disk_cache
+import metrics
+from stage_executor import STAGE_CONCURRENCY, call_stage, init_worker
+
+NODE_CACHE_DIR = os.environ.get('NODE_CACHE_DIR', os.path.join('cache', 'nodes'))
+# 节点缓存总大小上限（字节），设为0时关闭节点缓存
+NODE_CACHE_MAX_BYTES = int(os.environ.get('NODE_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+# 单个节点输出超过该大小时不缓存（字节）
+NODE_CACHE_MAX_ENTRY_BYTES = int(os.environ.get('NODE_CACHE_MAX_ENTRY_BYTES', 512 * 1024 * 1024))
+
+_evict_lock = threading.Lock()
+
+# 阶段进程使用 forkserver 启动：图在任务进程中执行，此时已有写出结果文件的后台线程，
+# 直接 fork 出的子进程可能继承被这些线程占用的锁；forkserver 预先导入 pandas，新进程不必重新导入
+_context = multiprocessing.get_context('forkserver')
+_context.set_forkserver_preload(['stage_executor', 'pandas'])
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+_finalizer = None
+
+
+def _get_executor(max_workers):
+    """取得共用的阶段进程池，第一次使用或进程数变化时创建"""
+    global _executor, _executor_workers, _finalizer
+    with _executor_lock:
+        if _finalizer is None:
+            # 任务进程退出时会先等待所有子进程结束，进程池需要在此之前关闭，否则任务进程无法退出；
+            # 优先级高于进程池内部队列的清理（10），关闭时队列仍能把结束信号发给阶段进程
+            _finalizer = util.Finalize(None, shutdown, exitpriority=100)
+        if _executor is None or _executor_workers != max_workers:
+            if _executor is not None:
+                _executor.shutdown(wait=True)
+            _executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=_context, initializer=init_worker)
+            _executor_workers = max_workers
+        return _executor
+
+
+def _discard_executor():
+    """阶段进程异常退出后进程池不可再用，丢弃后下次使用时重新创建"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def shutdown():
+    """关闭共用的阶段进程池"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+class Node:
+    """
+    计算图中的一个节点
+
+    Args:
+        name: 节点名，在图中唯一
+        func: 计算函数 func(*输入节点的输出, **params)，需为模块级函数以便在进程池中执行
+        inputs: 输入节点名列表
+        params: 影响输出的参数，参与缓存键的计算
+        stage: 节点所属的分析阶段，用于汇报阶段进度
+        cache: 是否缓存输出（读取文件、列选取等比加载缓存还快的节点不缓存）
+    """
+
+    def __init__(self, name, func, inputs=(), params=None, stage=None, cache=True):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.params = params or {}
+        self.stage = stage
+        self.cache = cache
+
+
+class NodeCache:
+    """节点输出的磁盘缓存，超过总大小上限时按最近访问时间淘汰"""
+
+    def __init__(self, cache_dir=NODE_CACHE_DIR, max_bytes=NODE_CACHE_MAX_BYTES,
+                 max_entry_bytes=NODE_CACHE_MAX_ENTRY_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def contains(self, key):
+        return self.max_bytes > 0 and os.path.exists(self._path(key))
+
+    def load(self, key):
+        """读取缓存的输出，条目不存在或已损坏时抛出 KeyError"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            # 更新访问时间，用于LRU淘汰
+            os.utime(path, None)
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            raise KeyError(key) from e
+        return value
+
+    def store(self, key, value):
+        if self.max_bytes <= 0:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            if os.path.getsize(tmp_path) > self.max_entry_bytes:
+                os.remove(tmp_path)
+                return
+            os.replace(tmp_path, path)
+        except (OSError, pickle.PicklingError, TypeError) as e:
+            print(f"写入节点缓存失败: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.evict()
+
+    def evict(self, max_bytes=None):
+        """
+        淘汰最久未访问的条目，直到总大小不超过上限
+
+        Returns:
+            int: 释放的字节数
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        with _evict_lock:
+            return disk_cache.evict_lru(disk_cache.file_entries(self.cache_dir, '.pkl'), max_bytes)
+
+
+def evict(max_bytes=None):
+    """淘汰默认节点缓存中最久未访问的条目（供后台清理调用）"""
+    return NodeCache().evict(max_bytes)
+
+
+class Graph:
+    """
+    计算图
+    可以多次调用 run 计算不同的目标，已计算或已加载的节点输出在图中保留，供后续调用直接使用
+    """
+
+    def __init__(self, sources, cache=None, max_workers=STAGE_CONCURRENCY, version=''):
+        """
+        Args:
+            sources: 源节点名 -> (值, 内容键)，例如上传文件路径和文件内容哈希
+            cache: NodeCache，None 表示不使用缓存
+            max_workers: 同时执行的节点数上限，为1时在当前进程中顺序执行
+            version: 代码版本，参与所有节点的缓存键
+        """
+        self.nodes = {}
+        self.values = {name: value for name, (value, _) in sources.items()}
+        self.keys = {name: key for name, (_, key) in sources.items()}
+        self.cache = cache
+        self.max_workers = max_workers
+        self.version = version
+        # 本图中重新计算和从缓存加载的节点
+        self.computed = []
+        self.cached = []
+
+    def add(self, *nodes):
+        for node in nodes:
+            self.nodes[node.name] = node
+
+    def key(self, name):
+        """节点的缓存键：由节点名、参数、输入节点的键和代码版本决定"""
+        if name not in self.keys:
+            node = self.nodes[name]
+            payload = json.dumps({
+                'node': name,
+                'params': node.params,
+                'inputs': [self.key(input_name) for input_name in node.inputs],
+                'version': self.version
+            }, sort_keys=True, default=str)
+            self.keys[name] = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+        return self.keys[name]
+
+    def discard(self, *names):
+        """释放图中保留的节点输出（例如只用于清洗的原始数据）"""
+        for name in names:
+            self.values.pop(name, None)
+
+    def _plan(self, targets):
+        """
+        确定需要计算的节点：目标节点及其上游中没有输出可用的节点，输出已缓存的节点不再向上追溯
+
+        Returns:
+            tuple: (按依赖顺序排列的待计算节点, 需要从缓存加载的节点)
+        """
+        to_compute, to_load, visited = [], [], set()
+
+        def visit(name):
+            if name in visited or name in self.values:
+                return
+            visited.add(name)
+            node = self.nodes[name]
+            if self.cache is not None and node.cache and self.cache.contains(self.key(name)):
+                to_load.append(name)
+                return
+            for input_name in node.inputs:
+                visit(input_name)
+            to_compute.append(name)
+
+        for target in targets:
+            visit(target)
+        return to_compute, to_load
+
+    def _finish(self, name, value, progress):
+        self.values[name] = value
+        node = self.nodes[name]
+        if self.cache is not None and node.cache:
+            self.cache.store(self.key(name), value)
+        if progress is not None:
+            progress(node, 'done', value)
+
+    def run(self, targets, progress=None):
+        """
+        计算目标节点
+
+        Args:
+            targets: 目标节点名列表
+            progress: 回调函数 progress(node, state, value)，state 为 running/done/cached
+
+        Returns:
+            dict: 目标节点名 -> 输出；任一节点出错时抛出该节点的异常
+        """
+        to_compute, to_load = self._plan(targets)
+        for name in to_load:
+            try:
+                value = self.cache.load(self.key(name))
+            except KeyError:
+                # 缓存条目刚被淘汰，改为重新计算
+                to_compute.extend(n for n in self._plan_without_cache(name) if n not in to_compute)
+                continue
+            self.values[name] = value
+            self.cached.append(name)
+            if progress is not None:
+                progress(self.nodes[name], 'cached', value)
+        # 补充计算的节点可能排在依赖它的节点之后，按依赖关系重新排序
+        to_compute = self._topological(to_compute)
+
+        pending = list(to_compute)
+        if self.max_workers <= 1:
+            for name in pending:
+                node = self.nodes[name]
+                if progress is not None:
+                    progress(node, 'running', None)
+                self.computed.append(name)
+                value = node.func(*[self.values[input_name] for input_name in node.inputs], **node.params)
+                self._finish(name, value, progress)
+            return {target: self.values[target] for target in targets}
+
+        running = {}
+        try:
+            while pending or running:
+                # 提交所有输入已经就绪的节点
+                for name in [n for n in pending if all(i in self.values for i in self.nodes[n].inputs)]:
+                    node = self.nodes[name]
+                    args = [self.values[input_name] for input_name in node.inputs]
+                    running[_get_executor(self.max_workers).submit(call_stage, node.func, args, node.params)] = name
+                    pending.remove(name)
+                    self.computed.append(name)
+                    if progress is not None:
+                        progress(node, 'running', None)
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    value, records = future.result()
+                    metrics.extend(records)
+                    self._finish(name, value, progress)
+        except BrokenProcessPool:
+            _discard_executor()
+            raise
+        except BaseException:
+            for future in running:
+                future.cancel()
+            raise
+        return {target: self.values[target] for target in targets}
+
+    def _plan_without_cache(self, name):
+        """缓存条目失效时，重新确定计算该节点所需的节点（不再使用缓存）"""
+        cache, self.cache = self.cache, None
+        try:
+            return self._plan([name])[0]
+        finally:
+            self.cache = cache
+
+    def _topological(self, names):
+        ordered, seen = [], set()
+        wanted = set(names)
+
+        def visit(name):
+            if name in seen:
+                return
+            seen.add(name)
+            for input_name in self.nodes[name].inputs:
+                if input_name in wanted:
+                    visit(input_name)
+            ordered.append(name)
+
+        for name in names:
+            visit(name)
+        return ordered
+
+    def close(self):
+        """释放图中保留的节点输出；共用的阶段进程池保留给之后的图使用（见 shutdown）"""
+        self.values.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def file_key(path):
+    """计算文件内容的哈希，作为源节点的键"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,126 @@
+"""
+数据加载工具
+各分析模块统一通过 load_data 获取 DataFrame，既可以传入CSV文件路径，
+也可以直接传入流水线中已解析好的 DataFrame，避免重复读取同一个文件。
+读取CSV时先抽样推断每列的类型：取值重复较多的文本列读取为 category，整数列缩减为能容纳全部取值的最小整数类型，
+只含整数的浮点数列（例如带空值的计数、用户ID）在能精确表示时使用 float32。
+推断出的类型（schema）可以保存在会话目录中，同一会话再次读取时直接使用
+"""
+import os
+import json
+
+import pandas as pd
+import numpy as np
+
+# 推断类型时抽样的行数
+SCHEMA_SAMPLE_ROWS = int(os.environ.get('SCHEMA_SAMPLE_ROWS', 10000))
+# 文本列不同取值的个数不超过非空值个数的该比例时读取为 category
+CATEGORY_MAX_RATIO = 0.5
+# float32 能精确表示的最大整数
+FLOAT32_EXACT_MAX = 2 ** 24
+
+# 会话目录中保存推断类型的文件名
+SCHEMA_FILE = 'schema.json'
+
+
+def load_data(data):
+    """
+    获取待分析的数据
+
+    Args:
+        data: CSV文件路径，或已加载到内存中的 DataFrame
+
+    Returns:
+        DataFrame: 传入 DataFrame 时返回其浅拷贝，分析中新增或替换列不会影响调用方的数据
+    """
+    if isinstance(data, pd.DataFrame):
+        return data.copy(deep=False)
+    return read_csv(data)
+
+
+def _category_columns(sample):
+    """抽样数据中适合读取为 category 的文本列"""
+    columns = []
+    for col in sample.columns:
+        if not pd.api.types.is_string_dtype(sample[col].dtype):
+            continue
+        values = sample[col].dropna()
+        if len(values) > 0 and values.nunique() <= len(values) * CATEGORY_MAX_RATIO:
+            columns.append(col)
+    return columns
+
+
+def downcast(df):
+    """
+    把数值列缩减为能容纳全部取值的最小类型（按整列的实际取值判断，不会溢出）
+
+    Returns:
+        DataFrame: 缩减后的数据（原地修改并返回）
+    """
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_bool_dtype(series.dtype):
+            continue
+        if pd.api.types.is_integer_dtype(series.dtype):
+            df[col] = pd.to_numeric(series, downcast='integer')
+        elif pd.api.types.is_float_dtype(series.dtype) and series.dtype != np.float32:
+            values = series.dropna().to_numpy()
+            # 只有全部为整数且 float32 能精确表示时才缩减，小数保持 float64，计算结果不变
+            if len(values) > 0 and np.all(values == np.round(values)) and np.abs(values).max() <= FLOAT32_EXACT_MAX:
+                df[col] = series.astype(np.float32)
+    return df
+
+
+def infer_schema(df):
+    """
+    记录 DataFrame 各列的类型
+
+    Returns:
+        dict: columns 为列名列表，dtypes 为列名 -> 类型名（可直接作为 read_csv 的 dtype 参数）
+    """
+    return {
+        'columns': [str(col) for col in df.columns],
+        'dtypes': {str(col): str(dtype) for col, dtype in df.dtypes.items()}
+    }
+
+
+def _load_schema(schema_path, path):
+    # 缓存的类型只在列与文件表头一致时使用
+    if not schema_path or not os.path.exists(schema_path):
+        return None
+    try:
+        with open(schema_path, 'r', encoding='utf-8') as f:
+            schema = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"读取类型缓存失败: {e}")
+        return None
+    header = [str(col) for col in pd.read_csv(path, nrows=0).columns]
+    return schema if schema.get('columns') == header else None
+
+
+def read_csv(path, schema_path=None):
+    """
+    按推断的类型读取CSV文件
+
+    Args:
+        path: CSV文件路径
+        schema_path: 类型缓存文件（通常为会话目录中的 schema.json），存在时直接按其中的类型读取，
+            不存在时推断后写入；None 表示不缓存
+
+    Returns:
+        DataFrame: 读取的数据
+    """
+    schema = _load_schema(schema_path, path)
+    if schema is not None:
+        return pd.read_csv(path, dtype=schema['dtypes'])
+
+    sample = pd.read_csv(path, nrows=SCHEMA_SAMPLE_ROWS)
+    categories = _category_columns(sample)
+    # 数值列先按默认类型读取，再根据整列的取值范围缩减
+    df = downcast(pd.read_csv(path, dtype={col: 'category' for col in categories}))
+    if schema_path:
+        tmp_path = f"{schema_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(infer_schema(df), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, schema_path)
+    return df
@@ -0,0 +1,318 @@
+"""
+上传数据概要
+在分析之前查看上传文件各列的类型、空值比例、不同值个数、分位数和最常见的值。
+只分块扫描一遍CSV，内存占用与文件大小无关：
+  - 列类型与 clean_data 分块清洗时的判断一致（见 clean_data.ColumnTypes）
+  - 不同值个数用 HyperLogLog 估计（相对误差约 1%），不同值不多时给出精确值
+  - 数值列的分位数用 t-digest 估计，两端的分位数更准确
+  - 最常见的值用 Misra-Gries 统计，不同值不超过 PROFILE_TOP_CAPACITY 个时是精确计数
+结果按 (上传内容, 代码版本) 缓存在磁盘上，同一文件只计算一次；缓存总大小超过上限时按最近访问时间淘汰（LRU）
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+
+import disk_cache
+import result_cache
+
+PROFILE_CACHE_DIR = os.environ.get('PROFILE_CACHE_DIR', os.path.join('cache', 'profiles'))
+# 概要缓存总大小上限（字节），设为0时每次请求都重新计算
+PROFILE_CACHE_MAX_BYTES = int(os.environ.get('PROFILE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# 每块读取的行数
+PROFILE_CHUNK_ROWS = int(os.environ.get('PROFILE_CHUNK_ROWS', 200000))
+# 每列保留的候选常见值个数，越大越准确，也越占内存
+PROFILE_TOP_CAPACITY = int(os.environ.get('PROFILE_TOP_CAPACITY', 1000))
+
+# 每列返回的常见值个数
+TOP_VALUES = 10
+# 返回的分位数
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+# HyperLogLog 的寄存器个数为 2^HLL_PRECISION，标准误差约为 1.04 / sqrt(2^HLL_PRECISION)
+HLL_PRECISION = 14
+# t-digest 的压缩参数，质心个数约为它的一半
+TDIGEST_COMPRESSION = 500
+
+_evict_lock = threading.Lock()
+
+
+class HyperLogLog:
+    """估计不同值的个数：每个值的64位哈希按高位分到寄存器，寄存器记录剩余位中第一个1出现的最大位置"""
+
+    def __init__(self, precision=HLL_PRECISION):
+        import numpy as np
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update(self, hashes):
+        """合并一批值的64位哈希（uint64 数组）"""
+        import numpy as np
+        bits = 64 - self.precision
+        index = (hashes >> np.uint64(bits)).astype(np.int64)
+        rest = hashes & np.uint64((1 << bits) - 1)
+        # 剩余位不超过53位，转换为浮点数是精确的，frexp 的指数即最高位1的位置
+        _, exponent = np.frexp(rest.astype(float))
+        rank = np.where(rest > 0, bits - exponent + 1, bits + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def estimate(self):
+        import numpy as np
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(float)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # 不同值较少时用线性计数修正
+            return m * np.log(m / zeros)
+        return raw
+
+
+class TDigest:
+    """
+    估计数值的分位数：把排序后的数据合并为带权重的质心，靠近两端的质心更小（k1 尺度函数），
+    每块数据先单独合并为质心，再与已有质心一起重新合并，只需要对每块数据排序一次
+    """
+
+    def __init__(self, compression=TDIGEST_COMPRESSION):
+        import numpy as np
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+
+    def update(self, values):
+        """合并一块数值（已去掉空值）"""
+        import numpy as np
+        values = np.sort(values[np.isfinite(values)])
+        if len(values) == 0:
+            return
+        means, weights = self._compress(values, np.ones(len(values)))
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        order = np.argsort(means, kind='stable')
+        self.means, self.weights = self._compress(means[order], weights[order])
+
+    def _compress(self, means, weights):
+        """合并按均值排序的质心"""
+        import numpy as np
+        cumulative = np.cumsum(weights)
+        q = (cumulative - weights / 2) / cumulative[-1]
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q - 1)
+        # k 尺度上落在同一个单位区间内的相邻质心合并为一个
+        group = np.floor(k - k[0]).astype(np.int64)
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(group)) + 1])
+        merged = np.add.reduceat(weights, starts)
+        return np.add.reduceat(means * weights, starts) / merged, merged
+
+    def quantiles(self, qs, low, high):
+        """
+        按质心中心处的累计权重线性插值
+
+        Args:
+            low, high: 数据的精确最小值和最大值，作为两端的插值点
+        """
+        import numpy as np
+        cumulative = np.cumsum(self.weights)
+        centers = np.concatenate([[0], cumulative - self.weights / 2, [cumulative[-1]]])
+        means = np.concatenate([[low], self.means, [high]])
+        return np.interp(np.asarray(qs) * cumulative[-1], centers, means)
+
+
+class HeavyHitters:
+    """
+    统计最常见的值（可合并的 Misra-Gries 摘要）：候选值超过容量时所有计数减去第 (容量+1) 大的计数，
+    保留的计数是真实次数的下界，误差不超过累计减去的次数 error
+    """
+
+    def __init__(self, capacity=PROFILE_TOP_CAPACITY):
+        self.capacity = capacity
+        self.counts = None
+        self.error = 0
+
+    def update(self, counts):
+        """合并一块数据中各个值的出现次数（value_counts() 的结果）"""
+        # 先把这一块的计数缩减到容量以内再合并，合并时需要对齐的候选值更少
+        counts = self._reduce(counts)
+        if self.counts is not None:
+            counts = self._reduce(self.counts.add(counts, fill_value=0))
+        self.counts = counts
+
+    def _reduce(self, counts):
+        if len(counts) <= self.capacity:
+            return counts
+        threshold = counts.nlargest(self.capacity + 1).iloc[-1]
+        self.error += int(threshold)
+        return counts[counts > threshold] - threshold
+
+    def top(self, n):
+        """
+        最常见的 n 个值；计数不超过误差的候选值可能只是碰巧留下的，不返回
+        """
+        if self.counts is None:
+            return []
+        return [{'value': _json_value(value), 'count': int(count)}
+                for value, count in self.counts.nlargest(n).items() if count > self.error]
+
+
+class ColumnProfile:
+    """一列的所有概要统计量"""
+
+    def __init__(self):
+        from clean_data import RunningStats
+        self.nulls = 0
+        self.distinct = HyperLogLog()
+        self.top = HeavyHitters()
+        self.stats = RunningStats()
+        self.digest = TDigest()
+
+    def update(self, values, numeric):
+        """
+        合并一块数据中的一列
+
+        Args:
+            values: 该列在这一块中的值（pandas Series）
+            numeric: 这一块中该列是否为数值列
+
+        只在部分块中是数值的列（一次性读取时为文本列），数值块和文本块中的同一个值分开计数
+        """
+        import pandas as pd
+        present = values.dropna()
+        self.nulls += len(values) - len(present)
+        if numeric:
+            # 整数和浮点数统一按浮点数计数，不同的块推断为不同的数值类型时结果一致
+            numbers = present.to_numpy(dtype=float)
+            present = pd.Series(numbers)
+            self.stats.update(numbers)
+            self.digest.update(numbers)
+        else:
+            present = present.astype(str)
+        counts = present.value_counts()
+        # 同一块中重复的值只需要计算一次哈希
+        self.distinct.update(pd.util.hash_pandas_object(counts.index.to_series(), index=False).to_numpy())
+        self.top.update(counts)
+
+    def summary(self, name, dtype, rows):
+        count = rows - self.nulls
+        exact = self.top.error == 0
+        distinct = (len(self.top.counts) if self.top.counts is not None else 0) if exact \
+            else min(int(round(self.distinct.estimate())), count)
+        summary = {
+            'name': name,
+            'dtype': dtype,
+            'count': count,
+            'nulls': self.nulls,
+            'null_rate': round(self.nulls / rows, 6) if rows else 0.0,
+            'distinct': distinct,
+            'distinct_exact': exact,
+            'top_values': self.top.top(TOP_VALUES),
+            # 常见值的计数是下界，真实次数最多再多这么多次
+            'top_values_error': self.top.error,
+        }
+        # 某一块中出现非数值的列在一次性读取时是文本列，不返回数值统计量
+        if dtype in ('int64', 'float64') and self.stats.count > 0:
+            low, high = float(self.stats.min), float(self.stats.max)
+            summary.update({
+                'min': _json_value(low),
+                'max': _json_value(high),
+                'mean': _json_value(self.stats.mean_value()),
+                'std': _json_value(self.stats.std_value()),
+                'quantiles': {f"p{round(q * 100)}": _json_value(value) for q, value in
+                              zip(QUANTILES, self.digest.quantiles(QUANTILES, low, high))}
+                if len(self.digest.weights) else {},
+            })
+        return summary
+
+
+def _json_value(value):
+    """转换为可写入JSON的值：numpy 标量转为 Python 数值，整数值的浮点数显示为整数，NaN 和无穷大为 None"""
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float):
+        if value != value or value in (float('inf'), float('-inf')):
+            return None
+        if value.is_integer() and abs(value) < 2 ** 53:
+            return int(value)
+    return value
+
+
+def profile_csv(path, chunksize=PROFILE_CHUNK_ROWS):
+    """
+    分块扫描一遍CSV，计算各列的概要
+
+    Returns:
+        dict: 总行数、各列概要和耗时
+    """
+    import pandas as pd
+    from clean_data import ColumnTypes, _is_number
+    start = time.perf_counter()
+    types, rows, profiles = ColumnTypes(), 0, {}
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        types.update(chunk)
+        rows += len(chunk)
+        for col in types.columns:
+            profiles.setdefault(col, ColumnProfile()).update(chunk[col], _is_number(chunk[col].dtype))
+    if types.columns is None:
+        # 空文件：只有表头
+        columns = [{'name': col, 'dtype': 'object', 'count': 0, 'nulls': 0, 'null_rate': 0.0,
+                    'distinct': 0, 'distinct_exact': True, 'top_values': [], 'top_values_error': 0}
+                   for col in pd.read_csv(path, nrows=0).columns]
+    else:
+        columns = [profiles[col].summary(col, types.dtype(col), rows) for col in types.columns]
+    return {
+        'rows': rows,
+        'columns': columns,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def _cache_path(file_path, content_hash):
+    if content_hash is None:
+        # 追加过数据的会话没有内容哈希，以文件路径、大小和修改时间标识内容
+        stat = os.stat(file_path)
+        content_hash = f"{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    payload = json.dumps({
+        'content': content_hash,
+        'params': [PROFILE_TOP_CAPACITY, TOP_VALUES, QUANTILES, HLL_PRECISION, TDIGEST_COMPRESSION],
+        'code': result_cache.code_version()
+    }, sort_keys=True)
+    return os.path.join(PROFILE_CACHE_DIR, f"{hashlib.sha256(payload.encode('utf-8')).hexdigest()}.json")
+
+
+def load_cached(file_path, content_hash=None):
+    """读取缓存的概要，没有缓存时返回 None"""
+    path = _cache_path(file_path, content_hash)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # 更新访问时间，供LRU淘汰使用
+    os.utime(path)
+    profile['cached'] = True
+    return profile
+
+
+def profile_upload(file_path, content_hash=None):
+    """计算上传文件的概要并写入缓存（在分析工作进程中执行）"""
+    profile = profile_csv(file_path)
+    if PROFILE_CACHE_MAX_BYTES > 0:
+        path = _cache_path(file_path, content_hash)
+        os.makedirs(PROFILE_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(profile, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    profile['cached'] = False
+    return profile
+
+
+def evict(max_bytes=None):
+    """
+    淘汰最久未访问的概要，直到总大小不超过上限
+
+    Returns:
+        int: 释放的字节数
+    """
+    max_bytes = PROFILE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    with _evict_lock:
+        return disk_cache.evict_lru(disk_cache.file_entries(PROFILE_CACHE_DIR, '.json'), max_bytes)
@@ -0,0 +1,53 @@
+"""
+磁盘缓存的按最近访问时间淘汰（LRU）
+结果缓存、节点缓存、渲染缓存和数据概要缓存共用：读取缓存时更新条目的修改时间，
+总大小超过上限时从最久未访问的条目开始删除
+"""
+import os
+
+
+def file_entries(cache_dir, suffix):
+    """
+    列出缓存目录中以 suffix 结尾的文件
+
+    Returns:
+        list: [(修改时间, 大小, 路径)]，目录不存在时为空
+    """
+    if not os.path.isdir(cache_dir):
+        return []
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(suffix):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+        except OSError:
+            continue
+    return entries
+
+
+def evict_lru(entries, max_bytes, remove=os.remove):
+    """
+    淘汰最久未访问的条目，直到总大小不超过上限（调用方持有对应缓存的锁）
+
+    Args:
+        entries: [(修改时间, 大小, 路径)]
+        max_bytes: 总大小上限（字节）
+        remove: 删除一个条目的函数，删除失败时抛出 OSError，该条目不计入释放的空间
+
+    Returns:
+        int: 释放的字节数
+    """
+    total = sum(size for _, size, _ in entries)
+    reclaimed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            remove(path)
+        except OSError:
+            continue
+        total -= size
+        reclaimed += size
+    return reclaimed
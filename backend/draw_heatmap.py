@@ -1,23 +1,42 @@
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
 import sys
-from matplotlib.font_manager import FontProperties
 
 # 导入字体处理函数
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-from embed_font import download_simsun_font, setup_chinese_font
+from embed_font import get_font_prop
+from data_loader import load_data
+import charts
 
-def generate_heatmap(data_path, output_dir):
-    # 使用统一的字体设置
-    font_prop = setup_chinese_font()
-    
-    print(f"热力图使用字体: {plt.rcParams['font.family']}")
-    
-    # 读取清洗后的数据
-    df = pd.read_csv(data_path)
+# 年龄段的分段边界和名称
+AGE_BINS = [0, 15, 18, 25, 35, 45, 100]
+AGE_LABELS = ["0-15", "15-18", "18-25", "26-35", "36-45", "45+"]
+
+def build_pivot(data):
+    """
+    构造不同职业与年龄段用户的平均使用频率透视表
+
+    Args:
+        data: CSV文件路径或清洗后的 DataFrame（不会被修改）
+
+    Returns:
+        dict: pivot 为透视表、rows 为数据行数；出错时只包含 error
+    """
+    totals = pivot_totals(data)
+    if 'error' in totals:
+        return totals
+    return {'pivot': pivot_from_totals(totals), 'rows': totals['rows']}
+
+
+def pivot_totals(data):
+    """
+    按职业和年龄段分组的使用频率合计与计数（不同批次的数据可以直接相加，见 merge_totals）
+
+    Returns:
+        dict: sum / count 为职业 x 年龄段的合计和非空值个数，rows 为数据行数；出错时只包含 error
+    """
+    # 读取清洗后的数据（文件路径或内存中的DataFrame）
+    df = load_data(data)
 
     # 检查必要的列是否存在
     required_columns = ['年龄', '职业', '使用频率（次/周）']
@@ -32,8 +51,8 @@ def generate_heatmap(data_path, output_dir):
     try:
         df["年龄段"] = pd.cut(
             df["年龄"],
-            bins=[0, 15, 18, 25, 35, 45, 100],
-            labels=["0-15", "15-18", "18-25", "26-35", "36-45", "45+"],
+            bins=AGE_BINS,
+            labels=AGE_LABELS,
             right=False
         )
     except Exception as e:
@@ -42,44 +61,98 @@ def generate_heatmap(data_path, output_dir):
             'error': f"构造年龄段时出错: {e}"
         }
 
-    # 构造透视表
+    # 构造透视表：分别统计合计和个数，平均值由两者相除得到
     try:
-        pivot = df.pivot_table(
-            values="使用频率（次/周）",
-            index="职业",
-            columns="年龄段",
-            aggfunc="mean"
-        )
+        # 职业读取为 category 时只保留清洗后仍有数据的职业
+        grouped = df.groupby(["职业", "年龄段"], observed=True)["使用频率（次/周）"]
+        totals = {'sum': grouped.sum().unstack(), 'count': grouped.count().unstack()}
     except Exception as e:
         print(f"错误: 创建透视表时出错: {e}")
         return {
             'error': f"创建透视表时出错: {e}"
         }
 
-    # 填补缺失值 (保持 NaN)
-    pivot = pivot.fillna(np.nan)
+    for key, table in totals.items():
+        # 行列标签统一为文本，合并不同批次时按标签对齐
+        table.index = [str(label) for label in table.index]
+        table.columns = [str(label) for label in table.columns]
+        totals[key] = table.astype(float).fillna(0)
+    totals['rows'] = len(df)
+    return totals
+
+
+def merge_totals(totals, other):
+    """合并两批数据的 pivot_totals"""
+    merged = {key: totals[key].add(other[key], fill_value=0).fillna(0) for key in ('sum', 'count')}
+    merged['rows'] = totals['rows'] + other['rows']
+    return merged
+
+
+def pivot_from_totals(totals):
+    """
+    由合计和个数计算平均使用频率透视表，与 pivot_table(aggfunc="mean") 的结果一致：
+    职业按名称排序、年龄段按分段顺序排列，全部为空的行和列不显示
+    """
+    count = totals['count']
+    pivot = totals['sum'] / count.where(count > 0)
+    pivot = pivot.sort_index()
+    pivot = pivot[[label for label in AGE_LABELS if label in pivot.columns]]
+    return pivot.dropna(how='all').dropna(how='all', axis=1)
+
+
+def draw_heatmap(data):
+    """根据图表数据（职业 x 年龄段的平均使用频率）绘制热力图"""
+    import seaborn as sns
+
+    pivot = pd.DataFrame(data['values'], index=data['rows'], columns=data['columns'], dtype=float)
+
+    # 使用统一的字体设置
+    font_prop = get_font_prop()
 
     # 作图
-    plt.figure(figsize=(12, 6), facecolor='white')
-    
+    fig = charts.new_figure((12, 6))
+    ax = fig.add_subplot()
+
     # 使用用户指定的 YlGnBu 配色方案
-    sns.heatmap(pivot, annot=True, fmt=".1f", cmap="YlGnBu", linewidths=.5)
-    
-    plt.title("不同职业与年龄段用户的平均使用频率热力图", fontproperties=font_prop, fontsize=16)
-    plt.xlabel("年龄段", fontproperties=font_prop, fontsize=14)
-    plt.ylabel("职业", fontproperties=font_prop, fontsize=14)
-    plt.xticks(fontproperties=font_prop, rotation=0, fontsize=12) # 保持标签水平
-    plt.yticks(fontproperties=font_prop, fontsize=12)
-    
-    # 保存热力图
-    heatmap_path = os.path.join(output_dir, 'user_behavior_heatmap.png')
-    plt.tight_layout()
-    plt.savefig(heatmap_path, dpi=300, bbox_inches='tight', format='png')
-    plt.close()
-
-    # 返回结果（可以根据需要添加统计信息）
+    sns.heatmap(pivot, annot=True, fmt=".1f", cmap="YlGnBu", linewidths=.5, ax=ax)
+
+    ax.set_title("不同职业与年龄段用户的平均使用频率热力图", fontproperties=font_prop, fontsize=16)
+    ax.set_xlabel("年龄段", fontproperties=font_prop, fontsize=14)
+    ax.set_ylabel("职业", fontproperties=font_prop, fontsize=14)
+    for label in ax.get_xticklabels() + ax.get_yticklabels():
+        label.set_fontproperties(font_prop)
+        label.set_fontsize(12)
+    ax.tick_params(axis='x', labelrotation=0)  # 保持标签水平
+    fig.tight_layout()
+    return fig
+
+
+def assemble_results(pivot_result):
+    """
+    汇总热力图分析的输出
+
+    Returns:
+        dict: result 为分析结果，charts 为图表名 -> 图表数据（透视表的行、列和数值），files 为其他文件
+    """
+    if 'error' in pivot_result:
+        return {'result': {'error': pivot_result['error']}, 'charts': {}, 'files': {}}
+    pivot = pivot_result['pivot']
     return {
-        'heatmap_image': heatmap_path,
         # 可以选择性地返回透视表数据或其他统计信息
         # 'pivot_table': pivot.reset_index().to_dict('records')
-    }
\ No newline at end of file
+        'result': {},
+        'charts': {
+            'heatmap': {
+                'rows': [str(label) for label in pivot.index],
+                'columns': [str(label) for label in pivot.columns],
+                'values': [charts.compact(row) for row in pivot.to_numpy()]
+            }
+        },
+        'files': {}
+    }
+
+
+def generate_heatmap(data, output_dir):
+    """生成用户行为热力图并保存到输出目录（流水线中透视表和绘图是计算图中的独立节点）"""
+    output = assemble_results(build_pivot(data))
+    return charts.write_charts({**output['result'], 'charts': output['charts']}, output_dir)
@@ -1,64 +1,60 @@
 """
 嵌入一个基本的中文字体，确保图表可以显示中文
-完全隔离matplotlib环境，避免编码问题
+完全隔离matplotlib环境，避免编码问题。
+matplotlib 的全局配置只在第一次使用时设置一次，字体也只加载一次，之后各线程只读共享，
+绘图不再修改任何全局状态，多个图表可以在线程中同时渲染
 """
 import os
 import sys
 import base64
 import shutil
+import threading
 from pathlib import Path
 
-# 在导入matplotlib前完全隔离环境
-# 创建隔离的配置目录
-config_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mpl_config')
-os.makedirs(config_dir, exist_ok=True)
+from matplotlib_patch import configure_environment
 
-# 创建空的样式目录，防止matplotlib读取系统样式
-stylelib_dir = os.path.join(config_dir, 'stylelib')
-os.makedirs(stylelib_dir, exist_ok=True)
+_matplotlib_configured = False
+_font_prop = None
+_setup_lock = threading.RLock()
 
-# 设置环境变量，完全隔离matplotlib环境
-os.environ['MPLCONFIGDIR'] = config_dir
-os.environ['MATPLOTLIBRC'] = os.path.join(config_dir, 'matplotlibrc')
-os.environ['MPLBACKEND'] = 'Agg'  # 使用非交互式后端
-os.environ['MATPLOTLIBDATA'] = config_dir  # 重定向matplotlib数据目录
 
-# 创建空的配置文件
-with open(os.environ['MATPLOTLIBRC'], 'w', encoding='utf-8') as f:
-    f.write('# Empty config file\n')
-
-# 禁用matplotlib缓存
-os.environ['MPL_CACHE_DIR'] = config_dir
+def _import_matplotlib():
+    """
+    第一次使用时隔离环境并导入matplotlib，模块导入本身不做任何文件读写
 
-# 确保matplotlib不会尝试读取任何可能存在编码问题的文件
-try:
-    # 导入matplotlib并立即设置基本配置
-    import matplotlib
-    matplotlib.use('Agg')  # 强制使用非交互式后端
-    
-    # 禁用字体缓存
-    matplotlib.rcParams['font.family'] = 'sans-serif'
-    matplotlib.rcParams['font.sans-serif'] = ['DejaVu Sans']
-    matplotlib.rcParams['axes.unicode_minus'] = False
-    
-    # 导入其他matplotlib模块
-    import matplotlib.font_manager as fm
-    import matplotlib as mpl
-except Exception as e:
-    print(f"导入matplotlib时出错: {e}")
-    # 创建一个最小化的matplotlib环境
+    Returns:
+        tuple: (matplotlib, matplotlib.font_manager)
+    """
+    global _matplotlib_configured
+    configure_environment()
     import matplotlib
-    matplotlib.use('Agg')
     import matplotlib.font_manager as fm
-    import matplotlib as mpl
+    if _matplotlib_configured:
+        return matplotlib, fm
+    with _setup_lock:
+        if not _matplotlib_configured:
+            # 确保matplotlib不会尝试读取任何可能存在编码问题的文件
+            try:
+                matplotlib.use('Agg')  # 强制使用非交互式后端
+
+                # 直接设置基本字体配置，不使用样式文件
+                matplotlib.rcParams['font.family'] = 'sans-serif'
+                matplotlib.rcParams['font.sans-serif'] = ['DejaVu Sans']
+                matplotlib.rcParams['axes.unicode_minus'] = False  # 正确显示负号
+                matplotlib.rcParams['font.size'] = 12
+                matplotlib.rcParams['font.weight'] = 'normal'
+
+                # 禁用字体管理器的自动扫描功能，直接使用字体，不扫描系统字体
+                if hasattr(fm, 'fontManager'):
+                    fm.fontManager._finders = []
+            except Exception as e:
+                print(f"导入matplotlib时出错: {e}")
+            _matplotlib_configured = True
+    return matplotlib, fm
 
-# 导入其他需要的模块
-import requests
-import zipfile
 
 # 字体目录
 FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts')
-os.makedirs(FONT_DIR, exist_ok=True)
 
 # 字体文件路径
 FONT_PATH = os.path.join(FONT_DIR, 'simsun.ttc')
@@ -71,6 +67,8 @@ def download_simsun_font():
     if os.path.exists(FONT_PATH):
         print(f"使用已有字体: {FONT_PATH}")
         return FONT_PATH
+    os.makedirs(FONT_DIR, exist_ok=True)
+    _, fm = _import_matplotlib()
     
     # 使用matplotlib内置字体
     print("使用matplotlib内置字体...")
@@ -98,43 +96,27 @@ def download_simsun_font():
 
 def get_font_prop():
     """
-    获取中文字体属性
+    获取中文字体属性（进程内只加载一次，各线程共享，调用方不应修改）
     """
-    font_path = download_simsun_font()
-    return fm.FontProperties(fname=font_path)
+    global _font_prop
+    if _font_prop is not None:
+        return _font_prop
+    _, fm = _import_matplotlib()
+    with _setup_lock:
+        if _font_prop is None:
+            try:
+                _font_prop = fm.FontProperties(fname=download_simsun_font())
+            except Exception as e:
+                print(f"字体设置过程中发生错误: {e}")
+                # 返回一个默认字体属性，确保程序可以继续运行
+                _font_prop = fm.FontProperties()
+    return _font_prop
 
 def setup_chinese_font():
     """
-    设置matplotlib使用中文字体
+    设置matplotlib使用中文字体（全局配置只在第一次调用时设置，之后不再修改）
     """
-    try:
-        # 获取字体路径
-        font_path = download_simsun_font()
-        font_prop = fm.FontProperties(fname=font_path)
-        
-        # 完全重置matplotlib配置，避免读取任何外部文件
-        mpl.rcdefaults()  # 使用内置默认值
-        
-        # 直接设置基本字体配置，不使用样式文件
-        mpl.rcParams['font.family'] = 'sans-serif'
-        mpl.rcParams['font.sans-serif'] = ['DejaVu Sans']
-        mpl.rcParams['axes.unicode_minus'] = False  # 正确显示负号
-        mpl.rcParams['font.size'] = 12
-        mpl.rcParams['font.weight'] = 'normal'
-        
-        # 禁用字体管理器的自动扫描功能
-        try:
-            # 直接使用字体，不扫描系统字体
-            if hasattr(fm, 'fontManager'):
-                fm.fontManager._finders = []
-        except Exception as e:
-            print(f"禁用字体扫描失败: {e}")
-        
-        return font_prop
-    except Exception as e:
-        print(f"字体设置过程中发生错误: {e}")
-        # 返回一个默认字体属性，确保程序可以继续运行
-        return fm.FontProperties()
+    return get_font_prop()
 
 # 如果直接运行此脚本，则测试字体设置
 if __name__ == "__main__":
@@ -1,34 +1,24 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import os
 import sys
-from matplotlib.font_manager import FontProperties
 
 # 导入字体处理函数
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-from embed_font import download_simsun_font, setup_chinese_font
+from embed_font import get_font_prop
+from data_loader import load_data
+import charts
 
-def generate_funnel(data_path, output_dir):
-    # 使用固定的中文字体
-    font_path = download_simsun_font()
-    
-    if font_path and os.path.exists(font_path):
-        # 注册字体
-        font_prop = FontProperties(fname=font_path)
-        plt.rcParams['font.family'] = font_prop.get_name()
-    else:
-        # 备选方案 - 使用宋体/黑体
-        plt.rcParams['font.sans-serif'] = ['SimHei', 'SimSun', 'Microsoft YaHei']
-    
-    # 禁用负号转换
-    plt.rcParams['axes.unicode_minus'] = False
-    
-    print(f"漏斗图使用字体: {plt.rcParams['font.family']}")
-    
-    # 读取清洗后的数据
-    df = pd.read_csv(data_path)
-    
+def find_funnel_stages(df):
+    """
+    识别数据中可用于绘制转化漏斗的阶段列
+
+    Args:
+        df: 清洗后的数据
+
+    Returns:
+        list: 按转化顺序排列的列名，少于3个时无法绘制漏斗图
+    """
     # 假设数据包含转化流程相关的行为列
     # 典型的转化漏斗包括：浏览->加购物车->下单->支付成功
     # 需要根据实际数据调整以下代码
@@ -84,20 +74,46 @@ def generate_funnel(data_path, output_dir):
                 # 按照均值降序排列（假设转化漏斗中，早期阶段的数值更大）
                 sorted_cols = col_means.sort_values(ascending=False).index.tolist()
                 funnel_stages = sorted_cols[:min(6, len(sorted_cols))]  # 最多取6个阶段
+
+    return funnel_stages
+
+
+def check_funnel_columns(df):
+    """分析阶段的前置检查：无法识别出至少3个漏斗阶段时返回原因"""
+    if len(find_funnel_stages(df)) < 3:
+        return "无法识别足够的转化漏斗阶段（至少需要3个阶段）"
+    return None
+
+
+def analyze_funnel(data, output_dir=None):
+    """
+    计算转化漏斗各阶段的用户数和转化率
+
+    Args:
+        data: CSV文件路径或清洗后的 DataFrame
+        output_dir: 未使用，与其他分析函数的调用方式保持一致
+
+    Returns:
+        dict: funnel_data 为各阶段的数据，charts 为漏斗图的图表数据
+    """
+    # 读取清洗后的数据（文件路径或内存中的DataFrame）
+    df = load_data(data)
+    
+    funnel_stages = find_funnel_stages(df)
     
     if len(funnel_stages) < 3:
         raise ValueError("无法识别足够的转化漏斗阶段（至少需要3个阶段）")
     
-    # 阶段名称优化 - 使用中文显示
-    stage_display_names = {
-        'page_views': '页面浏览',
-        'add_to_cart': '加入购物车',
-        'purchase': '购买',
-        'use_count': '使用次数',
-        'days_to_first_use': '首次使用',
-        'days_since_last_use': '最近使用'
-    }
-    
+    return funnel_result(funnel_stages, count_stages(df, funnel_stages))
+
+
+def count_stages(df, funnel_stages):
+    """
+    计算每个漏斗阶段的用户数（各行的计数可以直接相加，追加数据时只需计算新增的行）
+
+    Returns:
+        list: 与 funnel_stages 对应的用户数
+    """
     # 计算每个阶段的用户数量
     stage_counts = []
     for stage in funnel_stages:
@@ -112,7 +128,26 @@ def generate_funnel(data_path, output_dir):
             # 其他类型，计算非空值的数量
             count = df[stage].notna().sum()
         
-        stage_counts.append(count)
+        stage_counts.append(int(count))
+    return stage_counts
+
+
+def funnel_result(funnel_stages, stage_counts):
+    """
+    根据各阶段的用户数计算转化率
+
+    Returns:
+        dict: funnel_data 为各阶段的数据，charts 为漏斗图的图表数据
+    """
+    # 阶段名称优化 - 使用中文显示
+    stage_display_names = {
+        'page_views': '页面浏览',
+        'add_to_cart': '加入购物车',
+        'purchase': '购买',
+        'use_count': '使用次数',
+        'days_to_first_use': '首次使用',
+        'days_since_last_use': '最近使用'
+    }
     
     # 计算转化率
     conversion_rates = []
@@ -123,20 +158,49 @@ def generate_funnel(data_path, output_dir):
             rate = 0
         conversion_rates.append(f"{rate:.1f}%")
     
+    # 准备返回的数据 - 使用显示名称
+    funnel_data = []
+    for i, stage in enumerate(funnel_stages):
+        display_name = stage_display_names.get(stage, stage)
+        stage_data = {
+            'stage': display_name,
+            'count': int(stage_counts[i]),
+            'conversion_rate': conversion_rates[i-1] if i > 0 else '100%'
+        }
+        funnel_data.append(stage_data)
+    
+    return {
+        'funnel_data': funnel_data,
+        'charts': {'funnel': {'stages': funnel_data}}
+    }
+
+
+def draw_funnel(data):
+    """根据各阶段的用户数和转化率绘制漏斗图"""
+    import matplotlib
+
+    # 使用固定的中文字体（共享的字体属性，不修改全局配置）
+    font_prop = get_font_prop()
+    
+    stages = data['stages']
+    stage_counts = [stage['count'] for stage in stages]
+    
     # 绘制漏斗图
-    plt.figure(figsize=(12, 8), facecolor='white')
+    fig = charts.new_figure((12, 8))
+    ax = fig.add_subplot()
     
     # 设置底部宽度为1，顶部宽度根据数值比例确定
     bottom_width = 0.8
     max_count = max(stage_counts)
     
     # 漏斗图的颜色
-    colors = plt.cm.Blues(np.linspace(0.3, 0.9, len(funnel_stages)))
+    colors = matplotlib.colormaps['Blues'](np.linspace(0.3, 0.9, len(stages)))
     
     # 画漏斗的梯形
-    for i, (count, stage, color) in enumerate(zip(stage_counts, funnel_stages, colors)):
+    for i, (stage, color) in enumerate(zip(stages, colors)):
+        count = stage['count']
         # 获取阶段的显示名称
-        display_name = stage_display_names.get(stage, stage)
+        display_name = stage['stage']
         
         # 梯形的上下底宽度
         width_top = bottom_width * (count / max_count)
@@ -153,51 +217,29 @@ def generate_funnel(data_path, output_dir):
         y_top = -(i + 0.8)
         
         # 绘制梯形
-        plt.fill([left_bottom, right_bottom, right_top, left_top], 
+        ax.fill([left_bottom, right_bottom, right_top, left_top], 
                 [y_bottom, y_bottom, y_top, y_top], 
                 color=color, edgecolor='white', linewidth=2)
         
         # 添加阶段名称和计数 - 使用指定字体
-        if font_path:
-            plt.text(0, y_bottom - 0.4, f'{display_name}: {count}', 
-                    ha='center', va='center', fontsize=14, 
-                    fontweight='bold', fontproperties=font_prop)
-        else:
-            plt.text(0, y_bottom - 0.4, f'{display_name}: {count}', 
-                    ha='center', va='center', fontsize=14, fontweight='bold')
+        ax.text(0, y_bottom - 0.4, f'{display_name}: {count}', 
+                ha='center', va='center', fontsize=14, 
+                fontweight='bold', fontproperties=font_prop)
         
         # 添加转化率
         if i > 0:
-            plt.text(right_bottom + 0.05, (y_bottom + y_top) / 2, 
-                    f"↓ {conversion_rates[i-1]}", 
+            ax.text(right_bottom + 0.05, (y_bottom + y_top) / 2, 
+                    f"↓ {stage['conversion_rate']}", 
                     ha='left', va='center', fontsize=12, fontweight='bold')
     
     # 添加标题
-    if font_path:
-        plt.title('用户转化漏斗分析', fontproperties=font_prop, fontsize=16, pad=20)
-    else:
-        plt.title('用户转化漏斗分析', fontsize=16, pad=20)
-    
-    plt.axis('off')  # 不显示坐标轴
-    plt.tight_layout()
-    
-    # 保存漏斗图
-    funnel_path = os.path.join(output_dir, 'conversion_funnel.png')
-    plt.savefig(funnel_path, dpi=300, bbox_inches='tight', format='png')
-    plt.close()
+    ax.set_title('用户转化漏斗分析', fontproperties=font_prop, fontsize=16, pad=20)
     
-    # 准备返回的数据 - 使用显示名称
-    funnel_data = []
-    for i, stage in enumerate(funnel_stages):
-        display_name = stage_display_names.get(stage, stage)
-        stage_data = {
-            'stage': display_name,
-            'count': int(stage_counts[i]),
-            'conversion_rate': conversion_rates[i-1] if i > 0 else '100%'
-        }
-        funnel_data.append(stage_data)
-    
-    return {
-        'funnel_image': funnel_path,
-        'funnel_data': funnel_data
-    }
\ No newline at end of file
+    ax.axis('off')  # 不显示坐标轴
+    fig.tight_layout()
+    return fig
+
+
+def generate_funnel(data, output_dir):
+    """计算转化漏斗并把漏斗图保存到输出目录"""
+    return charts.write_charts(analyze_funnel(data), output_dir)
@@ -0,0 +1,96 @@
+"""
+导入耗时检查
+在全新的子进程中导入各个模块，检查：
+  1. 导入耗时不超过预算
+  2. 没有提前加载不需要的重量级库
+  3. 导入过程不读写当前目录中的文件（在空的临时目录中执行）
+
+用法：python import_budget.py，任一检查失败时退出码为 1
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 预算倍数，在较慢的机器上可以调大
+BUDGET_SCALE = float(os.environ.get('IMPORT_BUDGET_SCALE', 1.0))
+
+HEAVY_MODULES = ['pandas', 'numpy', 'matplotlib', 'seaborn', 'sklearn', 'scipy', 'mlxtend', 'networkx']
+
+# (说明, 导入代码, 耗时预算（秒）, 不允许加载的模块)
+CHECKS = [
+    ('API进程启动', 'import main', 1.0, HEAVY_MODULES),
+    ('分析工作进程初始化', 'import stage_executor; stage_executor.init_worker()', 1.0,
+     ['pandas', 'seaborn', 'sklearn', 'scipy']),
+    ('K-means分析模块', 'import kmeans_cluster_analysis', 1.0, ['matplotlib', 'sklearn', 'scipy']),
+    ('RFM分析模块', 'import rfm_analysis', 1.0, ['matplotlib', 'seaborn', 'sklearn', 'scipy']),
+]
+
+_PROBE = """
+import sys, time, json
+start = time.perf_counter()
+exec(compile(sys.argv[1], '<import>', 'exec'))
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'modules': sorted(sys.modules)}))
+"""
+
+
+def measure(code):
+    """
+    在空的临时目录中用新进程执行导入代码
+
+    Returns:
+        dict: seconds（耗时）、modules（已加载模块）、files（导入后目录中出现的文件）
+    """
+    work_dir = tempfile.mkdtemp(prefix='import_budget_')
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR, PYTHONDONTWRITEBYTECODE='1')
+    try:
+        proc = subprocess.run([sys.executable, '-c', _PROBE, code], cwd=work_dir, env=env,
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            return {'error': proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else '导入失败'}
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        result['files'] = sorted(os.listdir(work_dir))
+        return result
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def check(name, code, budget, forbidden):
+    """执行一项检查，返回失败项的说明列表"""
+    budget *= BUDGET_SCALE
+    result = measure(code)
+    if 'error' in result:
+        print(f"[失败] {name}: {result['error']}")
+        return [f"{name}: {result['error']}"]
+
+    problems = []
+    if result['seconds'] > budget:
+        problems.append(f"耗时 {result['seconds']:.2f}s 超过预算 {budget:.2f}s")
+    loaded = [m for m in forbidden if m in result['modules']]
+    if loaded:
+        problems.append(f"提前加载了 {', '.join(loaded)}")
+    if result['files']:
+        problems.append(f"导入时在当前目录写入了 {', '.join(result['files'])}")
+
+    status = '失败' if problems else '通过'
+    print(f"[{status}] {name}: {result['seconds']:.2f}s（预算 {budget:.2f}s）")
+    for problem in problems:
+        print(f"    {problem}")
+    return [f"{name}: {problem}" for problem in problems]
+
+
+def run_checks():
+    """执行所有检查，返回失败项的说明列表"""
+    failures = []
+    for name, code, budget, forbidden in CHECKS:
+        failures.extend(check(name, code, budget, forbidden))
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if run_checks() else 0)
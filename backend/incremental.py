@@ -0,0 +1,446 @@
+"""
+增量追加数据
+会话第一次追加数据时，由会话的上传文件为会话请求的分析建立累计状态：清洗统计和数值列的统计量、漏斗各阶段的计数、
+热力图透视表的合计与个数、RFM 每个用户的汇总，以及 K-means 的标准化器、模型、PCA、各聚类的合计和散点图的抽样与密度网格，
+保存在会话目录的 incremental_state.pkl 中。状态的大小与数据行数无关（RFM 与用户数成正比）。
+之后每次追加只读取和清洗新的一批数据，把这批数据的汇总合并进状态，再由状态重新生成各分析的结果，
+已有的数据不再处理；中间数据也只追加新的行（列式格式每批写一个文件，见 storage.append_frame）。
+
+K-means 用保存的模型为新数据分配聚类，并把新数据计入聚类中心，不重新拟合；肘部法则和漏斗的阶段列沿用建立状态时的结果。
+追加的原始数据合并到会话自己的上传文件（combined_upload.csv），之后通过 /analyze 重新分析时使用全部数据，
+完整的分析会丢弃累计状态，下次追加时重新建立。
+
+保存累计状态是一次追加的提交点：状态中记录提交时上传文件和中间数据的长度，
+追加中途出错（或重试）留下的多余内容在下一次追加时先截掉，同一批数据不会被重复计入
+"""
+import os
+import csv
+import json
+import pickle
+import shutil
+
+import metrics
+import analysis_stages
+import session_registry
+from charts import RENDER_PNG
+from pipeline import WRITE_ARTIFACTS, _notify, build_response, materialize
+from storage import FORMAT_EXTENSIONS, INTERMEDIATE_FORMAT, append_frame, find_frame, frame_length, save_frame
+
+# 累计状态和合并后的上传文件（位于会话目录中）
+STATE_FILE = 'incremental_state.pkl'
+COMBINED_UPLOAD = 'combined_upload.csv'
+
+
+def read_header(path):
+    """CSV文件的表头（列名列表）"""
+    with open(path, 'r', encoding='utf-8', errors='replace', newline='') as f:
+        return next(csv.reader(f), [])
+
+
+def load_state(session_dir):
+    """读取会话的累计状态，尚未建立时返回 None"""
+    path = os.path.join(session_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _save_state(session_dir, state):
+    path = os.path.join(session_dir, STATE_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def discard_state(session_dir):
+    """丢弃累计状态（重新执行完整分析前调用）"""
+    path = os.path.join(session_dir, STATE_FILE)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _init_funnel(df, params):
+    import funnel_analysis_funnel_shape as funnel
+
+    stages = funnel.find_funnel_stages(df)
+    return {'stages': stages, 'counts': funnel.count_stages(df, stages)}
+
+
+def _update_funnel(state, df):
+    import funnel_analysis_funnel_shape as funnel
+
+    counts = funnel.count_stages(df, state['stages'])
+    return {'stages': state['stages'], 'counts': [a + b for a, b in zip(state['counts'], counts)]}
+
+
+def _output_funnel(state):
+    import funnel_analysis_funnel_shape as funnel
+
+    result = funnel.funnel_result(state['stages'], state['counts'])
+    return {'result': result, 'charts': result.pop('charts'), 'files': {}}
+
+
+def _init_heatmap(df, params):
+    import draw_heatmap
+
+    return draw_heatmap.pivot_totals(df)
+
+
+def _update_heatmap(state, df):
+    import draw_heatmap
+
+    totals = draw_heatmap.pivot_totals(df)
+    if 'error' in state or 'error' in totals:
+        # 无法构造透视表时与完整分析一样报告错误
+        return state if 'error' in state else totals
+    return draw_heatmap.merge_totals(state, totals)
+
+
+def _output_heatmap(state):
+    import draw_heatmap
+
+    if 'error' in state:
+        return draw_heatmap.assemble_results(state)
+    return draw_heatmap.assemble_results({'pivot': draw_heatmap.pivot_from_totals(state), 'rows': state['rows']})
+
+
+def _init_rfm(df, params):
+    import rfm_analysis
+    from data_loader import load_data
+
+    prepared = rfm_analysis.prepare_transactions(load_data(df))
+    if isinstance(prepared, dict):
+        return prepared
+    # 评分和聚类的参数（聚类数、聚类得分）在生成结果时使用
+    return {**rfm_analysis.user_totals(prepared), 'params': params}
+
+
+def _update_rfm(state, df):
+    import rfm_analysis
+
+    totals = _init_rfm(df, {})
+    if 'error' in state or 'error' in totals:
+        return state if 'error' in state else totals
+    return {**rfm_analysis.merge_user_totals(state, totals), 'params': state.get('params', {})}
+
+
+def _output_rfm(state):
+    if 'error' in state:
+        return {'result': state, 'charts': {}, 'files': {}}
+    # 评分和聚类只针对每个用户的汇总，用户数远少于数据行数
+    return analysis_stages.run_isolated(state, 'rfm_analysis', 'score_users', state.get('params', {}))
+
+
+def _init_kmeans(df, params):
+    import kmeans_cluster_analysis as km
+
+    features = km.build_features(df)
+    scaler = km.fit_scaler(features)
+    X_scaled = scaler.transform(features.fillna(0))
+    sweep = km.elbow_sweep(X_scaled, k_score=params.get('k_score'))
+    model = km.fit_model(X_scaled, sweep, params.get('n_clusters'))
+    pca, X_pca = km.fit_pca(X_scaled)
+    labels = model.labels_
+    # 每行一个的标签不保存在状态中（之后只用 predict）；initial_labels 用于写出已有数据的 clustered_data，不保存
+    del model.labels_
+    return {
+        'scaler': scaler,
+        'model': model,
+        'pca': pca,
+        'elbow': km.elbow_chart(sweep, params.get('n_clusters')),
+        'scatter': km.scatter_totals(X_pca, labels),
+        'totals': km.cluster_totals(features, labels),
+        'initial_labels': labels
+    }
+
+
+def _update_kmeans(state, df):
+    import kmeans_cluster_analysis as km
+
+    state = dict(state)
+    features = km.build_features(df)
+    X_scaled = state['scaler'].transform(features.fillna(0))
+    labels = state['model'].predict(X_scaled)
+    km.refresh_centers(state['model'], X_scaled, labels, state['totals']['sizes'])
+    state['scatter'] = km.merge_scatter_totals(state['scatter'], state['pca'].transform(X_scaled), labels)
+    state['totals'] = km.merge_cluster_totals(state['totals'], km.cluster_totals(features, labels))
+    # 只在写出带聚类标签的数据时使用，不保存在状态中
+    state['batch_labels'] = labels
+    return state
+
+
+def _output_kmeans(state):
+    import kmeans_cluster_analysis as km
+
+    return km.assemble_results(
+        state['elbow'],
+        km.scatter_from_totals(state['scatter']),
+        km.summarize_totals(state['totals'])
+    )
+
+
+# 可以增量更新的分析 -> (由全部数据建立状态, 合并新的一批数据, 由状态生成阶段输出)；
+# 其余分析追加数据后需要通过 /analyze 重新分析
+HANDLERS = {
+    'kmeans': (_init_kmeans, _update_kmeans, _output_kmeans),
+    'heatmap': (_init_heatmap, _update_heatmap, _output_heatmap),
+    'funnel': (_init_funnel, _update_funnel, _output_funnel),
+    'rfm': (_init_rfm, _update_rfm, _output_rfm)
+}
+
+
+def build_state(df, raw, params=None, analyses=None):
+    """
+    由会话的全部数据建立累计状态
+
+    Args:
+        df: 清洗后的数据
+        raw: 原始数据（没有"是否脏数据"列时用于统计数值列）
+        params: 阶段名 -> 阶段参数
+        analyses: 要建立状态的分析，None 表示全部可以增量更新的分析
+
+    Returns:
+        dict: 累计状态，skipped 为不满足条件的分析及原因
+    """
+    from clean_data import column_stats
+
+    params = params or {}
+    state = {
+        'columns': [str(col) for col in raw.columns],
+        'batches': 0,
+        'original_rows': len(raw),
+        'cleaned_rows': len(df),
+        'column_stats': None if '是否脏数据' in raw.columns else column_stats(raw),
+        'skipped': {},
+        'analyses': {}
+    }
+    for name, (init, _, _) in HANDLERS.items():
+        if analyses is not None and name not in analyses:
+            continue
+        stage = analysis_stages.STAGES[name]
+        reason = stage.missing_dependencies() or stage.ineligible_reason(df)
+        if reason:
+            state['skipped'][name] = reason
+            continue
+        with metrics.step(f"append_init_{name}", rows=len(df)):
+            state['analyses'][name] = init(df, params.get(name) or {})
+    return state
+
+
+def update_state(state, raw):
+    """
+    把新的一批原始数据清洗后合并进累计状态
+
+    Returns:
+        tuple: (新的累计状态, 清洗后的这批数据, 这批数据的清洗统计)
+    """
+    from clean_data import clean_batch
+
+    # 状态只在内存中更新，全部完成后才写回会话目录，中途出错时已保存的状态不受影响
+    with metrics.step('append_clean', rows=len(raw)):
+        df, batch_stats = clean_batch(raw, state['column_stats'])
+    state = dict(state, batches=state['batches'] + 1,
+                 original_rows=state['original_rows'] + batch_stats['original_rows'],
+                 cleaned_rows=state['cleaned_rows'] + batch_stats['cleaned_rows'])
+    analyses = {}
+    for name, analysis_state in state['analyses'].items():
+        with metrics.step(f"append_{name}", rows=len(df)):
+            analyses[name] = HANDLERS[name][1](analysis_state, df)
+    state['analyses'] = analyses
+    return state, df, batch_stats
+
+
+def _append_rows(path, batch_path, keep=None):
+    """
+    把这批数据的数据行追加到CSV文件末尾
+
+    Args:
+        keep: 文件已提交的长度（字节），超出的部分是之前没有完成的追加写入的，先截掉
+
+    Returns:
+        int: 追加后的文件长度（字节）
+    """
+    with open(batch_path, 'rb') as src, open(path, 'rb+') as dst:
+        if keep is not None:
+            dst.truncate(keep)
+        src.readline()  # 跳过表头
+        dst.seek(0, os.SEEK_END)
+        if dst.tell() > 0:
+            dst.seek(-1, os.SEEK_END)
+            if dst.read(1) != b'\n':
+                dst.write(b'\n')
+        shutil.copyfileobj(src, dst)
+        return dst.tell()
+
+
+def _upload_committed(state, session_dir):
+    """会话的上传文件是否包含累计状态中的全部数据（上一次追加在保存状态之后、替换上传文件之前中断时不包含）"""
+    size = state.get('committed', {}).get('upload')
+    combined = os.path.join(session_dir, COMBINED_UPLOAD)
+    return size is not None and os.path.exists(combined) and os.path.getsize(combined) >= size
+
+
+def _register_upload(session_id, session_dir):
+    """在注册表中把会话的上传文件改为合并后的文件"""
+    combined = os.path.join(session_dir, COMBINED_UPLOAD)
+    # 内容已经变化：不再使用按内容缓存的结果，推断的列类型下次读取时重新推断
+    schema_path = os.path.join(session_dir, 'schema.json')
+    if os.path.exists(schema_path):
+        os.remove(schema_path)
+    session_registry.update_session(session_id, upload_path=combined, content_hash=None,
+                                    size=os.path.getsize(combined))
+
+
+def _save_initial(session_dir, name, df, data_format):
+    """
+    第一次追加时由会话已有的数据写出中间数据，覆盖之前没有完成的追加；
+    已有该中间数据时沿用它的格式
+
+    Returns:
+        int: 写出后的长度（见 storage.frame_length）
+    """
+    existing = find_frame(session_dir, name)
+    if existing is not None:
+        ext = os.path.splitext(existing)[1].lower()
+        data_format = next(fmt for fmt, extension in FORMAT_EXTENSIONS.items() if extension == ext)
+    with metrics.step(f"write_{name}", rows=len(df)):
+        return frame_length(save_frame(df, os.path.join(session_dir, name), data_format))
+
+
+def _append_artifact(session_dir, name, df, keep=None):
+    with metrics.step(f"write_{name}", rows=len(df)):
+        return append_frame(df, find_frame(session_dir, name), keep)
+
+
+def run_append(session_id, file_path, session_dir, batch_path, progress=None, analyses=None, params=None,
+               render=RENDER_PNG, write_artifacts=WRITE_ARTIFACTS, data_format=INTERMEDIATE_FORMAT,
+               content_hash=None):
+    """
+    把新的一批数据追加到会话并重新生成分析结果
+
+    Args:
+        session_id: 会话ID
+        file_path: 会话当前的上传文件
+        session_dir: 会话结果目录
+        batch_path: 新的一批数据（CSV，列与会话数据一致）
+        progress: 进度回调，与 run_pipeline 相同
+        analyses: 要生成结果的分析，None 表示默认分析
+        params: 阶段名 -> 阶段参数（只在建立累计状态时使用）
+        render: data 时在 charts 字段中返回各图表的数据
+        write_artifacts: 是否写出清洗后和聚类后的数据（已有的文件总会追加新数据）
+        data_format: 新写出的中间数据的存储格式
+        content_hash: 未使用，与 run_pipeline 的调用方式保持一致
+
+    Returns:
+        dict: 与 /analyze 接口返回结构一致的分析结果，append 字段为这批数据的行数和累计追加的批次数
+    """
+    from data_loader import read_csv
+    from clean_data import clean_frame, _clean_stats
+
+    analyses = analysis_stages.resolve(analyses)
+    metrics.drain()
+    _notify(progress, 'clean', 'running')
+
+    state = load_state(session_dir)
+    if state is not None and not _upload_committed(state, session_dir):
+        print("会话的上传文件与增量状态不一致（上一次追加没有完成），重新建立增量状态")
+        state = None
+    initial = None
+    if state is None:
+        # 第一次追加：由会话已有的数据建立累计状态
+        print(f"建立增量状态: {file_path}")
+        with metrics.step('read') as step:
+            raw = read_csv(file_path)
+            step['rows'] = len(raw)
+        with metrics.step('clean', rows=len(raw)):
+            df, _ = clean_frame(raw)
+        state = build_state(df, raw, params, analyses)
+        initial = df
+        initial_labels = state['analyses'].get('kmeans', {}).pop('initial_labels', None)
+        del raw
+
+    with metrics.step('read_batch') as step:
+        batch = read_csv(batch_path)
+        step['rows'] = len(batch)
+    if [str(col) for col in batch.columns] != state['columns']:
+        raise ValueError("追加数据的列与会话数据不一致")
+    committed = state.pop('committed', {})
+    state, cleaned, batch_stats = update_state(state, batch)
+    batch_labels = state['analyses'].get('kmeans', {}).pop('batch_labels', None)
+
+    # 写出中间数据：第一次追加时先写出已有数据，之后截掉未提交的内容再追加新的行
+    if initial is not None:
+        committed = {}
+        if write_artifacts or find_frame(session_dir, 'cleaned_data') is not None:
+            committed['cleaned_data'] = _save_initial(session_dir, 'cleaned_data', initial, data_format)
+        if 'kmeans' in state['analyses'] and (write_artifacts or find_frame(session_dir, 'clustered_data') is not None):
+            import kmeans_cluster_analysis as km
+            clustered = km.attach_clusters(initial, initial_labels)
+            committed['clustered_data'] = _save_initial(session_dir, 'clustered_data', clustered, data_format)
+    if find_frame(session_dir, 'cleaned_data') is not None:
+        committed['cleaned_data'] = _append_artifact(session_dir, 'cleaned_data', cleaned,
+                                                     committed.get('cleaned_data'))
+    if batch_labels is not None and find_frame(session_dir, 'clustered_data') is not None:
+        import kmeans_cluster_analysis as km
+        committed['clustered_data'] = _append_artifact(session_dir, 'clustered_data',
+                                                       km.attach_clusters(cleaned, batch_labels),
+                                                       committed.get('clustered_data'))
+
+    # 合并上传文件：之后的追加直接在会话自己的文件末尾追加；第一次追加时上传文件按内容共享，
+    # 复制一份归会话所有，保存状态后才替换，保存状态前中断时重新分析的仍是原来的数据
+    combined = os.path.join(session_dir, COMBINED_UPLOAD)
+    if initial is None:
+        committed['upload'] = _append_rows(combined, batch_path, committed['upload'])
+    else:
+        tmp_upload = f"{combined}.{os.getpid()}.tmp"
+        shutil.copyfile(file_path, tmp_upload)
+        committed['upload'] = _append_rows(tmp_upload, batch_path)
+    state['committed'] = committed
+    try:
+        _save_state(session_dir, state)
+    except BaseException:
+        if initial is not None and os.path.exists(tmp_upload):
+            os.remove(tmp_upload)
+        raise
+    if initial is not None:
+        os.replace(tmp_upload, combined)
+    _register_upload(session_id, session_dir)
+    # 这批数据已经合并到会话的上传文件
+    os.remove(batch_path)
+
+    cleaning_stats = _clean_stats(state['original_rows'], state['cleaned_rows'])
+    with open(os.path.join(session_dir, "cleaning_stats.json"), "w") as f:
+        json.dump(cleaning_stats, f, indent=2)
+    rows = state['cleaned_rows']
+    _notify(progress, 'clean', 'done', rows=rows, result={"cleaning_stats": cleaning_stats})
+
+    # 由累计状态重新生成各分析的结果
+    summaries, skipped = {}, {}
+    for name in analyses:
+        if name not in HANDLERS:
+            skipped[name] = "不支持增量更新，请通过 /analyze 重新分析全部数据"
+        elif name in state['skipped']:
+            skipped[name] = state['skipped'][name]
+        elif name not in state['analyses']:
+            skipped[name] = "建立增量状态时没有包含该分析，请通过 /analyze 重新分析全部数据"
+        if name in skipped:
+            print(f"跳过{analysis_stages.STAGES[name].title}: {skipped[name]}")
+            _notify(progress, name, 'skipped', reason=skipped[name])
+            continue
+        _notify(progress, name, 'running')
+        with metrics.step(f"append_output_{name}"):
+            output = HANDLERS[name][2](state['analyses'][name])
+        summaries[name] = materialize(output, session_id, session_dir, name, render)
+        _notify(progress, name, 'done', rows=rows, result=summaries[name])
+
+    response = build_response(session_id, analyses, cleaning_stats, summaries, skipped)
+    response["append"] = {
+        "batches": state['batches'],
+        "batch_rows": batch_stats['original_rows'],
+        "batch_cleaned_rows": batch_stats['cleaned_rows'],
+        "initialized": initial is not None
+    }
+    response["metrics"] = metrics.drain()
+    return response
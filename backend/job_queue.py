@@ -0,0 +1,312 @@
+"""
+后台分析任务队列
+使用有界的进程池执行分析流水线，任务状态和各阶段耗时记录在会话注册表中，
+这样无论哪个进程（包括多个 uvicorn worker）都能查询到任务进度
+"""
+import os
+import json
+import time
+import uuid
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+import incremental
+import result_cache
+import session_registry
+from pipeline import run_pipeline, stage_names
+from stage_executor import init_worker
+
+# 工作进程数量与最多允许排队的任务数（可通过环境变量调整）
+MAX_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', min(4, os.cpu_count() or 1)))
+MAX_PENDING_JOBS = int(os.environ.get('ANALYSIS_MAX_PENDING', 50))
+
+# 分析结果文件名
+RESULT_FILE = 'analysis_results.json'
+
+# 任务状态
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+# 阶段状态：缺少数据列或依赖库而未执行
+SKIPPED = 'skipped'
+
+
+class QueueFullError(Exception):
+    """排队任务过多时抛出"""
+
+
+class SessionDeletedError(Exception):
+    """会话正在被清理时抛出"""
+
+
+class SessionBusyError(Exception):
+    """会话已有任务在排队或执行，且新任务不能与之合并时抛出"""
+
+
+_executor = None
+_pending = {}  # 任务ID -> Future（分析任务和 submit_task 提交的计算）
+_lock = threading.Lock()
+
+# 使用 forkserver 启动工作进程（与渲染进程池一样不直接 fork）：API进程中已有渲染、清理等后台线程，
+# fork 出的子进程可能继承被这些线程占用的锁
+_context = multiprocessing.get_context('forkserver')
+
+
+def _get_executor():
+    """延迟创建进程池"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=_context, initializer=init_worker)
+    return _executor
+
+
+def _discard_executor():
+    """工作进程异常退出（内存不足、段错误等）后进程池不可再用，丢弃后下次提交时重新创建（调用方持有 _lock）"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _admit(job_id, func, *args):
+    """
+    排队任务未超过 MAX_PENDING_JOBS 时提交到进程池（调用方持有 _lock），完成后从排队任务中移除。
+    进程池已损坏时重新创建进程池再提交一次
+
+    Raises:
+        QueueFullError: 排队任务过多
+    """
+    if len(_pending) >= MAX_PENDING_JOBS:
+        raise QueueFullError("分析任务过多，请稍后重试")
+    try:
+        future = _get_executor().submit(func, *args)
+    except BrokenProcessPool:
+        print("分析进程池已损坏，重新创建进程池")
+        _discard_executor()
+        future = _get_executor().submit(func, *args)
+    _pending[job_id] = future
+    return future
+
+
+def _clear_previous(session_dir, options):
+    """清理上一次任务遗留的结果和错误日志；完整分析的结果取代之前追加数据时累计的状态"""
+    for name in (RESULT_FILE, "error_log.txt"):
+        path = os.path.join(session_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+    if not options.get('batch_path'):
+        incremental.discard_state(session_dir)
+
+
+def _write_json_atomic(path, data):
+    """先写临时文件再替换，避免读取到写了一半的文件"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_result(session_dir):
+    """读取已完成任务的分析结果"""
+    result_path = os.path.join(session_dir, RESULT_FILE)
+    if not os.path.exists(result_path):
+        return None
+    with open(result_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def job_status(session):
+    """
+    根据注册表中的会话记录整理任务状态
+
+    Returns:
+        dict: 包含任务ID、状态、进度百分比和各阶段信息，会话尚未提交过任务时返回 None
+    """
+    if session is None or session.get('job_id') is None:
+        return None
+    stages = session.get('stages') or []
+    finished = sum(1 for item in stages if item['status'] in (DONE, SKIPPED))
+    # 并行执行时可能同时有多个阶段在运行
+    running = [item['name'] for item in stages if item['status'] == RUNNING]
+    return {
+        'job_id': session['job_id'],
+        'session_id': session['session_id'],
+        'status': session['status'],
+        'cached': session.get('cached', False),
+        'progress': round(finished / len(stages) * 100, 1) if stages else 0,
+        'current_stage': running[-1] if running else None,
+        'stages': stages,
+        'error': session.get('error')
+    }
+
+
+def _run_job(job_id, session_id, file_path, session_dir, options, cache_key=None, content_hash=None):
+    """
+    在工作进程中执行分析任务
+
+    Returns:
+        dict: 任务ID、最终状态和各步骤的指标明细，由主进程汇总到 /metrics
+    """
+    session_registry.update_session(session_id, status=RUNNING, started_at=time.time())
+    # 在任务开始执行时才清理，排队被拒绝的请求不会删除之前的结果
+    _clear_previous(session_dir, options)
+
+    def progress(stage, state, rows=None, result=None, reason=None):
+        session_registry.update_stage(session_id, stage, state, rows=rows, result=result, reason=reason)
+
+    try:
+        # 带有 batch_path 的任务把新的一批数据追加到会话，其余为完整分析
+        runner = incremental.run_append if options.get('batch_path') else run_pipeline
+        results = runner(session_id, file_path, session_dir, progress=progress,
+                         content_hash=content_hash, **options)
+        _write_json_atomic(os.path.join(session_dir, RESULT_FILE), results)
+        if cache_key:
+            result_cache.store(cache_key, session_id, session_dir, results)
+        session_registry.update_session(session_id, status=DONE, finished_at=time.time(),
+                                        artifacts=session_registry.scan_artifacts(session_dir))
+        return {'job_id': job_id, 'status': DONE, 'metrics': results.get('metrics', [])}
+    except Exception as e:
+        traceback.print_exc()
+        # 记录错误
+        with open(os.path.join(session_dir, "error_log.txt"), "w") as f:
+            f.write(str(e))
+        # 把仍处于执行中的阶段标记为失败
+        for item in (session_registry.get_session(session_id) or {}).get('stages') or []:
+            if item['status'] == RUNNING:
+                session_registry.update_stage(session_id, item['name'], FAILED)
+        session_registry.update_session(session_id, status=FAILED, error=f"分析过程中出错: {str(e)}",
+                                        finished_at=time.time())
+        # 失败前已完成的步骤仍然计入指标
+        return {'job_id': job_id, 'status': FAILED, 'metrics': metrics.drain()}
+
+
+def _on_job_finished(job_id, session_id, future):
+    """任务结束回调（运行在主进程中）"""
+    with _lock:
+        _pending.pop(job_id, None)
+    if future.cancelled():
+        session_registry.update_session(session_id, status=FAILED, error="分析任务已取消",
+                                        finished_at=time.time())
+        metrics.record_job(FAILED)
+        return
+    exc = future.exception()
+    if exc is not None:
+        # 工作进程异常退出等情况，任务自身来不及记录状态
+        session_registry.update_session(session_id, status=FAILED, error=f"分析进程异常退出: {exc}",
+                                        finished_at=time.time())
+        metrics.record_job(FAILED)
+        return
+    report = future.result()
+    metrics.record_job(report['status'], report['metrics'])
+
+
+def is_active(status):
+    """任务是否仍在排队或执行中"""
+    return status is not None and status.get('status') in (QUEUED, RUNNING)
+
+
+def submit_job(session_id, file_path, session_dir, options=None, content_hash=None, reuse_active=True):
+    """
+    提交分析任务，立即返回任务状态
+
+    Args:
+        session_id: 会话ID（需已在会话注册表中登记）
+        file_path: 上传文件路径
+        session_dir: 会话结果目录
+        options: 传给 run_pipeline 的额外参数；包含 batch_path 时为追加数据任务（见 incremental.run_append）
+        content_hash: 上传文件的内容哈希，提供时启用结果缓存
+        reuse_active: 会话已有任务在排队或执行时是否直接返回该任务；为 False 时抛出 SessionBusyError
+
+    Raises:
+        QueueFullError: 排队任务数已达上限
+        SessionDeletedError: 会话正在被清理
+        SessionBusyError: reuse_active 为 False 且会话已有任务在排队或执行
+    """
+    options = options or {}
+    status = job_status(session_registry.get_session(session_id))
+    if is_active(status):
+        # 同一会话已有任务在执行，直接返回现有任务
+        if not reuse_active:
+            raise SessionBusyError("该会话已有任务在执行，请稍后重试")
+        return status
+
+    # 原子地把会话切换为排队状态，避免与其他进程的提交或清理冲突
+    job_id = str(uuid.uuid4())
+    if not session_registry.begin_job(
+            session_id, job_id=job_id, status=QUEUED, cached=False, options=options,
+            stages=[{'name': stage, 'status': 'pending'} for stage in stage_names(options.get('analyses'))],
+            error=None, submitted_at=time.time(), started_at=None, finished_at=None):
+        status = job_status(session_registry.get_session(session_id))
+        if is_active(status):
+            if not reuse_active:
+                raise SessionBusyError("该会话已有任务在执行，请稍后重试")
+            return status
+        raise SessionDeletedError("会话已过期或正在清理，请重新上传文件")
+
+
+    # 相同内容、相同参数已经分析过时直接使用缓存结果；性能剖析需要真实执行一次，不使用缓存
+    use_cache = content_hash and not options.get('profile')
+    cache_key = result_cache.make_key(content_hash, options) if use_cache else None
+    if cache_key:
+        cached = result_cache.lookup(cache_key, session_id, session_dir)
+        if cached is not None:
+            now = time.time()
+            skipped = cached.get('skipped_analyses') or {}
+            _clear_previous(session_dir, options)
+            _write_json_atomic(os.path.join(session_dir, RESULT_FILE), cached)
+            session_registry.update_session(
+                session_id, status=DONE, cached=True, started_at=now, finished_at=now,
+                stages=[{'name': stage, 'status': SKIPPED, 'reason': skipped[stage]} if stage in skipped
+                        else {'name': stage, 'status': DONE}
+                        for stage in stage_names(options.get('analyses'))],
+                artifacts=session_registry.scan_artifacts(session_dir)
+            )
+            metrics.record_job('cached')
+            return job_status(session_registry.get_session(session_id))
+
+    with _lock:
+        try:
+            future = _admit(job_id, _run_job, job_id, session_id, file_path, session_dir,
+                            options, cache_key, content_hash)
+        except Exception as e:
+            # 没有提交成功（排队已满或重新创建的进程池也无法使用），会话不能停留在排队状态
+            session_registry.update_session(session_id, status=FAILED, error=str(e) or repr(e),
+                                            finished_at=time.time())
+            raise
+    future.add_done_callback(lambda f: _on_job_finished(job_id, session_id, f))
+    return job_status(session_registry.get_session(session_id))
+
+
+def submit_task(func, *args):
+    """
+    在分析工作进程中执行与会话任务无关的计算（例如数据概要），与分析任务共用排队上限
+
+    Returns:
+        Future: 计算结果
+
+    Raises:
+        QueueFullError: 排队任务过多
+    """
+    task_id = str(uuid.uuid4())
+    with _lock:
+        future = _admit(task_id, func, *args)
+    future.add_done_callback(lambda f: _discard_pending(task_id))
+    return future
+
+
+def _discard_pending(task_id):
+    with _lock:
+        _pending.pop(task_id, None)
+
+
+def shutdown():
+    """关闭进程池，取消尚未开始的任务"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
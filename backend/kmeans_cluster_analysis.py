@@ -1,257 +1,421 @@
-import pandas as pd
+import os
+
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import matplotlib.font_manager as fm
-import matplotlib as mpl
 
-# 导入自定义字体模块
-from embed_font import setup_chinese_font, get_font_prop
-
-# 使用统一的字体设置
-font_prop = setup_chinese_font()
-
-# 定义数据文件路径
-file_path = "first_clean_batch_100.csv"
-
-# 读取CSV文件
-df = pd.read_csv(file_path)
-
-# 构造年龄段字段
-df["年龄段"] = pd.cut(
-    df["年龄"],
-    bins=[0, 15, 18, 25, 35, 45, 100],
-    labels=["0-15", "15-18", "18-25", "26-35", "36-45", "45+"],
-    right=False
-)
-
-# 构造透视表
-pivot = df.pivot_table(
-    values="使用频率（次/周）",
-    index="职业",
-    columns="年龄段",
-    aggfunc="mean"
-)
-
-# 填补缺失值
-pivot = pivot.fillna(np.nan)
-
-# 作图
-plt.figure(figsize=(12, 6))
-sns.heatmap(pivot, annot=True, fmt=".1f", cmap="YlGnBu")
-
-plt.title("不同职业与年龄段用户的平均使用频率热力图", fontproperties=font_prop)
-plt.xlabel("年龄段", fontproperties=font_prop)
-plt.ylabel("职业", fontproperties=font_prop)
-plt.xticks(fontproperties=font_prop)
-plt.yticks(fontproperties=font_prop)
-plt.tight_layout()
-plt.savefig('heatmap.png', dpi=300, bbox_inches='tight', format='png')
-plt.close()
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from sklearn.decomposition import PCA
-import os
-import matplotlib as mpl
-from matplotlib.font_manager import FontProperties
-import io
-import base64
-from pathlib import Path
+import charts
+import cluster_sweep
+import metrics
 
 # 导入自定义字体模块
-from embed_font import setup_chinese_font, get_font_prop
+from embed_font import get_font_prop
+from data_loader import load_data
 
-import matplotlib.patches as patches
 
-def perform_kmeans_analysis(data_path, output_dir):
-    # 使用统一的字体设置
-    font_prop = setup_chinese_font()
-    
-    print(f"K-means分析使用字体: {plt.rcParams['font.family']}")
-    
-    # 读取清洗后的数据
-    df = pd.read_csv(data_path)
-    
-    # 指定用于聚类的特征列表 - 与用户代码完全匹配
-    target_features = [
-        'page_views',
-        'add_to_cart',
-        'purchase',
-        'use_count',
-        'days_to_first_use',
-        'days_since_last_use'
-    ]
-    
+# 指定用于聚类的特征列表 - 与用户代码完全匹配
+TARGET_FEATURES = [
+    'page_views',
+    'add_to_cart',
+    'purchase',
+    'use_count',
+    'days_to_first_use',
+    'days_since_last_use'
+]
+
+# 默认聚类数，与用户代码保持一致
+DEFAULT_CLUSTERS = 3
+# 肘部法则尝试的最大聚类数（不含）
+ELBOW_MAX_K = 10
+
+# 使用Google风格的配色方案
+# 定义Google风格的配色方案 - 鲜艳且有辨识度的颜色
+GOOGLE_COLORS = ['#4285F4', '#DB4437', '#F4B400', '#0F9D58', '#AB47BC', '#00ACC1', '#FF7043', '#9E9E9E']
+
+
+def build_features(df):
+    """
+    选取聚类特征
+
+    Args:
+        df: 清洗后的数据
+
+    Returns:
+        DataFrame: 只包含 TARGET_FEATURES 的特征表，缺失的特征以0填充
+    """
     # 检查这些特征是否存在于数据集中
     # 如果某些特征不存在，需要在日志中记录并通知用户
-    missing_features = [col for col in target_features if col not in df.columns]
+    # 读取时缩减过类型的列（int8、float32）统一按 float64 计算
+    features = df.reindex(columns=TARGET_FEATURES).astype(float)
+    missing_features = [col for col in TARGET_FEATURES if col not in df.columns]
     if missing_features:
         print(f"警告: 以下特征在数据集中不存在: {', '.join(missing_features)}")
         # 创建缺失特征并填充0值，确保分析可以继续
-        for feature in missing_features:
-            df[feature] = 0
-    
-    # 确保只使用指定的特征进行分析
-    X = df[target_features].fillna(0)  # 填充任何缺失值为0
-    
+        features[missing_features] = 0
+
     # 打印日志信息，显示使用的特征列
-    print(f"使用以下特征进行K-means聚类分析: {target_features}")
-    
-    # 数据标准化
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
-    
-    # 使用肘部法则确定最佳聚类数
-    inertia = []
-    K_range = range(1, min(10, len(X_scaled)))
-    
-    for k in K_range:
-        kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)  # 指定n_init=10
-        kmeans.fit(X_scaled)
-        inertia.append(kmeans.inertia_)
-    
-    # 定义创建图形的辅助函数
-    def create_figure_with_chinese_labels(title, xlabel, ylabel, fig_size=(10, 6)):
-        plt.figure(figsize=fig_size, facecolor='white')
-        
-        # 添加中文标签
-        plt.suptitle(title, fontproperties=font_prop, fontsize=16)
-        plt.xlabel(xlabel, fontproperties=font_prop, fontsize=14)
-        plt.ylabel(ylabel, fontproperties=font_prop, fontsize=14)
-    
-    # 保存肘部法则图
-    create_figure_with_chinese_labels('K-means聚类肘部法则图', '聚类数K', '惯性值 (Inertia)')
-    plt.plot(K_range, inertia, 'bo-')
-    plt.grid(True)
-    plt.xticks(fontsize=12)
-    plt.yticks(fontsize=12)
-    
-    elbow_image_path = os.path.join(output_dir, 'kmeans_elbow.png')
-    plt.tight_layout()
-    plt.savefig(elbow_image_path, dpi=300, bbox_inches='tight', format='png')
-    plt.close()
-    
-    # 直接使用K=3进行聚类，与用户代码保持一致
-    optimal_k = 3
-    kmeans = KMeans(n_clusters=optimal_k, random_state=42, n_init=10)
-    clusters = kmeans.fit_predict(X_scaled)
-    
-    # 将聚类结果添加到数据框
-    df['cluster'] = clusters
-    
-    # 使用PCA进行降维，方便可视化
-    pca = PCA(n_components=2)
-    X_pca = pca.fit_transform(X_scaled)
-    
-    # 绘制聚类结果 - 按照用户提供的代码逻辑实现
-    create_figure_with_chinese_labels('模块3 用户聚类分析结果', '主成分1', '主成分2', fig_size=(8, 6))
-    
-    # 使用Google风格的配色方案
-    # 定义Google风格的配色方案 - 鲜艳且有辨识度的颜色
-    google_colors = ['#4285F4', '#DB4437', '#F4B400', '#0F9D58', '#AB47BC', '#00ACC1', '#FF7043', '#9E9E9E']
-    
+    print(f"使用以下特征进行K-means聚类分析: {TARGET_FEATURES}")
+    return features
+
+
+def fit_scaler(features):
+    """按特征的均值和标准差拟合标准化器（缺失值填充为0）"""
+    from sklearn.preprocessing import StandardScaler
+
+    return StandardScaler().fit(features.fillna(0))
+
+
+def standardize(features):
+    """数据标准化（缺失值填充为0）"""
+    return fit_scaler(features).transform(features.fillna(0))
+
+
+def elbow_sweep(X_scaled, max_k=ELBOW_MAX_K, k_score=None):
+    """
+    使用肘部法则确定最佳聚类数：各聚类数同时拟合，样本多时使用 MiniBatchKMeans（见 cluster_sweep）
+
+    Args:
+        k_score: 在抽样上计算的聚类得分（silhouette / calinski_harabasz），用于自动选择聚类数
+
+    Returns:
+        dict: k（尝试的聚类数列表）、inertia（对应的惯性值）、models（聚类数 -> 拟合后的模型），
+            指定 k_score 时还有各聚类数的得分 scores
+    """
+    with metrics.step('kmeans_elbow', rows=len(X_scaled)):
+        return cluster_sweep.sweep(X_scaled, range(1, min(max_k, len(X_scaled))), score=k_score)
+
+
+def elbow_chart(sweep, n_clusters=None):
+    """肘部法则图的图表数据"""
+    return cluster_sweep.chart_data(sweep, n_clusters, DEFAULT_CLUSTERS)
+
+
+def fit_model(X_scaled, sweep=None, n_clusters=None):
+    """
+    执行最终聚类，返回拟合后的模型
+
+    Args:
+        sweep: elbow_sweep 的结果，其中已经拟合过该聚类数时直接使用，不重新拟合
+        n_clusters: 最终聚类数，未指定时按 sweep 中的聚类得分自动选择，没有得分时为 DEFAULT_CLUSTERS
+    """
+    sweep = sweep or {'k': [], 'models': {}}
+    with metrics.step('kmeans_fit', rows=len(X_scaled)):
+        return cluster_sweep.final_model(sweep, X_scaled,
+                                         cluster_sweep.choose_k(sweep, n_clusters, DEFAULT_CLUSTERS))
+
+
+def fit_clusters(X_scaled, sweep=None, n_clusters=None):
+    """执行最终聚类，返回每行的聚类标签（参数见 fit_model）"""
+    return fit_model(X_scaled, sweep, n_clusters).labels_
+
+
+def refresh_centers(model, X_scaled, clusters, sizes):
+    """
+    把新增的样本计入已有的聚类中心：每个中心更新为原有样本与新样本的均值，不重新拟合
+
+    Args:
+        model: 拟合后的 KMeans 模型（原地更新 cluster_centers_）
+        X_scaled: 新增样本标准化后的特征
+        clusters: 新增样本的聚类标签（由 model.predict 得到）
+        sizes: 加入新样本之前各聚类的样本数（聚类 -> 个数）
+    """
+    centers = model.cluster_centers_
+    for cluster in np.unique(clusters):
+        members = X_scaled[clusters == cluster]
+        total = sizes.get(cluster, 0) + len(members)
+        centers[cluster] += (members.sum(axis=0) - len(members) * centers[cluster]) / total
+
+
+def fit_pca(X_scaled):
+    """
+    使用PCA进行降维，方便可视化
+
+    Returns:
+        tuple: (拟合后的 PCA，前两个主成分)
+    """
+    from sklearn.decomposition import PCA
+
+    with metrics.step('kmeans_pca', rows=len(X_scaled)):
+        pca = PCA(n_components=2)
+        return pca, pca.fit_transform(X_scaled)
+
+
+def project_pca(X_scaled):
+    """使用PCA进行降维，方便可视化"""
+    return fit_pca(X_scaled)[1]
+
+
+def scatter_data(X_pca, clusters):
+    """
+    聚类散点图的图表数据
+
+    Returns:
+        dict: x / y 为前两个主成分，cluster 为每个点的聚类标签；
+            用户数超过 charts.SCATTER_MAX_POINTS 时只保留分层抽样的点，
+            sample 记录总数和抽样比例，density 为全部用户的密度网格
+    """
+    indices, fraction = charts.stratified_sample(clusters)
+    if indices is None:
+        return {
+            'x': charts.compact(X_pca[:, 0]),
+            'y': charts.compact(X_pca[:, 1]),
+            'cluster': charts.compact(clusters)
+        }
+    clusters = np.asarray(clusters)
+    return {
+        'x': charts.compact(X_pca[indices, 0]),
+        'y': charts.compact(X_pca[indices, 1]),
+        'cluster': charts.compact(clusters[indices]),
+        'sample': {'total': len(clusters), 'fraction': round(fraction, 4)},
+        'density': charts.density_grid(X_pca[:, 0], X_pca[:, 1])
+    }
+
+
+def _create_figure_with_chinese_labels(font_prop, title, xlabel, ylabel, fig_size=(10, 6)):
+    fig = charts.new_figure(fig_size)
+    ax = fig.add_subplot()
+
+    # 添加中文标签
+    fig.suptitle(title, fontproperties=font_prop, fontsize=16)
+    ax.set_xlabel(xlabel, fontproperties=font_prop, fontsize=14)
+    ax.set_ylabel(ylabel, fontproperties=font_prop, fontsize=14)
+    return fig, ax
+
+
+def draw_elbow(elbow):
+    """绘制肘部法则图"""
+    # 使用统一的字体设置
+    font_prop = get_font_prop()
+
+    fig, ax = _create_figure_with_chinese_labels(font_prop, 'K-means聚类肘部法则图', '聚类数K', '惯性值 (Inertia)')
+    ax.plot(elbow['k'], elbow['inertia'], 'bo-')
+    if 'scores' in elbow:
+        cluster_sweep.draw_scores(ax, elbow, font_prop)
+    ax.grid(True)
+    ax.tick_params(labelsize=12)
+    fig.tight_layout()
+    return fig
+
+
+def draw_clusters(scatter):
+    """绘制聚类结果 - 按照用户提供的代码逻辑实现"""
+    font_prop = get_font_prop()
+    x = np.asarray(scatter['x'], dtype=float)
+    y = np.asarray(scatter['y'], dtype=float)
+    clusters = np.asarray(scatter['cluster'])
+
+    fig, ax = _create_figure_with_chinese_labels(font_prop, '模块3 用户聚类分析结果', '主成分1', '主成分2', fig_size=(8, 6))
+
+    # 用户数很多时只绘制抽样的点：灰色背景为全部用户的密度，点不加白边并栅格化，绘制时间与用户数无关
+    sampled = 'sample' in scatter
+    if sampled:
+        from matplotlib.colors import LogNorm
+
+        density = scatter['density']
+        counts = np.ma.masked_equal(np.asarray(density['counts'], dtype=float), 0)
+        ax.pcolormesh(density['x_edges'], density['y_edges'], counts, cmap='Greys', norm=LogNorm(), alpha=0.6,
+                      rasterized=True)
+        ax.set_title(charts.sample_note(scatter['sample']) + '，灰色背景为全部用户的分布',
+                     fontproperties=font_prop, fontsize=10)
+
     # 按照用户代码逻辑绘制散点图，但使用Google配色
     for i, c in enumerate(sorted(np.unique(clusters))):
-        plt.scatter(
-            X_pca[clusters == c, 0],
-            X_pca[clusters == c, 1],
-            color=google_colors[i % len(google_colors)],  # 使用Google配色
+        ax.scatter(
+            x[clusters == c],
+            y[clusters == c],
+            color=GOOGLE_COLORS[i % len(GOOGLE_COLORS)],  # 使用Google配色
             label=f'Cluster {c}',
-            alpha=0.7,  # 添加透明度使图形更美观
-            edgecolors='w',  # 添加白色边缘增强可视效果
-            s=70  # 稍微增大点的大小
+            alpha=0.4 if sampled else 0.7,  # 添加透明度使图形更美观
+            edgecolors='none' if sampled else 'w',  # 添加白色边缘增强可视效果
+            s=8 if sampled else 70,  # 稍微增大点的大小
+            rasterized=sampled
         )
-    
+
     # 添加网格线
-    plt.grid(True)
-    
+    ax.grid(True)
+
     # 添加图例
-    plt.legend(prop=font_prop, fontsize=12)
-    plt.xticks(fontsize=12)
-    plt.yticks(fontsize=12)
-    
-    # 保存聚类图 - 使用更高的DPI和更好的图像质量
-    cluster_image_path = os.path.join(output_dir, 'kmeans_clusters.png')
-    plt.tight_layout()
-    plt.savefig(cluster_image_path, dpi=300, bbox_inches='tight', format='png')
-    plt.close()
-    
+    ax.legend(prop=font_prop, fontsize=12)
+    ax.tick_params(labelsize=12)
+    fig.tight_layout()
+    return fig
+
+
+def summarize_clusters(features, clusters):
+    """
+    统计每个聚类的用户数量和特征均值
+
+    Returns:
+        dict: cluster_stats 和 cluster_profiles（均为记录列表）
+    """
+    labeled = features.assign(cluster=clusters)
+
     # 保存每个聚类的用户数量统计
-    cluster_stats = df['cluster'].value_counts().reset_index()
+    cluster_stats = labeled['cluster'].value_counts().reset_index()
     cluster_stats.columns = ['聚类', '用户数量']
-    
+
     # 计算聚类结果的特征统计信息 - 确保只使用目标特征
-    cluster_profiles = df.groupby('cluster')[target_features].mean().reset_index()
-    
-    # 保存处理后的带聚类标签的数据
-    output_data_path = os.path.join(output_dir, 'clustered_data.csv')
-    df.to_csv(output_data_path, index=False)
-    
+    cluster_profiles = labeled.groupby('cluster')[TARGET_FEATURES].mean().reset_index()
     return {
-        'elbow_image': elbow_image_path,
-        'cluster_image': cluster_image_path,
         'cluster_stats': cluster_stats.to_dict('records'),
-        'cluster_profiles': cluster_profiles.to_dict('records'),
-        'output_data': output_data_path
+        'cluster_profiles': cluster_profiles.to_dict('records')
     }
 
 
-# 归一化宽度
-max_width = 600
-
-# 计算漏斗阶段的用户数量和转化率
-funnel_stages = {
-    "页面浏览": df.iloc[:, 1].sum(),
-    "加入购物车": df.iloc[:, 2].sum(),
-    "提交订单": df.iloc[:, 3].sum(),
-    "支付成功": df.iloc[:, 4].sum()
-}
-
-stages = list(funnel_stages.keys())
-users = list(funnel_stages.values())
-conversion_rate = [100 * users[i] / users[0] for i in range(len(users))]
-
-# 归一化用户数
-norm_users = [u / max(users) * max_width for u in users]
-
-fig, ax = plt.subplots(figsize=(8, 6))
-height = 1.0
-gap = 0.3
-blue_color = '#4A90E2'  # 柔和蓝色
-
-for i in range(len(stages) - 1):
-    top_width = norm_users[i]
-    bottom_width = norm_users[i + 1]
-    y = -i * (height + gap)
-    polygon = patches.Polygon([
-        [(max_width - top_width) / 2, y],
-        [(max_width + top_width) / 2, y],
-        [(max_width + bottom_width) / 2, y - height],
-        [(max_width - bottom_width) / 2, y - height]
-    ], closed=True, facecolor=blue_color, edgecolor='black')
-    ax.add_patch(polygon)
-    label = f"{stages[i]}：{users[i]}人（{conversion_rate[i]:.1f}%）"
-    ax.text((max_width + top_width) / 2 + 20, y - height / 2,
-            label, ha='left', va='center', fontsize=12, fontproperties=font_prop)
-
-# 最后一层（支付成功）封底 + 图例
-last_width = norm_users[-1]
-y = - (len(stages) - 1) * (height + gap)
-polygon = patches.Polygon([
-    [(max_width - last_width) / 2, y],
-    [(max_width + last_width) / 2, y],
-    [(max_width + last_width) / 2, y - height],
-    [(max_width - last_width) / 2, y - height]
-], closed=True, facecolor=blue_color, edgecolor='black')
-ax.add_patch(polygon)
-label = f"{stages[-1]}：{users[-1]}人（{conversion_rate[-1]:.1f}%）"
-ax.text((max_width + last_width) / 2 + 20, y - height / 2,
-        label, ha='left', va='center', fontsize=12, fontproperties=font_prop)
-
-# 配置图像
-ax.set_xlim(0, max_width + 250)
-ax.set_ylim(-len(stages) * (height + gap) + gap, gap)
-ax.axis('off')
-plt.title("用户转化漏斗图", fontsize=16, fontproperties=font_prop)
-plt.tight_layout()
-plt.show()
\ No newline at end of file
+def cluster_totals(features, clusters):
+    """
+    每个聚类的样本数，以及各特征的合计和非空值个数（不同批次可以用 merge_cluster_totals 合并）
+
+    Returns:
+        dict: sizes 为聚类 -> 样本数，sums / counts 为聚类 x 特征的合计和个数
+    """
+    grouped = features[TARGET_FEATURES].groupby(np.asarray(clusters))
+    return {'sizes': grouped.size(), 'sums': grouped.sum(), 'counts': grouped.count()}
+
+
+def merge_cluster_totals(totals, other):
+    """合并两批数据的 cluster_totals"""
+    return {
+        'sizes': totals['sizes'].add(other['sizes'], fill_value=0).astype(int),
+        'sums': totals['sums'].add(other['sums'], fill_value=0),
+        'counts': totals['counts'].add(other['counts'], fill_value=0).astype(int)
+    }
+
+
+def summarize_totals(totals):
+    """由 cluster_totals 得到与 summarize_clusters 相同结构的用户数量和特征均值"""
+    cluster_stats = totals['sizes'].sort_values(ascending=False).reset_index()
+    cluster_stats.columns = ['聚类', '用户数量']
+    counts = totals['counts']
+    cluster_profiles = (totals['sums'] / counts.where(counts > 0)).rename_axis('cluster').reset_index()
+    return {
+        'cluster_stats': cluster_stats.to_dict('records'),
+        'cluster_profiles': cluster_profiles.to_dict('records')
+    }
+
+
+def scatter_totals(X_pca, clusters, max_points=charts.SCATTER_MAX_POINTS):
+    """
+    聚类散点图的累计汇总（追加数据时用 merge_scatter_totals 合并新的一批），大小与用户数无关：
+    最多保留约 max_points 个抽样的点，以及这批数据范围上的密度网格计数
+
+    Returns:
+        dict: points 为保留的 (x, y, 聚类) 数组，total 为全部点数，x_edges / y_edges / counts 为密度网格
+    """
+    X_pca = np.asarray(X_pca, dtype=float)
+    clusters = np.asarray(clusters)
+    indices, _ = charts.stratified_sample(clusters, max_points)
+    if indices is None:
+        indices = np.arange(len(clusters))
+    counts, x_edges, y_edges = np.histogram2d(X_pca[:, 0], X_pca[:, 1], bins=charts.DENSITY_BINS)
+    return {
+        'points': np.column_stack([X_pca[indices, :2], clusters[indices]]),
+        'total': len(clusters),
+        'max_points': max(max_points, len(indices)),
+        'x_edges': x_edges,
+        'y_edges': y_edges,
+        'counts': counts
+    }
+
+
+def merge_scatter_totals(totals, X_pca, clusters):
+    """
+    把新的一批点计入 scatter_totals：保留的点按蓄水池抽样替换，每个点被保留的概率相同；
+    密度网格沿用第一批数据的范围，范围外的点计入边缘的格子
+
+    Returns:
+        dict: 合并后的汇总（不修改传入的 totals）
+    """
+    X_pca = np.asarray(X_pca, dtype=float)
+    new_points = np.column_stack([X_pca[:, :2], np.asarray(clusters)])
+    points, total, capacity = totals['points'], totals['total'], totals['max_points']
+    # 保留的点未满时直接加入
+    fill = min(max(capacity - len(points), 0), len(new_points))
+    points = np.vstack([points, new_points[:fill]])
+    if fill < len(new_points):
+        # 第 i 个点（从0开始的全局序号）以 capacity / (i + 1) 的概率替换一个随机位置
+        rng = np.random.default_rng(total)
+        seen = total + np.arange(fill, len(new_points))
+        slots = rng.integers(0, seen + 1)
+        replaced = slots < capacity
+        points[slots[replaced]] = new_points[fill:][replaced]
+
+    x_edges, y_edges = totals['x_edges'], totals['y_edges']
+    counts, _, _ = np.histogram2d(np.clip(X_pca[:, 0], x_edges[0], x_edges[-1]),
+                                  np.clip(X_pca[:, 1], y_edges[0], y_edges[-1]), bins=[x_edges, y_edges])
+    return dict(totals, points=points, total=total + len(new_points), counts=totals['counts'] + counts)
+
+
+def scatter_from_totals(totals):
+    """由 scatter_totals 得到与 scatter_data 相同结构的图表数据"""
+    points = totals['points']
+    clusters = points[:, 2].astype(int)
+    scatter = {
+        'x': charts.compact(points[:, 0]),
+        'y': charts.compact(points[:, 1]),
+        'cluster': charts.compact(clusters)
+    }
+    if totals['total'] > len(points):
+        scatter['sample'] = {'total': totals['total'], 'fraction': round(len(points) / totals['total'], 4)}
+        scatter['density'] = {
+            'x_edges': charts.compact(totals['x_edges']),
+            'y_edges': charts.compact(totals['y_edges']),
+            'counts': totals['counts'].T.astype(int).tolist()
+        }
+    return scatter
+
+
+def attach_clusters(df, clusters):
+    """把聚类标签添加到数据框（用于写出 clustered_data）"""
+    df = load_data(df)
+    df['cluster'] = clusters
+    return df
+
+
+def assemble_results(elbow, scatter, summary):
+    """
+    汇总K-means分析的输出
+
+    Returns:
+        dict: result 为分析结果，charts 为图表名 -> 图表数据，files 为要写入结果目录的其他文件
+    """
+    return {
+        'result': summary,
+        'charts': {'kmeans_elbow': elbow, 'kmeans_clusters': scatter},
+        'files': {}
+    }
+
+
+def perform_kmeans_analysis(data, output_dir, save_data=True, n_clusters=None, k_score=None):
+    """
+    执行完整的K-means分析（依次调用上面的各个步骤，流水线中这些步骤是计算图中的独立节点）
+
+    Args:
+        data: CSV文件路径或清洗后的 DataFrame
+        output_dir: 图片和数据文件的输出目录
+        save_data: 是否写出带聚类标签的 clustered_data.csv，否则在结果中返回 clustered_data
+        n_clusters: 最终聚类数，未指定时按 k_score 得分自动选择，没有指定 k_score 时为 DEFAULT_CLUSTERS
+        k_score: 肘部法则中在抽样上计算的聚类得分（silhouette / calinski_harabasz）
+    """
+    # 读取清洗后的数据（文件路径或内存中的DataFrame）
+    df = load_data(data)
+    features = build_features(df)
+    X_scaled = standardize(features)
+    sweep = elbow_sweep(X_scaled, k_score=k_score)
+    clusters = fit_clusters(X_scaled, sweep, n_clusters)
+    output = assemble_results(
+        elbow_chart(sweep, n_clusters),
+        scatter_data(project_pca(X_scaled), clusters),
+        summarize_clusters(features, clusters)
+    )
+    results = charts.write_charts({**output['result'], 'charts': output['charts']}, output_dir)
+
+    df = attach_clusters(df, clusters)
+    if save_data:
+        # 保存处理后的带聚类标签的数据
+        output_data_path = os.path.join(output_dir, 'clustered_data.csv')
+        df.to_csv(output_data_path, index=False)
+        results['output_data'] = output_data_path
+    else:
+        # 由调用方决定何时写出带聚类标签的数据
+        results['clustered_data'] = df
+
+    return results
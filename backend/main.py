@@ -1,42 +1,30 @@
 import os
-import shutil
 import sys
 
-# 在导入任何使用matplotlib的模块前设置环境变量
-# 创建隔离的配置目录
-config_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mpl_config')
-os.makedirs(config_dir, exist_ok=True)
+# matplotlib环境隔离和编码补丁在分析工作进程和渲染进程启动时应用（见 stage_executor.init_worker、renderer_pool），
+# API进程本身不导入 pandas / matplotlib / sklearn 等重量级库，启动更快
 
-# 设置环境变量，完全隔离matplotlib环境
-os.environ['MPLCONFIGDIR'] = config_dir
-os.environ['MATPLOTLIBRC'] = os.path.join(config_dir, 'matplotlibrc')
-os.environ['MPLBACKEND'] = 'Agg'  # 使用非交互式后端
-os.environ['MATPLOTLIBDATA'] = config_dir  # 重定向matplotlib数据目录
-
-# 创建空的配置文件
-with open(os.environ['MATPLOTLIBRC'], 'w', encoding='utf-8') as f:
-    f.write('# Empty config file\n')
-
-# 禁用matplotlib缓存
-os.environ['MPL_CACHE_DIR'] = config_dir
-
-# 导入并应用matplotlib补丁，修复编码问题
-from matplotlib_patch import apply_patch
-apply_patch()
-
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 import uuid
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import uvicorn
+import asyncio
 
-# 导入我们的分析脚本
-from clean_data import clean_data
-from kmeans_cluster_analysis import perform_kmeans_analysis
-from draw_heatmap import generate_heatmap
-from funnel_analysis_funnel_shape import generate_funnel
+# 后台分析任务队列（分析脚本在工作进程中导入和执行）
+import analysis_stages
+import charts
+import data_profile
+import incremental
+import job_queue
+import metrics
+import progress_stream
+import render_cache
+import renderer_pool
+import retention
+import session_registry
+import upload_store
 
 app = FastAPI(title="营销大数据分析平台")
 
@@ -49,13 +37,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 创建必要的文件夹
-os.makedirs("uploads", exist_ok=True)
-os.makedirs("results", exist_ok=True)
-
-# 挂载静态文件目录，使得图片可以通过URL访问
-app.mount("/static", StaticFiles(directory="results"), name="static")
-
 @app.get("/")
 def read_root():
     return {"message": "欢迎使用营销大数据分析平台API"}
@@ -71,10 +52,9 @@ async def upload_file(file: UploadFile = File(...)):
     session_dir = os.path.join("results", session_id)
     os.makedirs(session_dir, exist_ok=True)
     
-    # 保存上传的文件
-    file_path = os.path.join("uploads", f"{session_id}_{file.filename}")
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # 保存上传的文件：边接收边计算内容哈希，相同内容只保存一份
+    file_path, content_hash, size = await upload_store.save_upload(file)
+    session_registry.create_session(session_id, file.filename, file_path, size, content_hash)
     
     return {
         "session_id": session_id,
@@ -82,79 +62,235 @@ async def upload_file(file: UploadFile = File(...)):
         "message": "文件上传成功，可以开始数据分析"
     }
 
+@app.on_event("startup")
+def prepare_directories():
+    # 创建必要的文件夹
+    os.makedirs("uploads", exist_ok=True)
+    os.makedirs("results", exist_ok=True)
+
+@app.on_event("startup")
+def start_retention_collector():
+    retention.start()
+
+@app.on_event("startup")
+def start_renderer_pool():
+    # 渲染进程在后台预加载 matplotlib 和字体，API 启动不必等待
+    renderer_pool.start()
+
+@app.on_event("shutdown")
+def shutdown_job_queue():
+    retention.stop()
+    renderer_pool.stop()
+    job_queue.shutdown()
+
 @app.post("/analyze/{session_id}")
-async def analyze_data(session_id: str):
-    # 验证会话存在
+async def analyze_data(session_id: str, save_data: Optional[bool] = None,
+                       data_format: Optional[str] = None, profile: bool = False,
+                       analyses: Optional[str] = None, n_clusters: Optional[int] = None,
+                       k_score: Optional[str] = None, render: Optional[str] = None):
+    # 从会话注册表查找会话及其上传文件
     session_dir = os.path.join("results", session_id)
-    if not os.path.exists(session_dir):
-        raise HTTPException(status_code=404, detail="会话不存在，请先上传文件")
+    session = session_registry.get_session(session_id)
+    if session is not None and session["status"] == "deleting":
+        raise HTTPException(status_code=404, detail="会话已过期，请重新上传文件")
+    if session is None:
+        # 注册表启用前上传的会话：文件以会话ID为前缀保存在 uploads 目录，找到后登记到注册表
+        if not os.path.exists(session_dir):
+            raise HTTPException(status_code=404, detail="会话不存在，请先上传文件")
+        uploaded_files = [f for f in os.listdir("uploads") if f.startswith(session_id)]
+        if not uploaded_files:
+            raise HTTPException(status_code=404, detail="未找到相关文件，请重新上传")
+        legacy_path = os.path.join("uploads", uploaded_files[0])
+        session_registry.create_session(session_id, uploaded_files[0], legacy_path,
+                                        os.path.getsize(legacy_path))
+        session = session_registry.get_session(session_id)
+    
+    file_path, content_hash = session["upload_path"], session["content_hash"]
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="未找到相关文件，请重新上传")
     
-    # 查找该会话关联的文件
-    uploaded_files = [f for f in os.listdir("uploads") if f.startswith(session_id)]
-    if not uploaded_files:
+    # 将分析任务放入后台进程池，立即返回任务ID，通过 /results/{session_id} 查询进度
+    # save_data 控制是否写出清洗后/聚类后的数据文件，data_format 指定其存储格式（csv/parquet/arrow），
+    # 未指定时使用服务端默认配置；profile=true 时记录 cProfile 和 tracemalloc 报告；
+    # analyses 为逗号分隔的分析名（见 /analyses），未指定时执行K-means、热力图和漏斗图；
+    # n_clusters 为K-means的最终聚类数，只有受它影响的节点会重新计算；
+    # k_score（silhouette / calinski_harabasz）在肘部法则中抽样计算聚类得分，K-means 未指定 n_clusters 时
+    # 和 RFM 按得分最高的聚类数聚类；
+    # render=data 时不渲染图片，结果的 charts 字段中返回各图表的数据，由前端绘制
+    options = {}
+    if analyses:
+        try:
+            requested = analysis_stages.resolve([name.strip() for name in analyses.split(",") if name.strip()])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if requested != analysis_stages.DEFAULT_ANALYSES:
+            options["analyses"] = requested
+    params = {}
+    if n_clusters is not None:
+        if not 2 <= n_clusters <= 10:
+            raise HTTPException(status_code=400, detail="n_clusters 必须在 2 到 10 之间")
+        # 与默认值相同时不记录，和未指定的请求共用结果缓存；指定了 k_score 时记录，不按得分选择
+        if n_clusters != 3 or k_score is not None:
+            params["kmeans"] = {"n_clusters": n_clusters}
+    if k_score is not None:
+        if k_score not in ("silhouette", "calinski_harabasz"):
+            raise HTTPException(status_code=400, detail="k_score 只能是 silhouette 或 calinski_harabasz")
+        params.setdefault("kmeans", {})["k_score"] = k_score
+        params["rfm"] = {"k_score": k_score}
+    if params:
+        options["params"] = params
+    if render is not None:
+        if render not in charts.RENDER_MODES:
+            raise HTTPException(status_code=400, detail="render 只能是 png 或 data")
+        # 默认的 png 不记录，和未指定的请求共用结果缓存
+        if render != charts.RENDER_PNG:
+            options["render"] = render
+    if save_data is not None:
+        options["write_artifacts"] = save_data
+    if data_format is not None:
+        if data_format not in ("csv", "parquet", "arrow"):
+            raise HTTPException(status_code=400, detail="data_format 只能是 csv、parquet 或 arrow")
+        options["data_format"] = data_format
+    if profile:
+        options["profile"] = True
+    try:
+        status = job_queue.submit_job(session_id, file_path, session_dir, options, content_hash)
+    except job_queue.QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except job_queue.SessionDeletedError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    return {
+        "session_id": session_id,
+        "job_id": status["job_id"],
+        "status": status["status"],
+        "cached": status.get("cached", False),
+        "message": "分析任务已提交，请通过 /progress/{session_id} 订阅进度或通过 /results/{session_id} 查询"
+    }
+
+@app.post("/append/{session_id}")
+async def append_data(session_id: str, file: UploadFile = File(...)):
+    # 把新的一批数据追加到已有会话：只清洗新数据并合并到会话累计的汇总中，再重新生成分析结果，
+    # 使用该会话上一次分析的参数；进度和结果与 /analyze 一样通过 /progress 和 /results 获取
+    if not file.filename.endswith('.csv'):
+        raise HTTPException(status_code=400, detail="只接受CSV文件")
+    session_dir = os.path.join("results", session_id)
+    session = session_registry.get_session(session_id)
+    if session is None or session["status"] == "deleting":
+        raise HTTPException(status_code=404, detail="会话不存在或已过期，请重新上传文件")
+    if job_queue.is_active(job_queue.job_status(session)):
+        raise HTTPException(status_code=409, detail="该会话已有任务在执行，请稍后重试")
+    file_path = session["upload_path"]
+    if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="未找到相关文件，请重新上传")
     
-    file_path = os.path.join("uploads", uploaded_files[0])
+    batch_path = await upload_store.save_batch(file, session_dir)
+    if incremental.read_header(batch_path) != incremental.read_header(file_path):
+        os.remove(batch_path)
+        raise HTTPException(status_code=400, detail="追加数据的列与会话数据不一致")
     
+    previous = session["options"] or {}
+    options = {key: previous[key] for key in ("analyses", "params", "render", "write_artifacts", "data_format")
+               if key in previous}
+    options["batch_path"] = batch_path
     try:
-        # 步骤1: 数据清洗
-        cleaned_data_path = os.path.join(session_dir, "cleaned_data.csv")
-        cleaning_stats = clean_data(file_path, cleaned_data_path)
-        
-        # 保存清洗统计信息到文件
-        cleaning_stats_path = os.path.join(session_dir, "cleaning_stats.json")
-        with open(cleaning_stats_path, "w") as f:
-            import json
-            json.dump(cleaning_stats, f, indent=2)
-        
-        # 步骤2: K-means聚类分析
-        kmeans_results = perform_kmeans_analysis(cleaned_data_path, session_dir)
-        
-        # 步骤3: 生成热力图
-        heatmap_results = generate_heatmap(cleaned_data_path, session_dir)
-        
-        # 步骤4: 生成漏斗图
-        funnel_results = generate_funnel(cleaned_data_path, session_dir)
-        
-        # 处理图片路径，将其转换为可访问的URL
-        image_urls = {
-            'kmeans_elbow': f"/static/{session_id}/{os.path.basename(kmeans_results['elbow_image'])}",
-            'kmeans_clusters': f"/static/{session_id}/{os.path.basename(kmeans_results['cluster_image'])}",
-            'heatmap': f"/static/{session_id}/{os.path.basename(heatmap_results['heatmap_image'])}",
-            'funnel': f"/static/{session_id}/{os.path.basename(funnel_results['funnel_image'])}"
-        }
-        
-        # 返回分析结果和图像URL
-        return {
-            "session_id": session_id,
-            "status": "success",
-            "image_urls": image_urls,
-            "cleaning_stats": cleaning_stats,
-            "kmeans_results": {
-                "cluster_stats": kmeans_results["cluster_stats"],
-                "cluster_profiles": kmeans_results["cluster_profiles"]
-            },
-            "heatmap_results": {
-                "behavior_stats": heatmap_results["behavior_stats"],
-                "top_behaviors": heatmap_results["top_behaviors"]
-            },
-            "funnel_results": {
-                "funnel_data": funnel_results["funnel_data"]
-            }
-        }
+        status = job_queue.submit_job(session_id, file_path, session_dir, options, reuse_active=False)
+    except job_queue.QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except job_queue.SessionDeletedError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except job_queue.SessionBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     
-    except Exception as e:
-        # 记录错误
-        error_file = os.path.join(session_dir, "error_log.txt")
-        with open(error_file, "w") as f:
-            f.write(str(e))
-        
-        raise HTTPException(status_code=500, detail=f"分析过程中出错: {str(e)}")
+    return {
+        "session_id": session_id,
+        "job_id": status["job_id"],
+        "status": status["status"],
+        "message": "追加任务已提交，请通过 /progress/{session_id} 订阅进度或通过 /results/{session_id} 查询"
+    }
+
+@app.get("/profile/{session_id}")
+async def profile_data(session_id: str):
+    # 上传文件的数据概要：各列的类型、空值比例、不同值个数、分位数和最常见的值，
+    # 在分析工作进程中分块扫描一遍文件计算，结果按上传内容缓存
+    session = session_registry.get_session(session_id)
+    if session is None or session["status"] == "deleting":
+        raise HTTPException(status_code=404, detail="会话不存在或已过期，请重新上传文件")
+    file_path, content_hash = session["upload_path"], session["content_hash"]
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="未找到相关文件，请重新上传")
+    session_registry.touch(session_id)
+    
+    profile = data_profile.load_cached(file_path, content_hash)
+    if profile is None:
+        try:
+            future = job_queue.submit_task(data_profile.profile_upload, file_path, content_hash)
+        except job_queue.QueueFullError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        try:
+            profile = await asyncio.wrap_future(future)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"无法读取上传文件: {e}")
+    return {"session_id": session_id, **profile}
+
+@app.get("/analyses")
+def list_analyses():
+    # 列出可以通过 /analyze?analyses= 指定的分析及其需要的数据列
+    return {
+        "default": analysis_stages.DEFAULT_ANALYSES,
+        "analyses": [
+            {
+                "name": stage.name,
+                "title": stage.title,
+                "required_columns": [list(group) for group in stage.required_columns],
+                "requires": list(stage.requires)
+            }
+            for stage in analysis_stages.STAGES.values()
+        ]
+    }
+
+@app.get("/progress/{session_id}")
+def stream_progress(session_id: str, request: Request):
+    # 以 Server-Sent Events 推送分析进度和各阶段完成后的结果摘要，任务结束后关闭连接
+    session = session_registry.get_session(session_id)
+    if session is None or session["status"] == "deleting":
+        raise HTTPException(status_code=404, detail="会话不存在或已过期，请重新上传文件")
+    return StreamingResponse(
+        progress_stream.event_stream(session_id, request.is_disconnected),
+        media_type="text/event-stream",
+        # 禁止缓存和 nginx 缓冲，事件产生后立即送达浏览器
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/results/{session_id}")
 def get_results(session_id: str):
     # 获取已完成分析的结果
     session_dir = os.path.join("results", session_id)
+    session = session_registry.get_session(session_id)
+    if session is not None and session["status"] == "deleting":
+        raise HTTPException(status_code=404, detail="会话已过期，分析结果已被清理")
+    if session is not None:
+        session_registry.touch(session_id)
+        # 通过后台任务提交的分析：返回任务状态和各阶段进度
+        job_status = job_queue.job_status(session)
+        if job_status is None:
+            return {"status": "pending", "session_id": session_id, "message": "分析尚未开始"}
+        response = {
+            "session_id": session_id,
+            "job_id": job_status["job_id"],
+            "status": job_status["status"],
+            "progress": job_status["progress"],
+            "current_stage": job_status["current_stage"],
+            "stages": job_status["stages"]
+        }
+        if job_status["status"] == job_queue.DONE:
+            response.update(job_queue.read_result(session_dir) or {})
+            response["status"] = job_queue.DONE
+        elif job_status["status"] == job_queue.FAILED:
+            response["message"] = job_status["error"] or "分析失败"
+        return response
+    
+    # 注册表启用前的会话：扫描结果目录
     if not os.path.exists(session_dir):
         raise HTTPException(status_code=404, detail="未找到该会话的分析结果")
     
@@ -183,19 +319,72 @@ def get_results(session_id: str):
         "image_urls": image_urls
     }
 
+@app.get("/static/{session_id}/{file_name}")
+def get_static(session_id: str, file_name: str, size: str = render_cache.DEFAULT_SIZE):
+    # 分析结果中的图片：第一次请求时根据保存的图表数据渲染，渲染结果缓存在磁盘上；
+    # size 选择分辨率（preview 缩略图、screen 屏幕查看、print 打印下载）
+    if size not in render_cache.SIZES:
+        raise HTTPException(status_code=400, detail=f"size 只能是 {'、'.join(render_cache.SIZES)}")
+    # 路径参数本身不含 "/"，这里再排除 ".." 之类的相对路径
+    if session_id.startswith(".") or file_name.startswith("."):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    session_dir = os.path.join("results", session_id)
+    if session_registry.get_session(session_id) is not None:
+        session_registry.touch(session_id)
+    content = render_cache.render(session_dir, file_name, size)
+    if content is not None:
+        return Response(content=content, media_type="image/png")
+    # 旧会话中已经渲染好的图片和其他结果文件直接返回
+    file_path = os.path.join(session_dir, file_name)
+    if not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    return FileResponse(path=file_path)
+
 @app.get("/download/{session_id}/{file_name}")
 def download_file(session_id: str, file_name: str):
     # 提供下载分析结果的功能
-    file_path = os.path.join("results", session_id, file_name)
+    session_dir = os.path.join("results", session_id)
+    file_path = os.path.join(session_dir, file_name)
+    
+    if not os.path.exists(file_path) and file_name.endswith(".csv"):
+        # 中间数据以Parquet/Arrow保存时，按需转换为CSV提供下载
+        import storage
+        file_path = storage.export_csv(session_dir, file_name[:-len(".csv")]) or file_path
     
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="文件不存在")
     
+    if session_registry.get_session(session_id) is not None:
+        session_registry.touch(session_id)
+    
     return FileResponse(
         path=file_path, 
         filename=file_name,
         media_type='application/octet-stream'
     )
 
+@app.get("/metrics")
+def get_metrics():
+    # Prometheus 文本格式的任务与步骤指标（每个API进程单独统计）
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/storage")
+def storage_stats():
+    # 查看磁盘清理统计：累计释放的空间、删除的会话数和当前占用
+    return retention.get_stats()
+
+@app.get("/admin/renderers")
+def renderer_status():
+    # 渲染进程池的健康检查：各渲染进程的任务数、回收次数，以及向渲染进程发送空任务的响应时间
+    status = renderer_pool.status()
+    if not status["healthy"]:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+@app.post("/admin/gc")
+def run_garbage_collection():
+    # 立即执行一次清理，返回本次释放的空间
+    return retention.collect()
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -4,8 +4,42 @@ import sys
 import importlib
 import codecs
 
+# 隔离的matplotlib配置目录
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mpl_config')
+
+_environment_configured = False
+
+
+def configure_environment():
+    """
+    在导入matplotlib前隔离其运行环境（配置目录、后端、缓存目录），避免读取存在编码问题的系统配置
+    只在第一次调用时执行，由工作进程初始化和字体模块在真正需要绘图时调用
+    """
+    global _environment_configured
+    if _environment_configured:
+        return
+    # 创建空的样式目录，防止matplotlib读取系统样式
+    os.makedirs(os.path.join(CONFIG_DIR, 'stylelib'), exist_ok=True)
+
+    # 设置环境变量，完全隔离matplotlib环境
+    os.environ['MPLCONFIGDIR'] = CONFIG_DIR
+    os.environ['MATPLOTLIBRC'] = os.path.join(CONFIG_DIR, 'matplotlibrc')
+    os.environ['MPLBACKEND'] = 'Agg'  # 使用非交互式后端
+    os.environ['MATPLOTLIBDATA'] = CONFIG_DIR  # 重定向matplotlib数据目录
+
+    # 创建空的配置文件
+    if not os.path.exists(os.environ['MATPLOTLIBRC']):
+        with open(os.environ['MATPLOTLIBRC'], 'w', encoding='utf-8') as f:
+            f.write('# Empty config file\n')
+
+    # 禁用matplotlib缓存
+    os.environ['MPL_CACHE_DIR'] = CONFIG_DIR
+    _environment_configured = True
+
+
 def apply_patch():
     """应用补丁，修复matplotlib的编码问题"""
+    configure_environment()
     try:
         # 导入matplotlib
         import matplotlib
@@ -0,0 +1,198 @@
+"""
+分析步骤的耗时与资源指标
+读取、清洗、K-means 肘部法则、最终聚类、PCA、各图表绘制和中间数据写出等步骤都会记录
+墙钟时间、CPU时间、常驻内存和处理的行数。
+常驻内存记录步骤结束时的值和相对开始时的增量；ru_maxrss 是进程启动以来的高水位，
+工作进程复用时包含之前任务的峰值，只作为 max_rss_bytes 记录，不代表单个步骤的峰值。
+每次分析的明细附加在结果JSON的 metrics 字段中；API进程在任务结束时汇总这些记录，
+由 /metrics 接口以 Prometheus 文本格式导出
+"""
+import sys
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Windows 没有 resource 模块，不记录内存
+    resource = None
+
+# 步骤耗时直方图的分桶（秒）
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# 当前进程记录的步骤明细（工作进程中使用）
+_records = []
+_records_lock = threading.Lock()
+
+# 汇总指标（API进程中使用）
+_job_counts = {}
+_step_stats = {}
+_stats_lock = threading.Lock()
+
+
+def max_rss_bytes():
+    """当前进程启动以来的最大常驻内存（高水位，字节），无法获取时返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def rss_bytes():
+    """当前进程此刻的常驻内存（字节），读取 /proc/self/statm，无法获取时（非 Linux）返回 None"""
+    if resource is None:
+        return None
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * resource.getpagesize()
+
+
+@contextmanager
+def step(name, rows=None, aggregate=False):
+    """
+    记录一个步骤的耗时和资源占用
+
+    Args:
+        name: 步骤名，例如 clean、kmeans_elbow、render_heatmap
+        rows: 该步骤处理的数据行数，执行前不知道时可以在块内设置 info['rows']
+        aggregate: 直接计入汇总指标（在API进程中执行、不属于任何任务的步骤，例如按需渲染图片）
+
+    Yields:
+        dict: 步骤信息
+    """
+    info = {'rows': rows}
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    rss_start = rss_bytes()
+    status = 'failed'
+    try:
+        yield info
+        status = 'done'
+    finally:
+        rss_end = rss_bytes()
+        record = {
+            'step': name,
+            'status': status,
+            'wall_seconds': round(time.perf_counter() - wall_start, 4),
+            # 进程CPU时间，包含 sklearn / numpy 内部线程的计算
+            'cpu_seconds': round(time.process_time() - cpu_start, 4),
+            'rss_bytes': rss_end,
+            # 步骤结束时相对开始时的常驻内存增量，步骤中释放的临时内存不计入
+            'rss_delta_bytes': rss_end - rss_start if rss_end is not None and rss_start is not None else None,
+            'max_rss_bytes': max_rss_bytes(),
+            'rows': int(info['rows']) if info['rows'] is not None else None
+        }
+        if aggregate:
+            with _stats_lock:
+                _aggregate_step(record)
+        else:
+            with _records_lock:
+                _records.append(record)
+
+
+def extend(records):
+    """合并其他进程（并行执行的阶段）记录的步骤明细"""
+    with _records_lock:
+        _records.extend(records)
+
+
+def drain():
+    """取出并清空当前进程记录的步骤明细"""
+    with _records_lock:
+        records = list(_records)
+        _records.clear()
+    return records
+
+
+def aggregate(records):
+    """直接汇总其他进程记录的、不属于任何任务的步骤明细（例如渲染进程中的按需渲染）"""
+    with _stats_lock:
+        for record in records:
+            _aggregate_step(record)
+
+
+def record_job(status, records=()):
+    """
+    汇总一次分析任务的指标（在API进程中调用）
+
+    Args:
+        status: 任务最终状态（done / failed / cached）
+        records: 该任务的步骤明细
+    """
+    with _stats_lock:
+        _job_counts[status] = _job_counts.get(status, 0) + 1
+        for record in records:
+            _aggregate_step(record)
+
+
+def _aggregate_step(record):
+    # 调用方持有 _stats_lock
+    stats = _step_stats.setdefault(record['step'], {
+        'count': 0,
+        'wall_sum': 0.0,
+        'cpu_sum': 0.0,
+        'rows': 0,
+        'rss_delta': 0,
+        'max_rss': 0,
+        'buckets': [0] * len(DURATION_BUCKETS)
+    })
+    stats['count'] += 1
+    stats['wall_sum'] += record['wall_seconds']
+    stats['cpu_sum'] += record['cpu_seconds']
+    stats['rows'] += record.get('rows') or 0
+    stats['rss_delta'] = max(stats['rss_delta'], record.get('rss_delta_bytes') or 0)
+    stats['max_rss'] = max(stats['max_rss'], record.get('max_rss_bytes') or 0)
+    for i, bound in enumerate(DURATION_BUCKETS):
+        if record['wall_seconds'] <= bound:
+            stats['buckets'][i] += 1
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+def render_prometheus():
+    """以 Prometheus 文本格式导出汇总指标"""
+    lines = []
+    with _stats_lock:
+        lines.append("# HELP analysis_jobs_total 按最终状态统计的分析任务数")
+        lines.append("# TYPE analysis_jobs_total counter")
+        for status, count in sorted(_job_counts.items()):
+            lines.append(f"analysis_jobs_total{_labels(status=status)} {count}")
+
+        steps = sorted(_step_stats.items())
+        lines.append("# HELP analysis_step_duration_seconds 分析步骤的墙钟耗时")
+        lines.append("# TYPE analysis_step_duration_seconds histogram")
+        for name, stats in steps:
+            # 直方图的分桶计数是累计的
+            for bound, count in zip(DURATION_BUCKETS, stats['buckets']):
+                lines.append(f"analysis_step_duration_seconds_bucket{_labels(step=name, le=bound)} {count}")
+            lines.append(f"analysis_step_duration_seconds_bucket{_labels(step=name, le='+Inf')} {stats['count']}")
+            lines.append(f"analysis_step_duration_seconds_sum{_labels(step=name)} {stats['wall_sum']:.4f}")
+            lines.append(f"analysis_step_duration_seconds_count{_labels(step=name)} {stats['count']}")
+
+        lines.append("# HELP analysis_step_cpu_seconds_total 分析步骤消耗的CPU时间")
+        lines.append("# TYPE analysis_step_cpu_seconds_total counter")
+        for name, stats in steps:
+            lines.append(f"analysis_step_cpu_seconds_total{_labels(step=name)} {stats['cpu_sum']:.4f}")
+
+        lines.append("# HELP analysis_step_rows_total 分析步骤处理的数据行数")
+        lines.append("# TYPE analysis_step_rows_total counter")
+        for name, stats in steps:
+            lines.append(f"analysis_step_rows_total{_labels(step=name)} {stats['rows']}")
+
+        lines.append("# HELP analysis_step_rss_delta_bytes 单次执行该步骤前后常驻内存的最大增量")
+        lines.append("# TYPE analysis_step_rss_delta_bytes gauge")
+        for name, stats in steps:
+            lines.append(f"analysis_step_rss_delta_bytes{_labels(step=name)} {stats['rss_delta']}")
+
+        lines.append("# HELP analysis_step_max_rss_bytes 执行该步骤的进程启动以来的最大常驻内存（高水位，包含之前的任务）")
+        lines.append("# TYPE analysis_step_max_rss_bytes gauge")
+        for name, stats in steps:
+            lines.append(f"analysis_step_max_rss_bytes{_labels(step=name)} {stats['max_rss']}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,377 @@
+"""
+分析流水线：先执行数据清洗，再并行执行请求的分析阶段（默认为K-means聚类、热力图与漏斗图）
+读取、清洗和各分析步骤是计算图（见 dag.py）中的节点，节点输出按上传内容和参数缓存：
+同一文件换一个参数重新分析时，只有受参数影响的节点重新计算，其余节点直接使用缓存。
+各分析输出图表数据并写入会话目录，图片在第一次请求时才渲染（见 render_cache.py）；render=data 时结果中同时返回图表数据。
+每个阶段开始和结束时通过回调汇报进度，阶段完成时一并给出处理的行数和该阶段的结果摘要，
+供后台任务记录并通过 /progress 推送给前端
+"""
+import os
+import json
+import functools
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+
+import dag
+import metrics
+import result_cache
+import analysis_stages
+import charts
+from charts import RENDER_PNG, RENDER_DATA
+from stage_executor import STAGE_CONCURRENCY
+from storage import INTERMEDIATE_FORMAT, save_frame
+
+# 各分析阶段共用的模块（性能剖析前与请求的分析模块一起预先导入）
+PRELOAD_MODULES = ['clean_data', 'sklearn.preprocessing', 'sklearn.cluster', 'sklearn.decomposition']
+
+# 默认是否写出 cleaned_data.csv / clustered_data.csv 等中间数据文件
+WRITE_ARTIFACTS = os.environ.get('ANALYSIS_WRITE_ARTIFACTS', '1') != '0'
+
+
+class PipelineContext:
+    """
+    流水线上下文
+    需要写出的中间数据文件交给后台线程写入，不阻塞后续分析
+    """
+
+    def __init__(self, session_id, file_path, session_dir, write_artifacts=WRITE_ARTIFACTS,
+                 data_format=INTERMEDIATE_FORMAT):
+        self.session_id = session_id
+        self.file_path = file_path
+        self.session_dir = session_dir
+        self.write_artifacts = write_artifacts
+        self.data_format = data_format
+        self._writer = ThreadPoolExecutor(max_workers=1) if write_artifacts else None
+        self._pending_writes = []
+
+    def save_artifact(self, df, name):
+        """
+        在后台线程中把 DataFrame 写入会话目录，未开启写出时直接跳过
+
+        Args:
+            df: 要保存的数据
+            name: 不带扩展名的文件名，扩展名由存储格式决定
+        """
+        if self._writer is None:
+            return
+        path_base = os.path.join(self.session_dir, name)
+        self._pending_writes.append(self._writer.submit(self._write, df, name, path_base))
+
+    def _write(self, df, name, path_base):
+        with metrics.step(f"write_{name}", rows=len(df)):
+            return save_frame(df, path_base, self.data_format)
+
+    def wait_artifacts(self):
+        """等待所有后台写入完成，写入出错时抛出异常"""
+        if self._writer is None:
+            return
+        try:
+            for future in self._pending_writes:
+                future.result()
+        finally:
+            self._pending_writes = []
+            self._writer.shutdown(wait=True)
+            self._writer = None
+
+
+def _notify(progress, stage, state, **info):
+    """调用进度回调（如果提供）"""
+    if progress is not None:
+        progress(stage, state, **info)
+
+
+def read_upload(file_path, schema_path=None):
+    """计算图节点：按推断的类型读取上传文件，推断的类型缓存在 schema_path 中"""
+    from data_loader import read_csv
+
+    print(f"正在读取文件: {file_path}")
+    with metrics.step('read') as step:
+        raw = read_csv(file_path, schema_path=schema_path)
+        step['rows'] = len(raw)
+    return raw
+
+
+def clean_upload(raw):
+    """计算图节点：清洗数据，输出清洗后的数据和清洗统计"""
+    from clean_data import clean_frame
+
+    with metrics.step('clean', rows=len(raw)):
+        df, stats = clean_frame(raw)
+    return {'df': df, 'stats': stats}
+
+
+def clean_upload_chunked(file_path, work_dir=None):
+    """
+    计算图节点：分块清洗大文件（见 clean_data.clean_data_chunked），原始数据不整体读入内存，
+    清洗结果先写入 work_dir 中的临时文件，再按推断的类型读取，输出与 clean_upload 相同
+    """
+    import tempfile
+    from clean_data import CHUNK_ROWS, clean_data_chunked
+    from data_loader import read_csv
+
+    print(f"正在分块清洗文件: {file_path}（每块 {CHUNK_ROWS} 行）")
+    fd, cleaned_path = tempfile.mkstemp(prefix='.cleaned_', suffix='.csv', dir=work_dir)
+    os.close(fd)
+    try:
+        with metrics.step('clean') as step:
+            stats = clean_data_chunked(file_path, cleaned_path, CHUNK_ROWS)
+            step['rows'] = stats['original_rows']
+        with metrics.step('read', rows=stats['cleaned_rows']):
+            df = read_csv(cleaned_path)
+    finally:
+        os.remove(cleaned_path)
+    return {'df': df, 'stats': stats}
+
+
+def cleaned_frame(cleaned):
+    return cleaned['df']
+
+
+def cleaned_stats(cleaned):
+    return cleaned['stats']
+
+
+def build_graph(file_path, analyses, params=None, content_hash=None, cache=None,
+                max_workers=STAGE_CONCURRENCY, schema_path=None, work_dir=None):
+    """
+    构建分析计算图：upload -> raw -> cleaned -> {clean, cleaning_stats}，
+    各分析阶段的节点以 clean 为起点，另有每个阶段的条件检查节点 check_<阶段名>。
+    上传文件超过 clean_data.CHUNK_THRESHOLD_BYTES 时没有 raw 节点，cleaned 节点直接分块清洗上传文件
+
+    Args:
+        file_path: 上传文件路径
+        analyses: 要执行的分析名列表（已规范化）
+        params: 阶段名 -> 阶段参数
+        content_hash: 上传文件的内容哈希，未提供时现场计算
+        cache: 节点缓存，None 表示不缓存
+        max_workers: 同时执行的节点数上限
+        schema_path: 上传文件推断类型的缓存文件（会话目录中的 schema.json）
+        work_dir: 分块清洗时临时文件所在的目录（会话目录），None 表示系统临时目录
+    """
+    from clean_data import CHUNK_THRESHOLD_BYTES
+
+    params = params or {}
+    graph = dag.Graph(
+        {'upload': (file_path, content_hash or dag.file_key(file_path))},
+        cache=cache, max_workers=max_workers, version=result_cache.code_version()
+    )
+    if os.path.getsize(file_path) > CHUNK_THRESHOLD_BYTES:
+        # 原始数据可能放不进内存：只在内存中保留清洗后的数据
+        graph.add(dag.Node('cleaned', functools.partial(clean_upload_chunked, work_dir=work_dir), ['upload'],
+                           stage='clean'))
+    else:
+        graph.add(
+            # 读取比加载缓存的原始数据还快，不缓存；类型缓存文件只影响读取速度，不参与缓存键
+            dag.Node('raw', functools.partial(read_upload, schema_path=schema_path), ['upload'], stage='clean',
+                     cache=False),
+            dag.Node('cleaned', clean_upload, ['raw'], stage='clean')
+        )
+    graph.add(
+        dag.Node('clean', cleaned_frame, ['cleaned'], stage='clean', cache=False),
+        dag.Node('cleaning_stats', cleaned_stats, ['cleaned'], stage='clean')
+    )
+    for name in analyses:
+        stage = analysis_stages.STAGES[name]
+        graph.add(dag.Node(f"check_{name}", analysis_stages.check_columns, ['clean'], params={'stage': name}))
+        graph.add(*stage.nodes(params.get(name)))
+    return graph
+
+
+def stage_names(analyses=None):
+    """
+    流水线包含的阶段（按执行顺序）
+
+    Args:
+        analyses: 请求的分析名列表，None 表示默认分析
+
+    Returns:
+        list: 清洗阶段加上请求的分析阶段
+    """
+    return ['clean'] + analysis_stages.resolve(analyses)
+
+
+def run_pipeline(session_id, file_path, session_dir, progress=None, write_artifacts=WRITE_ARTIFACTS,
+                 stage_concurrency=STAGE_CONCURRENCY, data_format=INTERMEDIATE_FORMAT, profile=False,
+                 analyses=None, params=None, content_hash=None, render=RENDER_PNG):
+    """
+    执行完整的分析流程
+
+    Args:
+        session_id: 会话ID
+        file_path: 上传文件路径
+        session_dir: 会话结果目录
+        progress: 进度回调函数 progress(stage, state, rows=None, result=None, reason=None)，
+            state 为 running/done/skipped；阶段完成时 rows 为处理的行数，result 为该阶段的结果摘要，
+            跳过时 reason 为跳过的原因
+        write_artifacts: 是否写出清洗后和聚类后的数据文件
+        data_format: 中间数据的存储格式（csv / parquet / arrow）
+        stage_concurrency: 清洗之后的分析节点最多同时执行几个
+        profile: 是否记录 cProfile 和 tracemalloc 报告（保存在会话目录中）
+        analyses: 要执行的分析名列表（见 analysis_stages.STAGES），None 表示默认分析
+        params: 阶段名 -> 阶段参数，例如 {'kmeans': {'n_clusters': 4}}
+        content_hash: 上传文件的内容哈希，作为节点缓存键的来源，未提供时现场计算
+        render: data 时在 charts 字段中返回各图表的数据，由前端绘制；两种模式下 image_urls 都指向按需渲染的图片
+
+    Returns:
+        dict: 与 /analyze 接口返回结构一致的分析结果，只包含执行了的分析；
+            skipped_analyses 为被跳过的分析及原因，graph 为本次重新计算和使用缓存的节点，
+            metrics 字段为各步骤的耗时与资源明细
+    """
+    analyses = analysis_stages.resolve(analyses)
+    if profile:
+        # 剖析器只能观察当前进程，所有节点改为在本进程中顺序执行，且不使用节点缓存
+        from profiling import profile_run, report_files
+        # 先导入分析模块及其依赖，报告只反映分析本身而不是工作进程第一次导入的开销
+        for module in PRELOAD_MODULES + [analysis_stages.STAGES[name].module for name in analyses]:
+            try:
+                importlib.import_module(module)
+            except ImportError:
+                # 缺少依赖库的阶段会在执行前被跳过
+                pass
+        with profile_run(session_dir):
+            response = _run_graph(session_id, file_path, session_dir, progress, analyses, cache=None,
+                                  write_artifacts=write_artifacts, stage_concurrency=1, data_format=data_format,
+                                  params=params, content_hash=content_hash, render=render)
+        response["profile_reports"] = {
+            key: f"/download/{session_id}/{name}" for key, name in report_files().items()
+        }
+        return response
+    return _run_graph(session_id, file_path, session_dir, progress, analyses, cache=dag.NodeCache(),
+                      write_artifacts=write_artifacts, stage_concurrency=stage_concurrency,
+                      data_format=data_format, params=params, content_hash=content_hash, render=render)
+
+
+def materialize(output, session_id, session_dir, stage, render):
+    """
+    把阶段的输出写入会话目录并整理结果摘要
+
+    Args:
+        output: 阶段的输出 {'result': 分析结果, 'charts': 图表数据, 'files': 文件名 -> 内容}
+
+    Returns:
+        dict: 阶段的结果字段，image_urls 为图片地址（首次请求时渲染）；render=data 时 charts 为图表数据
+    """
+    for file_name, content in output['files'].items():
+        with open(os.path.join(session_dir, file_name), 'wb') as f:
+            f.write(content)
+    # 只保存图表数据，分析出错时没有对应的图表
+    charts.write_chart_data(session_dir, output['charts'])
+    summary = {"image_urls": {
+        key: f"/static/{session_id}/{charts.CHARTS[key].file_name}" for key in output['charts']
+    }}
+    if render == RENDER_DATA:
+        summary["charts"] = output['charts']
+    summary.update(analysis_stages.STAGES[stage].summarize(output['result']))
+    return summary
+
+
+def _run_graph(session_id, file_path, session_dir, progress, analyses, cache, write_artifacts,
+               stage_concurrency, data_format, params, content_hash, render):
+    from data_loader import SCHEMA_FILE
+
+    # 丢弃工作进程中上一次任务遗留的记录
+    metrics.drain()
+    ctx = PipelineContext(session_id, file_path, session_dir, write_artifacts=write_artifacts,
+                          data_format=data_format)
+    graph = build_graph(file_path, analyses, params=params, content_hash=content_hash, cache=cache,
+                        max_workers=stage_concurrency,
+                        schema_path=os.path.join(session_dir, SCHEMA_FILE), work_dir=session_dir)
+    try:
+        # 步骤1: 读取并清洗数据，检查各分析阶段需要的数据列
+        # 清洗在第一个节点就需要全部数据，在本进程中执行，避免把数据在进程间来回传递
+        _notify(progress, 'clean', 'running')
+        skipped = {}
+        checks = []
+        for name in analyses:
+            # 依赖库取决于运行环境而不是数据，不进入节点缓存
+            reason = analysis_stages.STAGES[name].missing_dependencies()
+            if reason:
+                skipped[name] = reason
+            else:
+                checks.append(f"check_{name}")
+        clean_targets = ['cleaning_stats'] + checks + (['clean'] if write_artifacts else [])
+        max_workers, graph.max_workers = graph.max_workers, 1
+        try:
+            values = graph.run(clean_targets)
+        finally:
+            graph.max_workers = max_workers
+        cleaning_stats = values['cleaning_stats']
+        if write_artifacts:
+            ctx.save_artifact(values['clean'], "cleaned_data")
+        # 原始数据只用于清洗，尽早释放
+        graph.discard('raw')
+
+        # 保存清洗统计信息到文件
+        cleaning_stats_path = os.path.join(session_dir, "cleaning_stats.json")
+        with open(cleaning_stats_path, "w") as f:
+            json.dump(cleaning_stats, f, indent=2)
+        rows = cleaning_stats['cleaned_rows']
+        # 清洗统计在分析阶段开始前就推送给前端
+        _notify(progress, 'clean', 'done', rows=rows, result={"cleaning_stats": cleaning_stats})
+
+        for name in analyses:
+            reason = skipped.get(name) or values.get(f"check_{name}")
+            if reason:
+                print(f"跳过{analysis_stages.STAGES[name].title}: {reason}")
+                skipped[name] = reason
+                _notify(progress, name, 'skipped', reason=reason)
+        stages = [name for name in analyses if name not in skipped]
+
+        # 步骤2: 计算各分析阶段的输出节点，互不依赖的节点并行执行；
+        # 每个阶段的输出节点就绪后立即写出文件并整理结果摘要，不必等待其他阶段
+        summaries = {}
+        started = set()
+
+        def node_progress(node, state, value):
+            if node.stage not in stages:
+                return
+            if node.stage not in started:
+                started.add(node.stage)
+                _notify(progress, node.stage, 'running')
+            if node.name == node.stage and state in ('done', 'cached'):
+                summaries[node.name] = materialize(graph.values[node.name], session_id, session_dir, node.name,
+                                                   render)
+                _notify(progress, node.name, 'done', rows=rows, result=summaries[node.name])
+
+        targets = list(stages)
+        if write_artifacts and 'kmeans' in stages:
+            targets.append('kmeans_clustered')
+        values = graph.run(targets, progress=node_progress)
+
+        if 'kmeans_clustered' in values:
+            ctx.save_artifact(values['kmeans_clustered'], "clustered_data")
+    finally:
+        graph.close()
+        ctx.wait_artifacts()
+
+    response = build_response(session_id, analyses, cleaning_stats, summaries, skipped)
+    response["graph"] = {"computed": graph.computed, "cached": graph.cached}
+    response["metrics"] = metrics.drain()
+    return response
+
+
+def build_response(session_id, analyses, cleaning_stats, summaries, skipped):
+    """
+    汇总各阶段的结果摘要（materialize 的返回值）
+
+    Returns:
+        dict: 与 /analyze 接口返回结构一致的分析结果
+    """
+    # 返回分析结果和图像URL
+    response = {
+        "session_id": session_id,
+        "status": "success",
+        "analyses": analyses,
+        "image_urls": {},
+        "cleaning_stats": cleaning_stats
+    }
+    for name in analyses:
+        if name not in summaries:
+            continue
+        summary = dict(summaries[name])
+        response["image_urls"].update(summary.pop("image_urls"))
+        if "charts" in summary:
+            response.setdefault("charts", {}).update(summary.pop("charts"))
+        response.update(summary)
+    response["skipped_analyses"] = skipped
+    return response
@@ -0,0 +1,93 @@
+"""
+分析任务性能剖析
+对单次分析开启 cProfile 和 tracemalloc，把报告保存到会话目录，可通过 /download/ 下载：
+  profile.prof        cProfile 原始数据，可用 pstats / snakeviz 打开
+  profile_stats.txt   按累计耗时排序的函数列表
+  memory_top.txt      分配内存最多的代码位置和峰值内存
+只在请求 profile=true 时导入和启用，未开启时没有任何额外开销
+"""
+import os
+from contextlib import contextmanager
+
+PROFILE_FILE = 'profile.prof'
+PROFILE_STATS_FILE = 'profile_stats.txt'
+MEMORY_FILE = 'memory_top.txt'
+
+# 报告中列出的函数数和内存分配位置数
+TOP_FUNCTIONS = 50
+TOP_ALLOCATIONS = 30
+# tracemalloc 记录的调用栈深度
+TRACEBACK_FRAMES = 10
+
+# 当前进程中是否正在剖析（cProfile 只记录开启它的线程）
+_active = False
+
+
+def active():
+    """当前进程是否正在剖析；正在剖析时，原本在线程池中执行的计算应改为在当前线程中执行"""
+    return _active
+
+
+def report_files():
+    """剖析报告的文件名"""
+    return {
+        'cprofile': PROFILE_FILE,
+        'cprofile_stats': PROFILE_STATS_FILE,
+        'memory': MEMORY_FILE
+    }
+
+
+def _write_cprofile(profiler, session_dir):
+    import pstats
+
+    profiler.dump_stats(os.path.join(session_dir, PROFILE_FILE))
+    with open(os.path.join(session_dir, PROFILE_STATS_FILE), 'w', encoding='utf-8') as f:
+        stats = pstats.Stats(profiler, stream=f)
+        stats.strip_dirs().sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+
+
+def _write_tracemalloc(snapshot, peak, session_dir):
+    lines = [f"峰值内存: {peak / 1024 / 1024:.1f} MB", "", f"分配内存最多的 {TOP_ALLOCATIONS} 个位置:"]
+    for index, stat in enumerate(snapshot.statistics('lineno')[:TOP_ALLOCATIONS], 1):
+        frame = stat.traceback[0]
+        lines.append(f"#{index} {frame.filename}:{frame.lineno} "
+                     f"{stat.size / 1024:.1f} KB（{stat.count} 次分配）")
+
+    lines += ["", "按调用栈统计的前 10 个位置:"]
+    for index, stat in enumerate(snapshot.statistics('traceback')[:10], 1):
+        lines.append(f"#{index} {stat.size / 1024:.1f} KB（{stat.count} 次分配）")
+        lines.extend(f"    {line}" for line in stat.traceback.format())
+
+    with open(os.path.join(session_dir, MEMORY_FILE), 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+
+
+@contextmanager
+def profile_run(session_dir):
+    """
+    在块内开启 cProfile 和 tracemalloc，结束后（包括出错时）把报告写入会话目录
+
+    Args:
+        session_dir: 会话结果目录
+    """
+    import cProfile
+    import tracemalloc
+
+    global _active
+    tracemalloc.start(TRACEBACK_FRAMES)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    _active = True
+    try:
+        yield
+    finally:
+        _active = False
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        try:
+            _write_cprofile(profiler, session_dir)
+            _write_tracemalloc(snapshot, peak, session_dir)
+        except Exception as e:
+            print(f"保存性能剖析报告失败: {e}")
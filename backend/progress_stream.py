@@ -0,0 +1,93 @@
+"""
+分析进度推送（Server-Sent Events）
+/progress/{session_id} 保持一个长连接，轮询会话注册表，在状态变化时推送事件：
+  stage     某个阶段开始、结束或被跳过，结束时带有处理的行数和该阶段的结果摘要，跳过时带有原因
+  progress  整体进度百分比、当前阶段和本次任务包含的阶段
+  done      分析完成，前端可以跳转到结果页面
+  failed    分析失败或会话已被清理
+没有变化时定期发送注释行作为心跳，避免反向代理因连接空闲而断开
+"""
+import os
+import json
+import time
+import asyncio
+
+from fastapi.concurrency import run_in_threadpool
+
+import job_queue
+import session_registry
+
+# 轮询注册表的间隔和心跳间隔（秒）
+POLL_INTERVAL = float(os.environ.get('PROGRESS_POLL_INTERVAL', 0.5))
+HEARTBEAT_INTERVAL = float(os.environ.get('PROGRESS_HEARTBEAT_INTERVAL', 15))
+# 连接断开后浏览器自动重连的等待时间（毫秒）
+RETRY_MILLISECONDS = 2000
+
+
+def format_event(event, data):
+    """按 SSE 格式编码一个事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def event_stream(session_id, is_disconnected):
+    """
+    生成会话的进度事件，任务结束（完成或失败）后结束
+
+    Args:
+        session_id: 会话ID
+        is_disconnected: 返回客户端是否已断开的协程函数（Request.is_disconnected）
+
+    Yields:
+        str: SSE 格式的事件文本
+    """
+    yield f"retry: {RETRY_MILLISECONDS}\n\n"
+    job_id = None
+    sent_stages = {}
+    last_progress = None
+    last_event = time.monotonic()
+
+    while not await is_disconnected():
+        session = await run_in_threadpool(session_registry.get_session, session_id)
+        if session is None or session['status'] == 'deleting':
+            yield format_event('failed', {'session_id': session_id, 'message': "会话已过期，请重新上传文件"})
+            return
+
+        events = []
+        status = job_queue.job_status(session)
+        if status is not None:
+            if status['job_id'] != job_id:
+                # 重新提交了分析任务，之前推送过的阶段状态不再有效
+                job_id, sent_stages = status['job_id'], {}
+            for item in status['stages']:
+                if item['status'] != 'pending' and sent_stages.get(item['name']) != item['status']:
+                    sent_stages[item['name']] = item['status']
+                    events.append(format_event('stage', item))
+        summary = {
+            'session_id': session_id,
+            'job_id': job_id,
+            'status': status['status'] if status else 'pending',
+            'progress': status['progress'] if status else 0,
+            'current_stage': status['current_stage'] if status else None,
+            'stages': [item['name'] for item in status['stages']] if status else []
+        }
+        if summary != last_progress:
+            last_progress = summary
+            events.append(format_event('progress', summary))
+
+        for event in events:
+            yield event
+        if events:
+            last_event = time.monotonic()
+        elif time.monotonic() - last_event >= HEARTBEAT_INTERVAL:
+            last_event = time.monotonic()
+            yield ": keep-alive\n\n"
+
+        if summary['status'] == job_queue.DONE:
+            yield format_event('done', {'session_id': session_id, 'job_id': job_id,
+                                        'cached': status.get('cached', False)})
+            return
+        if summary['status'] == job_queue.FAILED:
+            yield format_event('failed', {'session_id': session_id, 'job_id': job_id,
+                                          'message': status['error'] or "分析失败"})
+            return
+        await asyncio.sleep(POLL_INTERVAL)
@@ -0,0 +1,140 @@
+"""
+图表按需渲染与渲染缓存
+分析只把各图表的数据写入会话目录（<图表名>.chart.json），图片在第一次通过 /static 请求时才渲染。
+渲染结果以 (图表名, 分辨率, 图表数据, 代码版本) 的哈希为键保存在磁盘上，
+相同的图表数据（例如同一文件重复分析）共用缓存；缓存总大小超过上限时按最近访问时间淘汰（LRU）。
+渲染进程池可用时由常驻的渲染进程绘制（见 renderer_pool.py），否则在当前线程中绘制；
+渲染进程失败或超时时也改为在当前线程中重新绘制一次
+"""
+import os
+import json
+import hashlib
+import threading
+
+import charts
+import disk_cache
+import metrics
+import renderer_pool
+import result_cache
+
+RENDER_CACHE_DIR = os.environ.get('RENDER_CACHE_DIR', os.path.join('cache', 'renders'))
+# 渲染缓存总大小上限（字节），设为0时每次请求都重新渲染
+RENDER_CACHE_MAX_BYTES = int(os.environ.get('RENDER_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+# 可选的分辨率 -> dpi：preview 用于结果页的缩略图，screen 用于放大查看，print 用于下载打印
+SIZES = {'preview': 60, 'screen': 120, 'print': charts.DEFAULT_DPI}
+DEFAULT_SIZE = 'screen'
+
+# 正在渲染的图片 -> 锁：不同图表同时渲染，同一张图只渲染一次
+_inflight = {}
+_inflight_lock = threading.Lock()
+_evict_lock = threading.Lock()
+
+
+def _path(key):
+    return os.path.join(RENDER_CACHE_DIR, f"{key}.png")
+
+
+def render(session_dir, file_name, size=DEFAULT_SIZE):
+    """
+    取得会话中一个图表在指定分辨率下的图片，未缓存时现场渲染
+
+    Args:
+        session_dir: 会话结果目录
+        file_name: 图片文件名（charts.Chart.file_name）
+        size: 分辨率，SIZES 中的名称
+
+    Returns:
+        bytes: PNG内容；不是图表图片或会话中没有该图表的数据时返回 None
+    """
+    chart = charts.FILES.get(file_name)
+    if chart is None:
+        return None
+    data_path = os.path.join(session_dir, charts.data_file_name(chart.key))
+    try:
+        with open(data_path, 'rb') as f:
+            payload = f.read()
+    except OSError:
+        return None
+
+    dpi = SIZES[size]
+    digest = hashlib.sha256(f"{chart.key}:{dpi}:{result_cache.code_version()}:".encode('utf-8'))
+    digest.update(payload)
+    path = _path(digest.hexdigest())
+
+    content = _load(path)
+    if content is not None:
+        return content
+    with _inflight_lock:
+        lock = _inflight.setdefault(path, threading.Lock())
+    try:
+        with lock:
+            # 等待期间其他请求可能已经渲染了同一张图
+            content = _load(path)
+            if content is None and renderer_pool.available():
+                try:
+                    content = _render_in_pool(data_path, chart.key, dpi, path)
+                except renderer_pool.RenderError as e:
+                    print(f"渲染进程渲染 {chart.key} 失败，改为在当前进程中渲染: {e}")
+            if content is None:
+                with metrics.step(f"render_{chart.key}", aggregate=True):
+                    content = charts.render_chart(json.loads(payload), chart.key, dpi=dpi)
+                _store(path, content)
+    finally:
+        with _inflight_lock:
+            _inflight.pop(path, None)
+    return content
+
+
+def _render_in_pool(data_path, chart, dpi, path):
+    # 渲染进程直接把图片写入缓存路径；不使用缓存时写入临时文件，读取后删除
+    output_path = path if RENDER_CACHE_MAX_BYTES > 0 else f"{path}.{os.getpid()}.{threading.get_ident()}.png.tmp"
+    renderer_pool.render(os.path.abspath(data_path), chart, dpi, os.path.abspath(output_path))
+    if RENDER_CACHE_MAX_BYTES <= 0:
+        with open(output_path, 'rb') as f:
+            content = f.read()
+        os.remove(output_path)
+        return content
+    content = _load(path)
+    evict()
+    return content
+
+
+def _load(path):
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+        # 更新访问时间，用于LRU淘汰
+        os.utime(path, None)
+    except OSError:
+        return None
+    return content
+
+
+def _store(path, content):
+    if RENDER_CACHE_MAX_BYTES <= 0 or content is None:
+        return
+    os.makedirs(RENDER_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"写入渲染缓存失败: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    evict()
+
+
+def evict(max_bytes=None):
+    """
+    淘汰最久未访问的图片，直到总大小不超过上限
+
+    Returns:
+        int: 释放的字节数
+    """
+    max_bytes = RENDER_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    with _evict_lock:
+        return disk_cache.evict_lru(disk_cache.file_entries(RENDER_CACHE_DIR, '.png'), max_bytes)
@@ -0,0 +1,321 @@
+"""
+常驻的图表渲染进程池
+渲染进程启动时就应用 matplotlib 补丁、导入各绘图模块并加载字体，之后通过队列接收渲染任务
+（图表数据文件、图表名、分辨率和输出路径），API进程本身不导入 matplotlib，第一次请求图片时也不必等待这些初始化。
+每个渲染进程完成 RENDERER_MAX_JOBS 个任务后自行退出，由新进程替换，防止内存泄漏不断累积；
+渲染进程异常退出时，它正在处理的任务立即以 RenderError 结束，不必等到超时；
+/admin/renderers 查看进程池状态并检查渲染进程能否响应
+"""
+import io
+import os
+import json
+import time
+import uuid
+import queue
+import threading
+import importlib
+import multiprocessing
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+import charts
+import metrics
+
+# 渲染进程数，设为0时在API进程的线程中渲染（与之前一致）
+RENDERER_WORKERS = int(os.environ.get('RENDERER_WORKERS', 2))
+# 每个渲染进程完成多少个任务后被替换
+RENDERER_MAX_JOBS = int(os.environ.get('RENDERER_MAX_JOBS', 200))
+# 等待一次渲染的最长时间（秒）
+RENDER_TIMEOUT = float(os.environ.get('RENDER_TIMEOUT', 60))
+# 健康检查等待渲染进程响应的最长时间（秒）
+PING_TIMEOUT = 5
+# 渲染进程在初始化阶段就退出时，等待多久再重新启动（秒，连续失败时加倍）
+RESPAWN_DELAY = 1
+RESPAWN_MAX_DELAY = 60
+
+# 使用 spawn 启动：API进程中已有后台线程，fork 出的子进程可能继承被占用的锁
+_context = multiprocessing.get_context('spawn')
+
+_tasks = None
+_results = None
+_workers = {}  # pid -> {'process', 'jobs', 'started_at', 'ready', 'task'}
+_futures = {}  # 任务ID -> Future
+_lock = threading.Lock()
+_collector = None
+_stopping = threading.Event()
+# 渲染进程初始化失败后的重启等待时间，0 表示渲染进程正常
+_respawn = {'delay': 0, 'after': 0}
+_stats = {'started': 0, 'recycled': 0, 'crashed': 0, 'rendered': 0, 'failed': 0}
+
+
+class RenderError(Exception):
+    """渲染进程报告错误或超时未完成时抛出"""
+
+
+def _warm_up():
+    """渲染进程启动时的初始化：应用补丁、加载字体、导入绘图模块并完成一次绘制"""
+    from stage_executor import init_worker
+    from embed_font import get_font_prop
+
+    init_worker()
+    font_prop = get_font_prop()
+    for module in sorted({chart.module for chart in charts.CHARTS.values()} | {'seaborn', 'mpl_toolkits.mplot3d'}):
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            # 缺少可选依赖的模块在渲染对应图表时才会报错
+            print(f"渲染进程预加载 {module} 失败: {e}")
+    # 第一次绘制会初始化 Agg 画布和字体缓存
+    fig = charts.new_figure((1, 1))
+    fig.text(0.5, 0.5, '预热', fontproperties=font_prop)
+    fig.savefig(io.BytesIO(), format='png')
+
+
+def _render_task(data_path, chart, dpi, output_path):
+    with open(data_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    with metrics.step(f"render_{chart}"):
+        content = charts.render_chart(data, chart, dpi=dpi)
+    if content is None:
+        raise ValueError(f"图表 {chart} 没有数据")
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, output_path)
+
+
+def _worker_main(tasks, results, max_jobs):
+    """渲染进程主循环：完成 max_jobs 个渲染任务或收到 None 后退出"""
+    pid = os.getpid()
+    _warm_up()
+    results.put(('ready', pid))
+    jobs = 0
+    while max_jobs <= 0 or jobs < max_jobs:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, kind, args = task
+        if kind == 'ping':
+            results.put(('pong', pid, task_id))
+            continue
+        # 先报告开始处理的任务，进程在渲染中途退出时由主进程结束该任务
+        results.put(('start', pid, task_id))
+        error = None
+        try:
+            _render_task(*args)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        jobs += 1
+        results.put(('done', pid, task_id, error, metrics.drain()))
+    results.put(('exit', pid))
+
+
+def _spawn_worker():
+    # 调用方持有 _lock
+    process = _context.Process(target=_worker_main, args=(_tasks, _results, RENDERER_MAX_JOBS),
+                               name='renderer', daemon=True)
+    process.start()
+    _workers[process.pid] = {'process': process, 'jobs': 0, 'started_at': time.time(), 'ready': False,
+                             'task': None}
+    _stats['started'] += 1
+
+
+def _replace_exited():
+    """回收已退出的渲染进程、结束它们正在处理的任务，并补足进程数"""
+    failed = []
+    with _lock:
+        for pid, worker in list(_workers.items()):
+            process = worker['process']
+            if process.is_alive():
+                continue
+            process.join()
+            del _workers[pid]
+            if process.exitcode == 0:
+                _stats['recycled'] += 1
+                continue
+            _stats['crashed'] += 1
+            print(f"渲染进程 {pid} 异常退出，退出码 {process.exitcode}")
+            future = _futures.pop(worker['task'], None) if worker['task'] else None
+            if future is not None:
+                _stats['failed'] += 1
+                failed.append((future, f"渲染进程异常退出，退出码 {process.exitcode}"))
+            if not worker['ready']:
+                # 初始化阶段就失败（例如环境问题），延迟重启，避免不停地创建进程
+                _respawn['delay'] = min(max(_respawn['delay'] * 2, RESPAWN_DELAY), RESPAWN_MAX_DELAY)
+                _respawn['after'] = time.time() + _respawn['delay']
+        if _respawn['delay'] and not any(worker['ready'] for worker in _workers.values()):
+            # 没有可用的渲染进程，排队中的任务也不再等待，由调用方改为在当前进程中渲染
+            failed.extend((future, "渲染进程初始化失败") for future in _futures.values())
+            _futures.clear()
+        if not _stopping.is_set() and time.time() >= _respawn['after']:
+            while len(_workers) < RENDERER_WORKERS:
+                _spawn_worker()
+    for future, error in failed:
+        if not future.done():
+            future.set_exception(RenderError(error))
+
+
+def _collect():
+    """后台线程：接收渲染结果、完成对应的 Future，并替换退出的渲染进程"""
+    while not _stopping.is_set():
+        try:
+            message = _results.get(timeout=1)
+        except queue.Empty:
+            message = None
+        except (EOFError, OSError):
+            break
+        if message is not None:
+            _handle(message)
+        _replace_exited()
+
+
+def _handle(message):
+    # 消息格式：(类型, 进程号, ...)，ready / exit 只有进程号，pong / start 附带任务ID，done 附带任务ID、错误和步骤指标
+    kind, pid, *rest = message
+    error, records = None, []
+    with _lock:
+        worker = _workers.get(pid)
+        if kind == 'ready' and worker is not None:
+            worker['ready'] = True
+            _respawn['delay'] = 0
+        if kind == 'start' and worker is not None:
+            worker['task'] = rest[0]
+        if kind not in ('pong', 'done'):
+            return
+        future = _futures.pop(rest[0], None)
+        if kind == 'done':
+            error, records = rest[1], rest[2]
+            if worker is not None:
+                worker['jobs'] += 1
+                worker['task'] = None
+            _stats['failed' if error else 'rendered'] += 1
+    metrics.aggregate(records)
+    if future is not None and not future.done():
+        if error:
+            future.set_exception(RenderError(error))
+        else:
+            future.set_result(None)
+
+
+def start():
+    """启动渲染进程池（API进程启动时调用），RENDERER_WORKERS 为0时不启动"""
+    global _tasks, _results, _collector
+    if RENDERER_WORKERS <= 0 or running():
+        return
+    _stopping.clear()
+    _tasks = _context.Queue()
+    _results = _context.Queue()
+    with _lock:
+        for _ in range(RENDERER_WORKERS):
+            _spawn_worker()
+    _collector = threading.Thread(target=_collect, name='renderer-pool', daemon=True)
+    _collector.start()
+
+
+def stop(timeout=5):
+    """停止渲染进程池，等待中的渲染以 RenderError 结束"""
+    global _collector
+    if not running():
+        return
+    _stopping.set()
+    with _lock:
+        workers = list(_workers.values())
+        _workers.clear()
+        futures = list(_futures.values())
+        _futures.clear()
+    for _ in workers:
+        _tasks.put(None)
+    for worker in workers:
+        worker['process'].join(timeout)
+        if worker['process'].is_alive():
+            worker['process'].terminate()
+    for future in futures:
+        if not future.done():
+            future.set_exception(RenderError("渲染进程池已停止"))
+    _collector.join(timeout)
+    _collector = None
+
+
+def running():
+    """渲染进程池是否已启动"""
+    return _collector is not None and not _stopping.is_set()
+
+
+def available():
+    """渲染进程池是否可以接收任务：已启动，且渲染进程没有在初始化阶段反复失败"""
+    return running() and _respawn['delay'] == 0
+
+
+def _submit(kind, args=()):
+    task_id = uuid.uuid4().hex
+    future = Future()
+    with _lock:
+        _futures[task_id] = future
+    _tasks.put((task_id, kind, args))
+    return task_id, future
+
+
+def _wait(task_id, future, timeout):
+    try:
+        future.result(timeout)
+    except FutureTimeoutError:
+        with _lock:
+            _futures.pop(task_id, None)
+        raise RenderError(f"等待渲染进程超过 {timeout} 秒")
+
+
+def render(data_path, chart, dpi, output_path, timeout=None):
+    """
+    在渲染进程中把图表数据渲染为PNG并写入 output_path
+
+    Args:
+        data_path: 图表数据文件（charts.write_chart_data 写出的JSON）
+        chart: 图表名
+        dpi: 分辨率
+        output_path: 输出路径，渲染进程先写临时文件再替换
+        timeout: 最长等待时间（秒），默认 RENDER_TIMEOUT
+
+    Raises:
+        RenderError: 渲染失败或超时
+    """
+    task_id, future = _submit('render', (data_path, chart, dpi, output_path))
+    _wait(task_id, future, RENDER_TIMEOUT if timeout is None else timeout)
+
+
+def status(ping=True):
+    """
+    进程池状态（健康检查）
+
+    Args:
+        ping: 是否向渲染进程发送一次空任务，检查能否在 PING_TIMEOUT 秒内响应
+
+    Returns:
+        dict: healthy 为是否有可用的渲染进程，workers 为各进程的信息，ping_seconds 为响应耗时
+    """
+    if not running():
+        return {'enabled': RENDERER_WORKERS > 0, 'healthy': RENDERER_WORKERS <= 0, 'workers': [],
+                **_stats}
+    with _lock:
+        workers = [
+            {'pid': pid, 'ready': worker['ready'], 'jobs': worker['jobs'],
+             'uptime_seconds': round(time.time() - worker['started_at'], 1)}
+            for pid, worker in sorted(_workers.items())
+        ]
+        pending = len(_futures)
+    result = {'enabled': True, 'workers': workers, 'pending': pending, 'max_jobs': RENDERER_MAX_JOBS, **_stats}
+    healthy = any(worker['ready'] for worker in workers)
+    if _respawn['delay']:
+        result['error'] = f"渲染进程初始化失败，{_respawn['delay']} 秒后重试"
+    elif not healthy:
+        result['error'] = "渲染进程正在初始化"
+    if ping and healthy:
+        started = time.perf_counter()
+        try:
+            _wait(*_submit('ping'), PING_TIMEOUT)
+            result['ping_seconds'] = round(time.perf_counter() - started, 4)
+        except RenderError as e:
+            result['ping_seconds'] = None
+            result['error'] = str(e)
+            healthy = False
+    result['healthy'] = healthy
+    return result
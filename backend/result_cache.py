@@ -0,0 +1,145 @@
+"""
+分析结果缓存
+以 (上传内容哈希, 分析参数, 代码版本) 作为缓存键，保存分析生成的图片、数据文件和结果JSON。
+相同文件重复上传并分析时直接复制缓存结果，无需重新计算。
+缓存总大小超过上限时按最近访问时间淘汰（LRU）
+"""
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+import disk_cache
+
+CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', 'cache')
+# 缓存总大小上限（字节），设为0时关闭缓存
+CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+
+RESULT_FILE = 'result.json'
+# 不属于分析结果、不需要缓存的会话文件
+EXCLUDED_FILES = {'error_log.txt', 'analysis_results.json', 'profile.prof', 'profile_stats.txt',
+                  'memory_top.txt'}
+# 不影响分析结果的参数
+IGNORED_OPTIONS = {'stage_concurrency'}
+
+_code_version = None
+_lock = threading.Lock()
+
+
+def code_version():
+    """根据后端源码计算代码版本，代码变化后旧缓存自动失效"""
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        for name in sorted(os.listdir(base_dir)):
+            if not name.endswith('.py'):
+                continue
+            with open(os.path.join(base_dir, name), 'rb') as f:
+                digest.update(f.read())
+        _code_version = digest.hexdigest()[:16]
+    return _code_version
+
+
+def enabled():
+    return CACHE_MAX_BYTES > 0
+
+
+def make_key(content_hash, options=None):
+    """计算缓存键"""
+    params = {k: v for k, v in (options or {}).items() if k not in IGNORED_OPTIONS}
+    payload = json.dumps({
+        'content': content_hash,
+        'params': params,
+        'code': code_version()
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _dir_size(path):
+    total = 0
+    for name in os.listdir(path):
+        file_path = os.path.join(path, name)
+        if os.path.isfile(file_path):
+            total += os.path.getsize(file_path)
+    return total
+
+
+def lookup(key, session_id, session_dir):
+    """
+    查找缓存结果，命中时把缓存的文件放入会话目录
+
+    Returns:
+        dict: 替换为当前会话ID后的分析结果，未命中时返回 None
+    """
+    if not enabled():
+        return None
+    entry_dir = os.path.join(CACHE_DIR, key)
+    result_path = os.path.join(entry_dir, RESULT_FILE)
+    if not os.path.exists(result_path):
+        return None
+    try:
+        with open(result_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        for name in os.listdir(entry_dir):
+            if name == RESULT_FILE:
+                continue
+            # 使用复制而不是硬链接：会话重新分析时会原地覆盖文件，不能影响缓存
+            shutil.copy2(os.path.join(entry_dir, name), os.path.join(session_dir, name))
+        # 更新访问时间，用于LRU淘汰
+        os.utime(result_path, None)
+    except (OSError, ValueError):
+        # 缓存条目可能正在被淘汰，视为未命中
+        return None
+
+    # 结果中的图片URL等包含原会话ID，替换为当前会话
+    text = json.dumps(cached['result'], ensure_ascii=False)
+    return json.loads(text.replace(cached['session_id'], session_id))
+
+
+def store(key, session_id, session_dir, result):
+    """把会话目录中的分析结果写入缓存"""
+    if not enabled():
+        return
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    entry_dir = os.path.join(CACHE_DIR, key)
+    if os.path.exists(entry_dir):
+        return
+    tmp_dir = f"{entry_dir}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(tmp_dir, exist_ok=True)
+        for name in os.listdir(session_dir):
+            src = os.path.join(session_dir, name)
+            if name in EXCLUDED_FILES or not os.path.isfile(src):
+                continue
+            shutil.copy2(src, os.path.join(tmp_dir, name))
+        with open(os.path.join(tmp_dir, RESULT_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'session_id': session_id, 'result': result}, f, ensure_ascii=False)
+        os.rename(tmp_dir, entry_dir)
+    except OSError as e:
+        print(f"写入结果缓存失败: {e}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return
+    evict()
+
+
+def evict(max_bytes=None):
+    """
+    淘汰最久未访问的缓存条目，直到总大小不超过上限
+
+    Returns:
+        int: 释放的字节数
+    """
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    if not os.path.isdir(CACHE_DIR):
+        return 0
+    with _lock:
+        entries = []
+        for key in os.listdir(CACHE_DIR):
+            entry_dir = os.path.join(CACHE_DIR, key)
+            result_path = os.path.join(entry_dir, RESULT_FILE)
+            if not os.path.exists(result_path):
+                continue
+            entries.append((os.path.getmtime(result_path), _dir_size(entry_dir), entry_dir))
+        return disk_cache.evict_lru(entries, max_bytes, remove=lambda path: shutil.rmtree(path, ignore_errors=True))
@@ -0,0 +1,214 @@
+"""
+结果与上传文件的保留策略
+后台定期清理 results/ 和 uploads/：
+  1. 超过保留时间（TTL）未被访问的会话直接删除
+  2. 总占用超过配额时，按最近访问时间从早到晚删除会话（LRU），直到低于配额
+排队或执行中的会话不会被删除；上传文件只有在没有任何会话引用时才会删除
+"""
+import os
+import time
+import shutil
+import threading
+
+import dag
+import data_profile
+import render_cache
+import result_cache
+import session_registry
+import upload_store
+
+RESULTS_DIR = "results"
+
+# 会话保留时间（秒）、results 与 uploads 的总配额（字节）、清理间隔（秒）
+RETENTION_TTL_SECONDS = int(os.environ.get('RETENTION_TTL_SECONDS', 7 * 24 * 3600))
+RETENTION_MAX_BYTES = int(os.environ.get('RETENTION_MAX_BYTES', 10 * 1024 * 1024 * 1024))
+RETENTION_INTERVAL_SECONDS = int(os.environ.get('RETENTION_INTERVAL_SECONDS', 600))
+
+# 上传文件在最后一次保存（见 upload_store.save_upload）之后至少保留这么久，
+# 即使没有会话引用也不删除，避免删除刚上传、尚未登记的文件
+ORPHAN_GRACE_SECONDS = 3600
+
+_stats = {
+    'runs': 0,
+    'last_run_at': None,
+    'last_run_reclaimed_bytes': 0,
+    'last_run_deleted_sessions': 0,
+    'total_reclaimed_bytes': 0,
+    'total_deleted_sessions': 0,
+    'used_bytes': None
+}
+_stats_lock = threading.Lock()
+_run_lock = threading.Lock()
+_stop_event = threading.Event()
+_thread = None
+
+
+def _path_size(path):
+    """文件或目录占用的字节数"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _remove(path):
+    size = _path_size(path) if os.path.exists(path) else 0
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+    return size
+
+
+def _candidates():
+    """
+    收集所有可清理的会话
+
+    Returns:
+        list: [(最近访问时间, 会话ID, 会话记录或None, 占用字节数)]，注册表启用前的旧会话记录为 None
+    """
+    candidates = []
+    registered = set()
+    for session in session_registry.list_sessions():
+        registered.add(session['session_id'])
+        session_dir = os.path.join(RESULTS_DIR, session['session_id'])
+        size = _path_size(session_dir) if os.path.exists(session_dir) else 0
+        last_access = session['last_access'] or session['created_at'] or 0
+        candidates.append((last_access, session['session_id'], session, size))
+
+    # 注册表启用前的旧会话，以目录修改时间作为最近访问时间
+    if os.path.isdir(RESULTS_DIR):
+        legacy_uploads = {}
+        for name in os.listdir(upload_store.UPLOAD_DIR) if os.path.isdir(upload_store.UPLOAD_DIR) else []:
+            legacy_uploads.setdefault(name[:36], []).append(os.path.join(upload_store.UPLOAD_DIR, name))
+        for session_id in os.listdir(RESULTS_DIR):
+            session_dir = os.path.join(RESULTS_DIR, session_id)
+            if session_id in registered or not os.path.isdir(session_dir):
+                continue
+            size = _path_size(session_dir) + sum(_path_size(p) for p in legacy_uploads.get(session_id, []))
+            candidates.append((os.path.getmtime(session_dir), session_id, None, size))
+    return sorted(candidates, key=lambda item: item[0])
+
+
+def _delete_session(session_id, session):
+    """删除一个会话的结果目录和不再被引用的上传文件，返回释放的字节数"""
+    reclaimed = _remove(os.path.join(RESULTS_DIR, session_id))
+    if session is None:
+        # 旧会话的上传文件以会话ID为前缀
+        if os.path.isdir(upload_store.UPLOAD_DIR):
+            for name in os.listdir(upload_store.UPLOAD_DIR):
+                if name.startswith(session_id):
+                    reclaimed += _remove(os.path.join(upload_store.UPLOAD_DIR, name))
+        return reclaimed
+
+    session_registry.delete_session(session_id)
+    upload_path = session.get('upload_path')
+    if upload_path:
+        reclaimed += upload_store.remove_unused(upload_path, session_registry.upload_in_use, ORPHAN_GRACE_SECONDS)
+    return reclaimed
+
+
+def _remove_orphan_uploads():
+    """删除没有任何会话引用的内容文件"""
+    reclaimed = 0
+    if not os.path.isdir(upload_store.BLOB_DIR):
+        return reclaimed
+    for name in os.listdir(upload_store.BLOB_DIR):
+        reclaimed += upload_store.remove_unused(os.path.join(upload_store.BLOB_DIR, name),
+                                                session_registry.upload_in_use, ORPHAN_GRACE_SECONDS)
+    return reclaimed
+
+
+def collect(ttl_seconds=None, max_bytes=None):
+    """
+    执行一次清理，可以在分析任务运行期间安全调用
+
+    Args:
+        ttl_seconds: 会话保留时间，默认使用 RETENTION_TTL_SECONDS
+        max_bytes: results 与 uploads 的总配额，默认使用 RETENTION_MAX_BYTES
+
+    Returns:
+        dict: 本次清理释放的字节数、删除的会话数和清理后的占用
+    """
+    ttl_seconds = RETENTION_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+    max_bytes = RETENTION_MAX_BYTES if max_bytes is None else max_bytes
+
+    with _run_lock:
+        reclaimed = 0
+        deleted = 0
+        candidates = _candidates()
+        used = sum(item[3] for item in candidates) + _path_size(upload_store.BLOB_DIR)
+        expire_before = time.time() - ttl_seconds
+
+        for last_access, session_id, session, _ in candidates:
+            if last_access >= expire_before and used <= max_bytes:
+                break
+            # 排队或执行中的会话不删除；标记删除中后其他进程也不会再提交任务
+            if session is not None and not session_registry.claim_for_deletion(session_id):
+                continue
+            freed = _delete_session(session_id, session)
+            reclaimed += freed
+            used -= freed
+            deleted += 1
+
+        freed = _remove_orphan_uploads()
+        reclaimed += freed
+        used -= freed
+        reclaimed += result_cache.evict()
+        reclaimed += dag.evict()
+        reclaimed += render_cache.evict()
+        reclaimed += data_profile.evict()
+
+    with _stats_lock:
+        _stats['runs'] += 1
+        _stats['last_run_at'] = time.time()
+        _stats['last_run_reclaimed_bytes'] = reclaimed
+        _stats['last_run_deleted_sessions'] = deleted
+        _stats['total_reclaimed_bytes'] += reclaimed
+        _stats['total_deleted_sessions'] += deleted
+        _stats['used_bytes'] = max(used, 0)
+
+    print(f"清理完成：删除 {deleted} 个会话，释放 {reclaimed} 字节")
+    return {'reclaimed_bytes': reclaimed, 'deleted_sessions': deleted, 'used_bytes': max(used, 0)}
+
+
+def get_stats():
+    """累计清理统计"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats.update({
+        'ttl_seconds': RETENTION_TTL_SECONDS,
+        'max_bytes': RETENTION_MAX_BYTES,
+        'interval_seconds': RETENTION_INTERVAL_SECONDS
+    })
+    return stats
+
+
+def _loop():
+    while not _stop_event.wait(RETENTION_INTERVAL_SECONDS):
+        try:
+            collect()
+        except Exception as e:
+            print(f"清理过程中出错: {e}")
+
+
+def start():
+    """启动后台清理线程"""
+    global _thread
+    if _thread is None and RETENTION_INTERVAL_SECONDS > 0:
+        _stop_event.clear()
+        _thread = threading.Thread(target=_loop, name="retention-collector", daemon=True)
+        _thread.start()
+
+
+def stop():
+    """停止后台清理线程"""
+    global _thread
+    _stop_event.set()
+    _thread = None
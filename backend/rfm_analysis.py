@@ -1,28 +1,45 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 from datetime import datetime
 import os
-import matplotlib as mpl
-from matplotlib.font_manager import FontProperties
-import io
-import base64
-from sklearn.cluster import KMeans
-from pathlib import Path
 
 # 导入自定义字体模块
-from embed_font import setup_chinese_font, get_font_prop
+from embed_font import get_font_prop
+from data_loader import load_data
+import charts
+import cluster_sweep
+import metrics
 
-def perform_rfm_analysis(data_path, output_dir):
-    # 使用统一的字体设置
-    font_prop = setup_chinese_font()
+# 默认聚类数
+DEFAULT_CLUSTERS = 4
 
-    print(f"RFM分析使用字体: {plt.rcParams['font.family']}")
-    
-    # 读取清洗后的数据
-    df = pd.read_csv(data_path)
-    
+def analyze_rfm(data, output_dir, n_clusters=None, k_score=None):
+    """
+    计算用户的RFM指标、评分、细分和聚类，结果表写入输出目录
+
+    Args:
+        n_clusters, k_score: 见 score_users
+
+    Returns:
+        dict: 分析结果，charts 为各图表的图表数据；出错时只包含 error
+    """
+    # 读取清洗后的数据（文件路径或内存中的DataFrame）
+    df = prepare_transactions(load_data(data))
+    if isinstance(df, dict):
+        return df
+    return score_users(user_totals(df), output_dir, n_clusters, k_score)
+
+
+def prepare_transactions(df):
+    """
+    确定用户、日期和金额列（缺少时使用替代列）并把日期转换为时间类型
+
+    Args:
+        df: 清洗后的数据（会被修改）
+
+    Returns:
+        DataFrame: 包含 user_id、purchase_date、purchase_amount 的数据；缺少必要列时返回只包含 error 的字典
+    """
     # 首先检查必要的列是否存在
     required_columns = ['user_id', 'purchase_date', 'purchase_amount']
     missing_columns = [col for col in required_columns if col not in df.columns]
@@ -49,6 +66,10 @@ def perform_rfm_analysis(data_path, output_dir):
             'error': f"缺少必要列: {', '.join(missing_columns)}"
         }
     
+    # 取值重复较多的日期文本在读取时是 category 类型，先还原为普通的值再转换
+    if isinstance(df['purchase_date'].dtype, pd.CategoricalDtype):
+        df['purchase_date'] = df['purchase_date'].astype(object)
+    
     # 确保日期格式正确
     try:
         df['purchase_date'] = pd.to_datetime(df['purchase_date'])
@@ -69,20 +90,57 @@ def perform_rfm_analysis(data_path, output_dir):
             print("无法识别日期格式，使用当前日期-行号作为替代")
             today = datetime.now()
             df['purchase_date'] = pd.Series([today - pd.Timedelta(days=i) for i in range(len(df))])
-    
+    return df
+
+
+def user_totals(df):
+    """
+    按用户汇总最近一次购买日期、总消费金额和消费次数（不同批次的汇总可以用 merge_user_totals 合并）
+
+    Returns:
+        dict: users 为按 user_id 索引的 last_purchase / monetary / frequency，last_date 为数据中最近的日期
+    """
+    users = df.groupby('user_id').agg({
+        'purchase_date': 'max',  # 最近一次购买日期
+        'purchase_amount': ['sum', 'count']  # 总消费金额和消费次数
+    })
+    users.columns = ['last_purchase', 'monetary', 'frequency']
+    return {'users': users, 'last_date': df['purchase_date'].max()}
+
+
+def merge_user_totals(totals, other):
+    """合并两批数据的 user_totals：最近日期取较大者，金额和次数相加"""
+    users = pd.concat([totals['users'], other['users']]).groupby(level=0).agg({
+        'last_purchase': 'max', 'monetary': 'sum', 'frequency': 'sum'
+    })
+    return {'users': users, 'last_date': max(totals['last_date'], other['last_date'])}
+
+
+def score_users(totals, output_dir, n_clusters=None, k_score=None):
+    """
+    根据用户汇总计算RFM指标、评分、细分和聚类，结果表写入输出目录
+
+    Args:
+        totals: user_totals 的输出
+        output_dir: 输出目录
+        n_clusters: 聚类数，未指定时按 k_score 得分自动选择，没有指定 k_score 时为 DEFAULT_CLUSTERS
+        k_score: 肘部法则中在抽样上计算的聚类得分（silhouette / calinski_harabasz）
+
+    Returns:
+        dict: 分析结果，charts 为各图表的图表数据；出错时只包含 error
+    """
     # 计算RFM值
     # 选择截止日期（默认使用数据中最近的日期）
-    snapshot_date = df['purchase_date'].max() + pd.Timedelta(days=1)
-    
-    # 按客户分组并计算RFM指标
-    rfm = df.groupby('user_id').agg({
-        'purchase_date': lambda x: (snapshot_date - x.max()).days,  # 最近一次购买距今天数
-        'purchase_amount': ['sum', 'count']  # 总消费金额和消费次数
+    snapshot_date = totals['last_date'] + pd.Timedelta(days=1)
+    
+    # 最近一次购买距今天数、总消费金额和消费次数
+    users = totals['users']
+    rfm = pd.DataFrame({
+        'recency': (snapshot_date - users['last_purchase']).dt.days,
+        'monetary': users['monetary'],
+        'frequency': users['frequency']
     })
     
-    # 重命名列
-    rfm.columns = ['recency', 'monetary', 'frequency']
-    
     # 检查数据是否足够
     if len(rfm) < 5:
         print("错误: 用户数量太少，无法进行有意义的RFM分析")
@@ -90,34 +148,12 @@ def perform_rfm_analysis(data_path, output_dir):
             'error': "用户数量太少，无法进行有意义的RFM分析"
         }
     
-    # 数据分布图
-    plt.figure(figsize=(18, 6), facecolor='white')
-    
-    # 绘制Recency分布
-    plt.subplot(1, 3, 1)
-    sns.histplot(rfm['recency'], kde=True, color='skyblue')
-    plt.title('用户购买时间间隔分布', fontproperties=font_prop, fontsize=14)
-    plt.xlabel('时间间隔（天）', fontproperties=font_prop, fontsize=12)
-    plt.ylabel('用户数量', fontproperties=font_prop, fontsize=12)
-    
-    # 绘制Frequency分布
-    plt.subplot(1, 3, 2)
-    sns.histplot(rfm['frequency'], kde=True, color='lightgreen')
-    plt.title('用户购买频率分布', fontproperties=font_prop, fontsize=14)
-    plt.xlabel('购买次数', fontproperties=font_prop, fontsize=12)
-    plt.ylabel('用户数量', fontproperties=font_prop, fontsize=12)
-    
-    # 绘制Monetary分布
-    plt.subplot(1, 3, 3)
-    sns.histplot(rfm['monetary'], kde=True, color='salmon')
-    plt.title('用户消费金额分布', fontproperties=font_prop, fontsize=14)
-    plt.xlabel('消费金额', fontproperties=font_prop, fontsize=12)
-    plt.ylabel('用户数量', fontproperties=font_prop, fontsize=12)
-    
-    plt.tight_layout()
-    distribution_image_path = os.path.join(output_dir, 'rfm_distribution.png')
-    plt.savefig(distribution_image_path, dpi=300, bbox_inches='tight', format='png')
-    plt.close()
+    # 数据分布图的图表数据
+    distribution = {
+        'recency': charts.histogram(rfm['recency']),
+        'frequency': charts.histogram(rfm['frequency']),
+        'monetary': charts.histogram(rfm['monetary'])
+    }
     
     # 计算RFM分数
     # 将R、F、M评分划分为1-5分（5分最好）
@@ -143,25 +179,12 @@ def perform_rfm_analysis(data_path, output_dir):
     
     rfm['customer_segment'] = rfm.apply(segment_customer, axis=1)
     
-    # 创建细分饼图
-    plt.figure(figsize=(10, 8), facecolor='white')
+    # 细分饼图的图表数据
     segment_counts = rfm['customer_segment'].value_counts()
-    colors = ['#ff9999', '#66b3ff', '#99ff99', '#ffcc99', '#c2c2f0']
-    
-    # 添加百分比和数量标签
-    total = len(rfm)
-    labels = [f"{segment}: {count} ({count/total*100:.1f}%)" for segment, count in segment_counts.items()]
-    
-    # 绘制饼图
-    plt.pie(segment_counts, colors=colors, labels=labels, autopct='', startangle=90, 
-           textprops={'fontproperties': font_prop, 'fontsize': 12})
-    
-    plt.axis('equal')
-    plt.title('客户细分分布', fontproperties=font_prop, fontsize=16)
-    
-    segment_image_path = os.path.join(output_dir, 'rfm_segments.png')
-    plt.savefig(segment_image_path, dpi=300, bbox_inches='tight', format='png')
-    plt.close()
+    segments_chart = {
+        'labels': [str(label) for label in segment_counts.index],
+        'counts': charts.compact(segment_counts.values)
+    }
     
     # 使用K-Means进行客户聚类 (3D散点图)
     # 标准化RFM值用于聚类
@@ -170,60 +193,29 @@ def perform_rfm_analysis(data_path, output_dir):
     scaler = StandardScaler()
     rfm_scaled = scaler.fit_transform(rfm[['recency', 'frequency', 'monetary']])
     
-    # 使用肘部法则确定聚类数
-    inertia = []
-    k_range = range(1, 10)
-    for k in k_range:
-        kmeans = KMeans(n_clusters=k, random_state=42)
-        kmeans.fit(rfm_scaled)
-        inertia.append(kmeans.inertia_)
-    
-    # 绘制肘部图
-    plt.figure(figsize=(10, 6), facecolor='white')
-    plt.plot(k_range, inertia, 'o-', color='skyblue')
-    plt.title('确定最佳聚类数 (肘部法则)', fontproperties=font_prop, fontsize=14)
-    plt.xlabel('聚类数量', fontproperties=font_prop, fontsize=12)
-    plt.ylabel('组内平方和 (SSE)', fontproperties=font_prop, fontsize=12)
-    plt.grid(True, linestyle='--', alpha=0.7)
-    
-    elbow_image_path = os.path.join(output_dir, 'rfm_elbow.png')
-    plt.savefig(elbow_image_path, dpi=300, bbox_inches='tight', format='png')
-    plt.close()
-    
-    # 基于肘部图选择聚类数 (在实际中这应该是动态的，但为了简化，这里使用4)
-    optimal_clusters = 4
-    kmeans = KMeans(n_clusters=optimal_clusters, random_state=42)
-    rfm['cluster'] = kmeans.fit_predict(rfm_scaled)
-    
-    # 绘制3D散点图
-    from mpl_toolkits.mplot3d import Axes3D
-    
-    fig = plt.figure(figsize=(12, 10), facecolor='white')
-    ax = fig.add_subplot(111, projection='3d')
-    
-    # 为每个聚类设置不同颜色
-    colors = ['blue', 'red', 'green', 'orange', 'purple', 'cyan', 'magenta', 'yellow', 'black']
-    
-    # 绘制散点
-    for i in range(optimal_clusters):
-        cluster_data = rfm[rfm['cluster'] == i]
-        ax.scatter(cluster_data['recency'], 
-                  cluster_data['frequency'], 
-                  cluster_data['monetary'],
-                  s=50, c=colors[i], label=f'聚类 {i+1}')
-    
-    # 设置轴标签
-    ax.set_xlabel('最近一次购买 (天)', fontproperties=font_prop, fontsize=12)
-    ax.set_ylabel('购买频率 (次数)', fontproperties=font_prop, fontsize=12)
-    ax.set_zlabel('消费总额', fontproperties=font_prop, fontsize=12)
-    
-    # 添加标题和图例
-    ax.set_title('RFM 3D聚类分析', fontproperties=font_prop, fontsize=16)
-    plt.legend(prop=font_prop)
-    
-    cluster_image_path = os.path.join(output_dir, 'rfm_clusters_3d.png')
-    plt.savefig(cluster_image_path, dpi=300, bbox_inches='tight', format='png')
-    plt.close()
+    # 使用肘部法则确定聚类数，各聚类数同时拟合（见 cluster_sweep）
+    with metrics.step('rfm_elbow', rows=len(rfm_scaled)):
+        sweep = cluster_sweep.sweep(rfm_scaled, range(1, 10), n_init=None, score=k_score)
+    elbow = cluster_sweep.chart_data(sweep, n_clusters, DEFAULT_CLUSTERS)
+    
+    # 指定了 k_score 时按得分选择聚类数，否则使用指定的聚类数或默认的4，直接使用肘部法则中拟合好的模型
+    optimal_clusters = cluster_sweep.choose_k(sweep, n_clusters, DEFAULT_CLUSTERS)
+    kmeans = cluster_sweep.final_model(sweep, rfm_scaled, optimal_clusters, n_init=None)
+    rfm['cluster'] = kmeans.labels_
+    
+    # 3D散点图的图表数据
+    # 客户数超过 charts.SCATTER_MAX_POINTS 时按聚类分层抽样，sample 记录总数和抽样比例
+    indices, fraction = charts.stratified_sample(rfm['cluster'])
+    plotted = rfm if indices is None else rfm.iloc[indices]
+    clusters_chart = {
+        'recency': charts.compact(plotted['recency']),
+        'frequency': charts.compact(plotted['frequency']),
+        'monetary': charts.compact(plotted['monetary']),
+        'cluster': charts.compact(plotted['cluster']),
+        'n_clusters': optimal_clusters
+    }
+    if indices is not None:
+        clusters_chart['sample'] = {'total': len(rfm), 'fraction': round(fraction, 4)}
     
     # 计算每个聚类的平均RFM值
     cluster_avg = rfm.groupby('cluster')[['recency', 'frequency', 'monetary']].mean()
@@ -253,34 +245,18 @@ def perform_rfm_analysis(data_path, output_dir):
     # 应用映射
     rfm['business_segment'] = rfm['cluster'].map(segment_mapping)
     
-    # 创建业务细分饼图
-    plt.figure(figsize=(10, 8), facecolor='white')
+    # 业务细分饼图的图表数据
     business_segment_counts = rfm['business_segment'].value_counts()
-    colors = ['#ff9999', '#66b3ff', '#99ff99', '#ffcc99']
-    
-    # 添加百分比和数量标签
-    total = len(rfm)
-    labels = [f"{segment}: {count} ({count/total*100:.1f}%)" for segment, count in business_segment_counts.items()]
-    
-    # 绘制饼图
-    plt.pie(business_segment_counts, colors=colors, labels=labels, autopct='', startangle=90, 
-           textprops={'fontproperties': font_prop, 'fontsize': 12})
-    
-    plt.axis('equal')
-    plt.title('客户业务细分分布', fontproperties=font_prop, fontsize=16)
-    
-    business_segment_image_path = os.path.join(output_dir, 'rfm_business_segments.png')
-    plt.savefig(business_segment_image_path, dpi=300, bbox_inches='tight', format='png')
-    plt.close()
+    business_segments_chart = {
+        'labels': [str(label) for label in business_segment_counts.index],
+        'counts': charts.compact(business_segment_counts.values)
+    }
     
     # 保存RFM分析结果
     rfm_path = os.path.join(output_dir, 'rfm_results.csv')
     rfm.reset_index().to_csv(rfm_path, index=False)
     
     # 准备聚类特征可视化（雷达图）
-    plt.figure(figsize=(10, 8), facecolor='white')
-    
-    # 准备雷达图数据
     cluster_avg_radar = cluster_avg.copy()
     # 反转recency，使得值越大越好
     max_recency = cluster_avg_radar['recency'].max()
@@ -290,44 +266,166 @@ def perform_rfm_analysis(data_path, output_dir):
     for col in cluster_avg_radar.columns:
         cluster_avg_radar[col] = (cluster_avg_radar[col] - cluster_avg_radar[col].min()) / (cluster_avg_radar[col].max() - cluster_avg_radar[col].min())
     
+    radar = {
+        'categories': ['最近购买', '购买频率', '消费金额'],
+        'series': [
+            {'label': segment_mapping[cluster_id], 'values': charts.compact(cluster_avg_radar.loc[cluster_id].values)}
+            for cluster_id in cluster_avg_radar.index
+        ]
+    }
+    
+    # 返回分析结果
+    return {
+        'rfm_path': rfm_path,
+        'user_count': len(rfm),
+        'segments': {
+            label: count for label, count in rfm['business_segment'].value_counts().items()
+        },
+        'charts': {
+            'rfm_distribution': distribution,
+            'rfm_segments': segments_chart,
+            'rfm_elbow': elbow,
+            'rfm_clusters': clusters_chart,
+            'rfm_business_segments': business_segments_chart,
+            'rfm_radar': radar
+        }
+    }
+
+
+def draw_distribution(data):
+    """绘制R、F、M三项指标的分布图"""
+    font_prop = get_font_prop()
+    fig = charts.new_figure((18, 6))
+    
+    panels = [
+        ('recency', 'skyblue', '用户购买时间间隔分布', '时间间隔（天）'),   # 绘制Recency分布
+        ('frequency', 'lightgreen', '用户购买频率分布', '购买次数'),         # 绘制Frequency分布
+        ('monetary', 'salmon', '用户消费金额分布', '消费金额')               # 绘制Monetary分布
+    ]
+    for i, (key, color, title, xlabel) in enumerate(panels):
+        ax = fig.add_subplot(1, 3, i + 1)
+        charts.draw_histogram(ax, data[key], color)
+        ax.set_title(title, fontproperties=font_prop, fontsize=14)
+        ax.set_xlabel(xlabel, fontproperties=font_prop, fontsize=12)
+        ax.set_ylabel('用户数量', fontproperties=font_prop, fontsize=12)
+    
+    fig.tight_layout()
+    return fig
+
+
+def _draw_pie(data, colors, title):
+    font_prop = get_font_prop()
+    fig = charts.new_figure((10, 8))
+    ax = fig.add_subplot()
+    
+    # 添加百分比和数量标签
+    total = sum(data['counts'])
+    labels = [f"{segment}: {count} ({count/total*100:.1f}%)" for segment, count in zip(data['labels'], data['counts'])]
+    
+    # 绘制饼图
+    ax.pie(data['counts'], colors=colors, labels=labels, autopct='', startangle=90, 
+           textprops={'fontproperties': font_prop, 'fontsize': 12})
+    
+    ax.axis('equal')
+    ax.set_title(title, fontproperties=font_prop, fontsize=16)
+    return fig
+
+
+def draw_segments(data):
+    """绘制客户细分饼图"""
+    return _draw_pie(data, ['#ff9999', '#66b3ff', '#99ff99', '#ffcc99', '#c2c2f0'], '客户细分分布')
+
+
+def draw_business_segments(data):
+    """绘制客户业务细分饼图"""
+    return _draw_pie(data, ['#ff9999', '#66b3ff', '#99ff99', '#ffcc99'], '客户业务细分分布')
+
+
+def draw_elbow(data):
+    """绘制肘部图"""
+    font_prop = get_font_prop()
+    fig = charts.new_figure((10, 6))
+    ax = fig.add_subplot()
+    ax.plot(data['k'], data['inertia'], 'o-', color='skyblue')
+    if 'scores' in data:
+        cluster_sweep.draw_scores(ax, data, font_prop)
+    ax.set_title('确定最佳聚类数 (肘部法则)', fontproperties=font_prop, fontsize=14)
+    ax.set_xlabel('聚类数量', fontproperties=font_prop, fontsize=12)
+    ax.set_ylabel('组内平方和 (SSE)', fontproperties=font_prop, fontsize=12)
+    ax.grid(True, linestyle='--', alpha=0.7)
+    return fig
+
+
+def draw_clusters(data):
+    """绘制3D聚类散点图"""
+    # 注册 3d 投影
+    from mpl_toolkits.mplot3d import Axes3D
+    
+    font_prop = get_font_prop()
+    recency = np.asarray(data['recency'], dtype=float)
+    frequency = np.asarray(data['frequency'], dtype=float)
+    monetary = np.asarray(data['monetary'], dtype=float)
+    clusters = np.asarray(data['cluster'])
+    
+    fig = charts.new_figure((12, 10))
+    ax = fig.add_subplot(111, projection='3d')
+    
+    # 为每个聚类设置不同颜色
+    colors = ['blue', 'red', 'green', 'orange', 'purple', 'cyan', 'magenta', 'yellow', 'black']
+    
+    # 绘制散点（抽样后的点较密，缩小并去掉描边）
+    sampled = 'sample' in data
+    for i in range(data['n_clusters']):
+        mask = clusters == i
+        ax.scatter(recency[mask], frequency[mask], monetary[mask],
+                  s=6 if sampled else 50, c=colors[i], label=f'聚类 {i+1}',
+                  alpha=0.5 if sampled else 1.0, linewidths=0 if sampled else None, rasterized=sampled)
+    
+    # 设置轴标签
+    ax.set_xlabel('最近一次购买 (天)', fontproperties=font_prop, fontsize=12)
+    ax.set_ylabel('购买频率 (次数)', fontproperties=font_prop, fontsize=12)
+    ax.set_zlabel('消费总额', fontproperties=font_prop, fontsize=12)
+    
+    # 添加标题和图例
+    title = 'RFM 3D聚类分析'
+    if sampled:
+        title += '\n' + charts.sample_note(data['sample'])
+    ax.set_title(title, fontproperties=font_prop, fontsize=16)
+    ax.legend(prop=font_prop)
+    return fig
+
+
+def draw_radar(data):
+    """绘制聚类特征雷达图"""
+    font_prop = get_font_prop()
+    fig = charts.new_figure((10, 8))
+    
     # 准备雷达图角度
-    categories = ['最近购买', '购买频率', '消费金额']
+    categories = data['categories']
     N = len(categories)
     angles = [n / float(N) * 2 * np.pi for n in range(N)]
     angles += angles[:1]  # 闭合雷达图
     
     # 创建子图
-    ax = plt.subplot(111, polar=True)
+    ax = fig.add_subplot(111, polar=True)
     
     # 设置雷达图的角度标签
-    plt.xticks(angles[:-1], categories, fontproperties=font_prop, size=12)
+    ax.set_xticks(angles[:-1])
+    ax.set_xticklabels(categories, fontproperties=font_prop, size=12)
     
     # 绘制每个聚类的雷达图
-    for i, cluster_id in enumerate(cluster_avg_radar.index):
-        values = cluster_avg_radar.loc[cluster_id].values.tolist()
+    for series in data['series']:
+        values = list(series['values'])
         values += values[:1]  # 闭合雷达图
-        ax.plot(angles, values, linewidth=2, label=segment_mapping[cluster_id])
+        ax.plot(angles, values, linewidth=2, label=series['label'])
         ax.fill(angles, values, alpha=0.25)
     
     # 添加标题和图例
-    plt.title('聚类特征雷达图', fontproperties=font_prop, size=16)
-    plt.legend(loc='upper right', bbox_to_anchor=(0.1, 0.1), prop=font_prop)
-    
-    radar_image_path = os.path.join(output_dir, 'rfm_radar.png')
-    plt.savefig(radar_image_path, dpi=300, bbox_inches='tight', format='png')
-    plt.close()
-    
-    # 返回分析结果
-    return {
-        'rfm_path': rfm_path,
-        'distribution_image': distribution_image_path,
-        'segment_image': segment_image_path,
-        'business_segment_image': business_segment_image_path,
-        'cluster_image': cluster_image_path,
-        'elbow_image': elbow_image_path,
-        'radar_image': radar_image_path,
-        'user_count': len(rfm),
-        'segments': {
-            label: count for label, count in rfm['business_segment'].value_counts().items()
-        }
-    } 
\ No newline at end of file
+    ax.set_title('聚类特征雷达图', fontproperties=font_prop, size=16)
+    ax.legend(loc='upper right', bbox_to_anchor=(0.1, 0.1), prop=font_prop)
+    return fig
+
+
+def perform_rfm_analysis(data, output_dir, n_clusters=None, k_score=None):
+    """执行RFM分析并把图表保存到输出目录"""
+    return charts.write_charts(analyze_rfm(data, output_dir, n_clusters, k_score), output_dir)
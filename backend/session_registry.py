@@ -0,0 +1,239 @@
+"""
+会话注册表
+使用嵌入式 SQLite 数据库记录每个会话的上传文件、内容哈希、任务状态、阶段耗时和生成的文件清单，
+按会话ID直接查询，不再需要扫描 uploads/ 和 results/ 目录。
+数据库使用 WAL 模式，多个 uvicorn worker 和分析进程可以同时读写
+"""
+import os
+import json
+import time
+import sqlite3
+from contextlib import contextmanager
+
+REGISTRY_PATH = os.environ.get('SESSION_REGISTRY_PATH', 'sessions.db')
+
+# 以JSON文本保存的字段
+JSON_FIELDS = ('stages', 'artifacts', 'options')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id   TEXT PRIMARY KEY,
+    filename     TEXT,
+    upload_path  TEXT,
+    size         INTEGER,
+    content_hash TEXT,
+    status       TEXT NOT NULL DEFAULT 'uploaded',
+    job_id       TEXT,
+    options      TEXT,
+    cached       INTEGER NOT NULL DEFAULT 0,
+    stages       TEXT,
+    artifacts    TEXT,
+    error        TEXT,
+    created_at   REAL,
+    updated_at   REAL,
+    last_access  REAL,
+    submitted_at REAL,
+    started_at   REAL,
+    finished_at  REAL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_content_hash ON sessions (content_hash);
+CREATE INDEX IF NOT EXISTS idx_sessions_last_access ON sessions (last_access);
+"""
+
+_initialized = set()
+
+
+def _connect():
+    conn = sqlite3.connect(REGISTRY_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    if REGISTRY_PATH not in _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _initialized.add(REGISTRY_PATH)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+@contextmanager
+def _transaction():
+    """写事务：BEGIN IMMEDIATE 保证读-改-写过程中不会被其他进程插入修改"""
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def _decode(row):
+    if row is None:
+        return None
+    session = dict(row)
+    for field in JSON_FIELDS:
+        session[field] = json.loads(session[field]) if session[field] else None
+    session['cached'] = bool(session['cached'])
+    return session
+
+
+def _encode(fields):
+    encoded = {}
+    for key, value in fields.items():
+        if key in JSON_FIELDS and value is not None:
+            value = json.dumps(value, ensure_ascii=False)
+        elif key == 'cached':
+            value = int(bool(value))
+        encoded[key] = value
+    return encoded
+
+
+def create_session(session_id, filename, upload_path, size=None, content_hash=None):
+    """登记新上传的会话"""
+    now = time.time()
+    with _transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions "
+            "(session_id, filename, upload_path, size, content_hash, status, created_at, updated_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, 'uploaded', ?, ?, ?)",
+            (session_id, filename, upload_path, size, content_hash, now, now, now)
+        )
+
+
+def get_session(session_id):
+    """按会话ID查询，不存在时返回 None"""
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT * FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+    finally:
+        conn.close()
+    return _decode(row)
+
+
+def update_session(session_id, **fields):
+    """更新会话字段"""
+    fields['updated_at'] = time.time()
+    encoded = _encode(fields)
+    assignments = ", ".join(f"{key} = ?" for key in encoded)
+    with _transaction() as conn:
+        conn.execute(f"UPDATE sessions SET {assignments} WHERE session_id = ?",
+                     (*encoded.values(), session_id))
+
+
+def begin_job(session_id, **fields):
+    """
+    开始新的分析任务：仅当会话没有排队/执行中的任务且未被标记删除时才更新
+
+    Returns:
+        bool: 是否更新成功
+    """
+    fields['updated_at'] = time.time()
+    encoded = _encode(fields)
+    assignments = ", ".join(f"{key} = ?" for key in encoded)
+    with _transaction() as conn:
+        cursor = conn.execute(
+            f"UPDATE sessions SET {assignments} "
+            "WHERE session_id = ? AND status NOT IN ('queued', 'running', 'deleting')",
+            (*encoded.values(), session_id)
+        )
+        return cursor.rowcount == 1
+
+
+def update_stage(session_id, stage, state, rows=None, result=None, reason=None):
+    """
+    更新某个阶段的状态并记录耗时
+
+    Args:
+        session_id: 会话ID
+        stage: 阶段名
+        state: 阶段状态
+        rows: 该阶段处理的行数
+        result: 该阶段的结果摘要，阶段完成后即可通过 /results 和 /progress 获取
+        reason: 阶段被跳过的原因
+
+    Returns:
+        list: 更新后的阶段列表
+    """
+    now = time.time()
+    with _transaction() as conn:
+        row = conn.execute("SELECT stages FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        stages = json.loads(row['stages']) if row and row['stages'] else []
+        for item in stages:
+            if item['name'] != stage:
+                continue
+            item['status'] = state
+            if state == 'running':
+                item['started_at'] = now
+            else:
+                item['finished_at'] = now
+                if 'started_at' in item:
+                    item['duration'] = round(now - item['started_at'], 3)
+            if rows is not None:
+                item['rows'] = rows
+            if result is not None:
+                item['result'] = result
+            if reason is not None:
+                item['reason'] = reason
+        conn.execute("UPDATE sessions SET stages = ?, updated_at = ? WHERE session_id = ?",
+                     (json.dumps(stages, ensure_ascii=False), now, session_id))
+    return stages
+
+
+def touch(session_id):
+    """记录会话最近一次被访问的时间"""
+    with _transaction() as conn:
+        conn.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (time.time(), session_id))
+
+
+def scan_artifacts(session_dir):
+    """列出会话目录中生成的文件，作为文件清单保存"""
+    artifacts = []
+    for name in sorted(os.listdir(session_dir)):
+        path = os.path.join(session_dir, name)
+        if os.path.isfile(path):
+            artifacts.append({'name': name, 'size': os.path.getsize(path)})
+    return artifacts
+
+
+def list_sessions():
+    """列出所有会话（按最近访问时间从早到晚排序）"""
+    conn = _connect()
+    try:
+        rows = conn.execute("SELECT * FROM sessions ORDER BY last_access").fetchall()
+    finally:
+        conn.close()
+    return [_decode(row) for row in rows]
+
+
+def claim_for_deletion(session_id):
+    """
+    把会话标记为删除中，排队或执行中的会话不会被标记
+
+    Returns:
+        bool: 是否标记成功
+    """
+    with _transaction() as conn:
+        cursor = conn.execute(
+            "UPDATE sessions SET status = 'deleting', updated_at = ? "
+            "WHERE session_id = ? AND status NOT IN ('queued', 'running', 'deleting')",
+            (time.time(), session_id)
+        )
+        return cursor.rowcount == 1
+
+
+def delete_session(session_id):
+    """从注册表中删除会话"""
+    with _transaction() as conn:
+        conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+
+def upload_in_use(upload_path):
+    """是否还有会话引用该上传文件"""
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT 1 FROM sessions WHERE upload_path = ? LIMIT 1", (upload_path,)).fetchone()
+    finally:
+        conn.close()
+    return row is not None
@@ -0,0 +1,23 @@
+"""
+阶段执行器
+分析节点在独立的进程中执行（见 dag.Graph），这里提供进程初始化和在进程中调用节点函数的方法
+"""
+import os
+
+import metrics
+
+# 同时执行的阶段数上限（可通过环境变量调整，设为1时按顺序在当前进程执行）
+STAGE_CONCURRENCY = int(os.environ.get('ANALYSIS_STAGE_CONCURRENCY', min(3, os.cpu_count() or 1)))
+
+
+def init_worker():
+    """阶段进程初始化：隔离matplotlib环境并应用补丁"""
+    from matplotlib_patch import apply_patch
+    apply_patch()
+
+
+def call_stage(func, args, kwargs):
+    """在阶段进程中执行阶段函数，连同该阶段记录的步骤指标一起返回"""
+    metrics.drain()
+    result = func(*args, **kwargs)
+    return result, metrics.drain()
@@ -0,0 +1,180 @@
+"""
+中间数据存储
+cleaned_data / clustered_data 等中间结果可以保存为 CSV、Parquet 或 Arrow IPC（Feather v2）格式。
+列式格式保留数据类型、体积更小，并支持只读取需要的列；
+Parquet / Arrow 需要安装 pyarrow，未安装时自动退回 CSV。
+向列式数据追加的行每批保存为 <文件名>.parts 目录中的一个文件，read_frame 读取时与主文件合并
+"""
+import os
+import shutil
+
+# 默认的中间数据格式与压缩算法（可通过环境变量调整）
+INTERMEDIATE_FORMAT = os.environ.get('ANALYSIS_INTERMEDIATE_FORMAT', 'csv').lower()
+INTERMEDIATE_COMPRESSION = os.environ.get('ANALYSIS_INTERMEDIATE_COMPRESSION', 'zstd')
+
+# 支持的格式及对应的文件扩展名（按查找优先级排列）
+FORMAT_EXTENSIONS = {
+    'parquet': '.parquet',
+    'arrow': '.arrow',
+    'csv': '.csv'
+}
+
+# 列式数据追加的各批文件所在目录的后缀
+PARTS_SUFFIX = '.parts'
+
+
+def _has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def resolve_format(fmt=None):
+    """确定实际使用的存储格式"""
+    fmt = (fmt or INTERMEDIATE_FORMAT).lower()
+    if fmt not in FORMAT_EXTENSIONS:
+        raise ValueError(f"不支持的数据格式: {fmt}，可选值: {', '.join(FORMAT_EXTENSIONS)}")
+    if fmt != 'csv' and not _has_pyarrow():
+        print(f"警告: 未安装 pyarrow，无法使用 {fmt} 格式，改为保存CSV")
+        return 'csv'
+    return fmt
+
+
+def save_frame(df, path_base, fmt=None, compression=None):
+    """
+    保存 DataFrame
+
+    Args:
+        df: 要保存的数据
+        path_base: 不带扩展名的文件路径
+        fmt: csv / parquet / arrow，默认使用 ANALYSIS_INTERMEDIATE_FORMAT
+        compression: 列式格式使用的压缩算法，默认使用 ANALYSIS_INTERMEDIATE_COMPRESSION
+
+    Returns:
+        str: 实际写入的文件路径
+    """
+    fmt = resolve_format(fmt)
+    compression = compression or INTERMEDIATE_COMPRESSION
+    path = path_base + FORMAT_EXTENSIONS[fmt]
+    # 重新保存时之前追加的各批数据不再属于该数据
+    shutil.rmtree(path + PARTS_SUFFIX, ignore_errors=True)
+    if fmt == 'parquet':
+        df.to_parquet(path, index=False, compression=compression)
+    elif fmt == 'arrow':
+        # Feather 要求默认索引
+        df.reset_index(drop=True).to_feather(path, compression=compression)
+    else:
+        df.to_csv(path, index=False)
+    return path
+
+
+def read_frame(path, columns=None):
+    """
+    读取 save_frame 保存的数据，格式由扩展名判断
+
+    Args:
+        path: 文件路径
+        columns: 只读取这些列（列式格式只会读取对应列的数据）
+    """
+    import pandas as pd
+
+    ext = os.path.splitext(path)[1].lower()
+    columns = list(columns) if columns is not None else None
+    if ext == '.csv':
+        return pd.read_csv(path, usecols=columns)
+    read = pd.read_parquet if ext == '.parquet' else pd.read_feather
+    frames = [read(part, columns=columns) for part in [path] + _parts(path)]
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+
+def _parts(path):
+    """追加到列式数据的各批文件，按追加顺序排列（以 . 开头的是还没有写完的临时文件）"""
+    parts_dir = path + PARTS_SUFFIX
+    if not os.path.isdir(parts_dir):
+        return []
+    return [os.path.join(parts_dir, name) for name in sorted(os.listdir(parts_dir)) if not name.startswith('.')]
+
+
+def _columns(path):
+    """列式数据的列名（只读取文件的元数据）"""
+    if path.lower().endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.read_schema(path).names
+    import pyarrow.ipc as ipc
+    with ipc.open_file(path) as reader:
+        return reader.schema.names
+
+
+def frame_length(path):
+    """save_frame 保存的数据的长度，用于 append_frame 的 keep 参数：CSV 为文件字节数，Parquet / Arrow 为追加的批数"""
+    if os.path.splitext(path)[1].lower() == '.csv':
+        return os.path.getsize(path)
+    return len(_parts(path))
+
+
+def append_frame(df, path, keep=None):
+    """
+    把新增的行追加到 save_frame 保存的数据中，列按已有数据的顺序排列，已有的数据不会被重写
+
+    CSV 直接在文件末尾追加；Parquet / Arrow 不支持追加，新增的行写为 <文件名>.parts 目录中的一个新文件
+
+    Args:
+        keep: 已有数据应有的长度（见 frame_length），超出的部分是之前没有完成的追加写入的，先丢弃；
+            None 表示保留全部已有数据
+
+    Returns:
+        int: 追加后的长度（见 frame_length）
+    """
+    import pandas as pd
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        if keep is not None and os.path.getsize(path) > keep:
+            os.truncate(path, keep)
+        columns = list(pd.read_csv(path, nrows=0).columns)
+        df.reindex(columns=columns).to_csv(path, mode='a', header=False, index=False)
+        return os.path.getsize(path)
+    parts = _parts(path)
+    if keep is not None:
+        for part in parts[keep:]:
+            os.remove(part)
+        parts = parts[:keep]
+    parts_dir = path + PARTS_SUFFIX
+    os.makedirs(parts_dir, exist_ok=True)
+    fmt = next(name for name, extension in FORMAT_EXTENSIONS.items() if extension == ext)
+    tmp_path = save_frame(df.reindex(columns=_columns(path)), os.path.join(parts_dir, f".{os.getpid()}.tmp"), fmt)
+    os.replace(tmp_path, os.path.join(parts_dir, f"{len(parts) + 1:06d}{ext}"))
+    return len(parts) + 1
+
+
+def find_frame(directory, name):
+    """查找目录下某个中间数据文件（任意格式），不存在时返回 None"""
+    for ext in FORMAT_EXTENSIONS.values():
+        path = os.path.join(directory, name + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def export_csv(directory, name):
+    """
+    获取某个中间数据的CSV版本，列式格式的数据在第一次请求时转换并缓存为CSV
+
+    Returns:
+        str: CSV文件路径，数据不存在时返回 None
+    """
+    csv_path = os.path.join(directory, name + '.csv')
+    source = find_frame(directory, name)
+    if source is None:
+        return None
+    if source == csv_path:
+        return csv_path
+    # 追加数据时主文件不变，按最后写入的文件判断CSV是否需要重新转换
+    modified = max([os.path.getmtime(source)] + [os.path.getmtime(part) for part in _parts(source)])
+    if not os.path.exists(csv_path) or os.path.getmtime(csv_path) < modified:
+        tmp_path = f"{csv_path}.{os.getpid()}.tmp"
+        read_frame(source).to_csv(tmp_path, index=False)
+        os.replace(tmp_path, csv_path)
+    return csv_path
@@ -0,0 +1,13 @@
+"""
+导入耗时检查（pytest 用例）
+与 python import_budget.py 执行相同的检查：导入耗时不超过预算、不提前加载重量级库、导入时不读写文件
+"""
+import pytest
+
+import import_budget
+
+
+@pytest.mark.parametrize('name, code, budget, forbidden', import_budget.CHECKS,
+                         ids=[check[0] for check in import_budget.CHECKS])
+def test_import_budget(name, code, budget, forbidden):
+    assert import_budget.check(name, code, budget, forbidden) == []
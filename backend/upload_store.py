@@ -0,0 +1,107 @@
+"""
+按内容寻址的上传文件存储
+上传文件在写入时同步计算SHA-256，相同内容的文件只保存一份：uploads/by_hash/<hash>.csv
+会话与内容文件的对应关系记录在会话注册表中。
+保存时更新内容文件的修改时间作为租约，清理任务不删除租约期内的文件，上传后到登记会话之前的文件不会被删除
+"""
+import os
+import time
+import hashlib
+import threading
+import uuid
+
+UPLOAD_DIR = "uploads"
+BLOB_DIR = os.path.join(UPLOAD_DIR, "by_hash")
+
+# 每次读取的块大小
+CHUNK_SIZE = 1024 * 1024
+
+# 保存内容文件（更新租约）和删除内容文件互斥，删除前检查的修改时间不会在删除前被更新
+_lock = threading.Lock()
+
+
+async def _receive(upload_file, path):
+    """把上传文件流式写入 path，返回 (内容哈希, 文件大小)"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "wb") as buffer:
+        while True:
+            chunk = await upload_file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            buffer.write(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+async def save_upload(upload_file):
+    """
+    流式保存上传文件并计算内容哈希
+
+    Args:
+        upload_file: FastAPI 的 UploadFile
+
+    Returns:
+        tuple: (文件路径, 内容哈希, 文件大小)
+    """
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    tmp_path = os.path.join(BLOB_DIR, f".{uuid.uuid4().hex}.tmp")
+    try:
+        content_hash, size = await _receive(upload_file, tmp_path)
+        blob_path = os.path.join(BLOB_DIR, f"{content_hash}.csv")
+        with _lock:
+            if os.path.exists(blob_path):
+                # 相同内容已经存在，丢弃这次写入的副本，并更新已有文件的修改时间（租约）
+                os.remove(tmp_path)
+                os.utime(blob_path, None)
+            else:
+                os.replace(tmp_path, blob_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return blob_path, content_hash, size
+
+
+async def save_batch(upload_file, session_dir):
+    """
+    保存 /append 追加的一批数据：写入会话目录，不按内容共享，合并到会话的上传文件后删除，
+    没有完成的追加留下的文件随会话一起清理
+
+    Returns:
+        str: 文件路径
+    """
+    batch_dir = os.path.join(session_dir, "batches")
+    os.makedirs(batch_dir, exist_ok=True)
+    path = os.path.join(batch_dir, f"{uuid.uuid4().hex}.csv")
+    try:
+        await _receive(upload_file, path)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return path
+
+
+def remove_unused(path, in_use, grace_seconds):
+    """
+    删除不再被引用的上传文件：修改时间在 grace_seconds 之内（租约期内）或 in_use(path) 为真时保留
+
+    Args:
+        path: 上传文件路径
+        in_use: 判断是否还有会话引用该文件的函数
+        grace_seconds: 租约时长（秒）
+
+    Returns:
+        int: 释放的字节数
+    """
+    with _lock:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return 0
+        if time.time() - stat.st_mtime < grace_seconds or in_use(path):
+            return 0
+        os.remove(path)
+    return stat.st_size
@@ -1,7 +1,54 @@
 import React, { useState } from 'react';
+import ChartView from './ChartView';
 
 const API_URL = 'http://localhost:8000';
 
+// 图片在第一次请求时由后端渲染：页面中的缩略图用 preview，放大查看用 screen，下载用 print
+const withSize = (imageUrl, size) => `${imageUrl}${imageUrl.includes('?') ? '&' : '?'}size=${size}`;
+
+// 按请求执行的其他分析：结果字段前缀、标题、图表（image_urls / charts 中的键和标题）以及要展示的统计值
+const EXTRA_ANALYSES = [
+  {
+    key: 'rfm',
+    title: 'RFM用户价值分析',
+    images: [
+      ['rfm_distribution', 'R/F/M 分布'],
+      ['rfm_segments', 'RFM得分分层'],
+      ['rfm_business_segments', '用户价值分层'],
+      ['rfm_clusters', 'RFM聚类结果'],
+      ['rfm_elbow', '聚类K值选择 (肘部法则)'],
+      ['rfm_radar', '各聚类RFM特征雷达图']
+    ],
+    facts: [['user_count', '用户数']]
+  },
+  {
+    key: 'basket',
+    title: '购物篮分析',
+    images: [
+      ['basket_metrics', '规则指标分布'],
+      ['basket_scatter', '支持度与提升度'],
+      ['basket_network', '商品关联网络'],
+      ['basket_top_products', '规则中的高频商品'],
+      ['basket_cooccurrence', '商品共现矩阵']
+    ],
+    facts: [
+      ['rule_count', '关联规则数'],
+      ['frequent_itemsets_count', '频繁项集数'],
+      ['support_threshold', '最小支持度'],
+      ['confidence_threshold', '最小置信度']
+    ]
+  },
+  {
+    key: 'association',
+    title: '关联规则分析',
+    images: [
+      ['association_network', '关联规则网络'],
+      ['association_bubble', '支持度、置信度与提升度']
+    ],
+    facts: [['rules_count', '关联规则数']]
+  }
+];
+
 // 图片放大Modal组件
 const ImageModal = ({ imageUrl, altText, onClose }) => {
   return (
@@ -35,7 +82,9 @@ const AnalysisResult = ({ results }) => {
     return null;
   }
 
-  const { image_urls, cleaning_stats, kmeans_results, heatmap_results, funnel_results } = results;
+  const {
+    image_urls, charts, cleaning_stats, kmeans_results, heatmap_results, funnel_results, skipped_analyses
+  } = results;
   
   // 图片加载处理
   const handleImageLoad = (imageId) => {
@@ -57,7 +106,8 @@ const AnalysisResult = ({ results }) => {
   // 图片下载处理函数
   const handleDownloadImage = (imageUrl, imageName) => {
     // 确保图片URL是完整的
-    const fullImageUrl = imageUrl.startsWith('http') ? imageUrl : `${API_URL}${imageUrl}`;
+    const printUrl = withSize(imageUrl, 'print');
+    const fullImageUrl = printUrl.startsWith('http') ? printUrl : `${API_URL}${printUrl}`;
     
     // 使用fetch获取图片数据
     fetch(fullImageUrl)
@@ -90,7 +140,8 @@ const AnalysisResult = ({ results }) => {
 
   // 打开图片Modal
   const openImageModal = (imageUrl, altText) => {
-    const fullImageUrl = imageUrl.startsWith('http') ? imageUrl : `${API_URL}${imageUrl}`;
+    const screenUrl = withSize(imageUrl, 'screen');
+    const fullImageUrl = screenUrl.startsWith('http') ? screenUrl : `${API_URL}${screenUrl}`;
     setModalImage({ url: fullImageUrl, alt: altText });
   };
 
@@ -99,9 +150,19 @@ const AnalysisResult = ({ results }) => {
     setModalImage(null);
   };
 
+  // 是否有该图表（图片，或 render=data 时的图表数据）
+  const hasChart = (chartKey) => Boolean(image_urls?.[chartKey] || charts?.[chartKey]);
+
+  // 有图片时显示图片，否则根据图表数据在前端绘制
+  const renderChart = (chartKey, altText, imageId, downloadName) => (
+    image_urls?.[chartKey]
+      ? renderImage(image_urls[chartKey], altText, imageId, downloadName)
+      : <ChartView chartKey={chartKey} data={charts?.[chartKey]} />
+  );
+
   // 创建图像元素
   const renderImage = (imageUrl, altText, imageId, downloadName) => {
-    const fullImageUrl = `${API_URL}${imageUrl}`;
+    const fullImageUrl = `${API_URL}${withSize(imageUrl, 'preview')}`;
     
     // 第一次渲染时开始加载
     if (imageLoading[imageId] === undefined) {
@@ -177,15 +238,17 @@ const AnalysisResult = ({ results }) => {
       )}
 
       {/* K-means聚类分析结果 */}
+      {kmeans_results && (
       <div className="bg-white p-6 rounded-lg shadow">
         <h3 className="text-xl font-semibold text-gray-900 mb-4">K-means用户聚类分析</h3>
         
         <div className="grid grid-cols-1 md:grid-cols-2 gap-6">
           {/* 肘部法则图 */}
-          {image_urls?.kmeans_elbow && (
+          {hasChart('kmeans_elbow') && (
             <div>
               <div className="flex justify-between items-center mb-2">
                 <h4 className="text-lg font-medium text-gray-700">聚类K值选择 (肘部法则)</h4>
+                {image_urls?.kmeans_elbow && (
                 <button 
                   onClick={() => handleDownloadImage(image_urls.kmeans_elbow, 'kmeans_elbow.png')}
                   className="text-sm text-blue-600 hover:text-blue-800 flex items-center"
@@ -195,16 +258,18 @@ const AnalysisResult = ({ results }) => {
                   </svg>
                   下载
                 </button>
+                )}
               </div>
-              {renderImage(image_urls.kmeans_elbow, "K-means肘部法则图", "elbow", "kmeans_elbow.png")}
+              {renderChart('kmeans_elbow', "K-means肘部法则图", "elbow", "kmeans_elbow.png")}
             </div>
           )}
           
           {/* 聚类结果图 */}
-          {image_urls?.kmeans_clusters && (
+          {hasChart('kmeans_clusters') && (
             <div>
               <div className="flex justify-between items-center mb-2">
                 <h4 className="text-lg font-medium text-gray-700">用户聚类结果</h4>
+                {image_urls?.kmeans_clusters && (
                 <button 
                   onClick={() => handleDownloadImage(image_urls.kmeans_clusters, 'kmeans_clusters.png')}
                   className="text-sm text-blue-600 hover:text-blue-800 flex items-center"
@@ -214,8 +279,9 @@ const AnalysisResult = ({ results }) => {
                   </svg>
                   下载
                 </button>
+                )}
               </div>
-              {renderImage(image_urls.kmeans_clusters, "用户聚类结果图", "clusters", "kmeans_clusters.png")}
+              {renderChart('kmeans_clusters', "用户聚类结果图", "clusters", "kmeans_clusters.png")}
             </div>
           )}
         </div>
@@ -259,8 +325,10 @@ const AnalysisResult = ({ results }) => {
           </div>
         )}
       </div>
+      )}
 
       {/* 用户行为热力图 */}
+      {heatmap_results && (
       <div className="bg-white p-6 rounded-lg shadow">
         <div className="flex justify-between items-center mb-4">
           <h3 className="text-xl font-semibold text-gray-900">用户行为指标热力图</h3>
@@ -277,8 +345,8 @@ const AnalysisResult = ({ results }) => {
           )}
         </div>
         
-        {image_urls?.heatmap && (
-          renderImage(image_urls.heatmap, "用户行为热力图", "heatmap", "user_behavior_heatmap.png")
+        {hasChart('heatmap') && (
+          renderChart('heatmap', "用户行为热力图", "heatmap", "user_behavior_heatmap.png")
         )}
         
         {/* 行为统计 */}
@@ -320,12 +388,14 @@ const AnalysisResult = ({ results }) => {
           </div>
         )}
       </div>
+      )}
 
       {/* 用户转化漏斗图 */}
-      {image_urls?.funnel && (
+      {hasChart('funnel') && (
       <div className="bg-white p-6 rounded-lg shadow">
           <div className="flex justify-between items-center mb-4">
             <h3 className="text-xl font-semibold text-gray-900">用户转化漏斗分析</h3>
+            {image_urls?.funnel && (
             <button 
               onClick={() => handleDownloadImage(image_urls.funnel, 'user_funnel.png')}
               className="text-sm text-blue-600 hover:text-blue-800 flex items-center"
@@ -335,9 +405,10 @@ const AnalysisResult = ({ results }) => {
               </svg>
               下载漏斗图
             </button>
+            )}
           </div>
           
-          {renderImage(image_urls.funnel, "用户转化漏斗图", "funnel", "user_funnel.png")}
+          {renderChart('funnel', "用户转化漏斗图", "funnel", "user_funnel.png")}
         
         {/* 漏斗数据 */}
         {funnel_results?.funnel_data && funnel_results.funnel_data.length > 0 && (
@@ -380,6 +451,48 @@ const AnalysisResult = ({ results }) => {
       </div>
       )}
 
+      {/* RFM、购物篮和关联规则分析（按请求执行） */}
+      {EXTRA_ANALYSES.filter(({ key }) => results[`${key}_results`]).map(({ key, title, images, facts }) => {
+        const analysis = results[`${key}_results`];
+        return (
+          <div key={key} className="bg-white p-6 rounded-lg shadow">
+            <h3 className="text-xl font-semibold text-gray-900 mb-4">{title}</h3>
+            {analysis.error ? (
+              <p className="text-sm text-red-600">{analysis.error}</p>
+            ) : (
+              <div className="grid grid-cols-2 md:grid-cols-4 gap-4 mb-6">
+                {facts.filter(([field]) => analysis[field] != null).map(([field, label]) => (
+                  <div key={field} className="bg-gray-50 p-4 rounded-lg">
+                    <p className="text-sm text-gray-500">{label}</p>
+                    <p className="text-xl font-semibold text-gray-700">{analysis[field]}</p>
+                  </div>
+                ))}
+              </div>
+            )}
+            <div className="grid grid-cols-1 md:grid-cols-2 gap-6">
+              {images.filter(([imageKey]) => hasChart(imageKey)).map(([imageKey, imageTitle]) => (
+                <div key={imageKey}>
+                  <h4 className="text-lg font-medium text-gray-700 mb-2">{imageTitle}</h4>
+                  {renderChart(imageKey, imageTitle, imageKey, `${imageKey}.png`)}
+                </div>
+              ))}
+            </div>
+          </div>
+        );
+      })}
+
+      {/* 因缺少数据列或依赖库而跳过的分析 */}
+      {skipped_analyses && Object.keys(skipped_analyses).length > 0 && (
+        <div className="bg-yellow-50 p-4 rounded-lg">
+          <h4 className="text-sm font-medium text-yellow-800 mb-2">以下分析未执行</h4>
+          <ul className="text-sm text-yellow-700 space-y-1">
+            {Object.entries(skipped_analyses).map(([name, reason]) => (
+              <li key={name}>{name}：{reason}</li>
+            ))}
+          </ul>
+        </div>
+      )}
+
       {/* 图片放大的Modal */}
       {modalImage && (
         <ImageModal 
@@ -0,0 +1,301 @@
+import React from 'react';
+import {
+  ResponsiveContainer, LineChart, Line, ScatterChart, Scatter, BarChart, Bar, PieChart, Pie, Cell,
+  RadarChart, Radar, PolarGrid, PolarAngleAxis, PolarRadiusAxis, XAxis, YAxis, ZAxis,
+  CartesianGrid, Tooltip, Legend, ReferenceLine
+} from 'recharts';
+
+// 与后端图片一致的配色
+const COLORS = ['#4285F4', '#DB4437', '#F4B400', '#0F9D58', '#9C27B0', '#00ACC1', '#FF7043', '#8D6E63'];
+
+// 直方图的配色（R/F/M 与 支持度/置信度/提升度）
+const HISTOGRAM_COLORS = ['#87CEEB', '#90EE90', '#FA8072'];
+
+// 散点过多时抽样绘制，避免浏览器卡顿
+const MAX_POINTS = 3000;
+
+const sample = (points) => {
+  if (points.length <= MAX_POINTS) return points;
+  const step = points.length / MAX_POINTS;
+  return Array.from({ length: MAX_POINTS }, (_, i) => points[Math.floor(i * step)]);
+};
+
+// 按聚类分组的散点
+const groupByCluster = (xs, ys, clusters) => {
+  const groups = {};
+  xs.forEach((x, i) => {
+    const cluster = clusters[i];
+    (groups[cluster] = groups[cluster] || []).push({ x, y: ys[i] });
+  });
+  return Object.keys(groups).sort((a, b) => a - b).map((cluster) => [cluster, sample(groups[cluster])]);
+};
+
+const Frame = ({ children, height = 320 }) => (
+  <div className="border rounded-lg p-2 bg-white" style={{ height }}>
+    <ResponsiveContainer width="100%" height="100%">{children}</ResponsiveContainer>
+  </div>
+);
+
+// 聚类得分的名称（请求时指定了 k_score 才有）
+const SCORE_NAMES = { silhouette: '轮廓系数', calinski_harabasz: 'Calinski-Harabasz 指数' };
+
+const ElbowChart = ({ data }) => (
+  <Frame>
+    <LineChart data={data.k.map((k, i) => ({ k, inertia: data.inertia[i], score: data.scores?.[i] }))}>
+      <CartesianGrid strokeDasharray="3 3" />
+      <XAxis dataKey="k" />
+      <YAxis yAxisId="inertia" />
+      {data.scores && <YAxis yAxisId="score" orientation="right" />}
+      <Tooltip />
+      <Line yAxisId="inertia" type="monotone" dataKey="inertia" name="惯性" stroke={COLORS[0]} />
+      {data.scores && (
+        <Line yAxisId="score" type="monotone" dataKey="score" name={SCORE_NAMES[data.score] || data.score}
+              stroke={COLORS[1]} strokeDasharray="5 5" connectNulls />
+      )}
+      {data.selected && (
+        <ReferenceLine yAxisId="inertia" x={data.selected} stroke="#9E9E9E" strokeDasharray="3 3"
+                       label={`K=${data.selected}`} />
+      )}
+    </LineChart>
+  </Frame>
+);
+
+// 用户数很多时后端只返回分层抽样的点（见 charts.stratified_sample）
+const SampleNote = ({ sample }) => (
+  sample ? (
+    <p className="text-xs text-gray-500 text-center mt-1">
+      抽样显示 {(sample.fraction * 100).toFixed(1)}% 的用户（共 {sample.total} 人）
+    </p>
+  ) : null
+);
+
+const ClusterScatter = ({ data, xName = '主成分1', yName = '主成分2' }) => (
+  <div>
+    <Frame>
+      <ScatterChart>
+        <CartesianGrid />
+        <XAxis type="number" dataKey="x" name={xName} />
+        <YAxis type="number" dataKey="y" name={yName} />
+        <Tooltip />
+        <Legend />
+        {groupByCluster(data.x, data.y, data.cluster).map(([cluster, points]) => (
+          <Scatter key={cluster} name={`Cluster ${cluster}`} data={points} fill={COLORS[cluster % COLORS.length]} />
+        ))}
+      </ScatterChart>
+    </Frame>
+    <SampleNote sample={data.sample} />
+  </div>
+);
+
+// 热力图和共现矩阵：用表格绘制，颜色深浅表示数值大小
+const MatrixChart = ({ rows, columns, values }) => {
+  const flat = values.flat().filter((value) => value != null);
+  const max = Math.max(...flat, 0);
+  const min = Math.min(...flat, max);
+  const shade = (value) => {
+    if (value == null) return '#f3f4f6';
+    const ratio = max > min ? (value - min) / (max - min) : 0;
+    return `rgba(37, 99, 235, ${0.1 + 0.8 * ratio})`;
+  };
+  return (
+    <div className="overflow-x-auto border rounded-lg">
+      <table className="min-w-full text-xs">
+        <thead>
+          <tr>
+            <th />
+            {columns.map((column) => <th key={column} className="px-2 py-1 text-gray-600">{column}</th>)}
+          </tr>
+        </thead>
+        <tbody>
+          {rows.map((row, i) => (
+            <tr key={row}>
+              <th className="px-2 py-1 text-left text-gray-600 whitespace-nowrap">{row}</th>
+              {values[i].map((value, j) => (
+                <td key={j} className="px-2 py-1 text-center" style={{ backgroundColor: shade(value) }}>
+                  {value == null ? '' : Number(value).toFixed(1)}
+                </td>
+              ))}
+            </tr>
+          ))}
+        </tbody>
+      </table>
+    </div>
+  );
+};
+
+const FunnelChart = ({ data }) => (
+  <Frame>
+    <BarChart data={data.stages} layout="vertical">
+      <CartesianGrid strokeDasharray="3 3" />
+      <XAxis type="number" />
+      <YAxis type="category" dataKey="stage" width={90} />
+      <Tooltip />
+      <Bar dataKey="count" name="用户数" fill={COLORS[0]} />
+    </BarChart>
+  </Frame>
+);
+
+// 多个直方图（各指标分别绘制）
+const HistogramCharts = ({ data, titles }) => (
+  <div className="grid grid-cols-1 md:grid-cols-3 gap-2">
+    {Object.entries(titles).map(([key, title], index) => {
+      const histogram = data[key];
+      const bins = histogram.counts.map((count, i) => ({
+        bin: Number(histogram.edges[i]).toPrecision(3),
+        count
+      }));
+      return (
+        <div key={key}>
+          <p className="text-sm text-gray-600 text-center">{title}</p>
+          <Frame height={220}>
+            <BarChart data={bins}>
+              <XAxis dataKey="bin" />
+              <YAxis />
+              <Tooltip />
+              <Bar dataKey="count" name="频数" fill={HISTOGRAM_COLORS[index % HISTOGRAM_COLORS.length]} />
+            </BarChart>
+          </Frame>
+        </div>
+      );
+    })}
+  </div>
+);
+
+const SegmentPie = ({ data }) => (
+  <Frame>
+    <PieChart>
+      <Pie
+        data={data.labels.map((label, i) => ({ label, count: data.counts[i] }))}
+        dataKey="count" nameKey="label" outerRadius="75%" label
+      >
+        {data.labels.map((label, i) => <Cell key={label} fill={COLORS[i % COLORS.length]} />)}
+      </Pie>
+      <Tooltip />
+      <Legend />
+    </PieChart>
+  </Frame>
+);
+
+const RadarView = ({ data }) => {
+  const points = data.categories.map((category, i) => {
+    const point = { category };
+    data.series.forEach((series) => { point[series.label] = series.values[i]; });
+    return point;
+  });
+  return (
+    <Frame>
+      <RadarChart data={points} outerRadius="75%">
+        <PolarGrid />
+        <PolarAngleAxis dataKey="category" />
+        <PolarRadiusAxis domain={[0, 1]} />
+        {data.series.map((series, i) => (
+          <Radar key={series.label} name={series.label} dataKey={series.label}
+            stroke={COLORS[i % COLORS.length]} fill={COLORS[i % COLORS.length]} fillOpacity={0.2} />
+        ))}
+        <Legend />
+      </RadarChart>
+    </Frame>
+  );
+};
+
+// RFM聚类：三维图在前端以“最近购买-消费金额”二维散点展示
+const RfmClusterScatter = ({ data }) => (
+  <ClusterScatter
+    data={{ x: data.recency, y: data.monetary, cluster: data.cluster, sample: data.sample }}
+    xName="最近购买(天)" yName="消费金额"
+  />
+);
+
+const RuleScatter = ({ data, y, yName }) => (
+  <Frame>
+    <ScatterChart>
+      <CartesianGrid />
+      <XAxis type="number" dataKey="support" name="支持度" />
+      <YAxis type="number" dataKey="value" name={yName} />
+      <ZAxis type="number" dataKey="size" range={[20, 400]} />
+      <Tooltip />
+      <Scatter
+        data={sample(data.support.map((support, i) => ({ support, value: data[y][i], size: data.lift[i] })))}
+        fill={COLORS[0]} fillOpacity={0.6}
+      />
+    </ScatterChart>
+  </Frame>
+);
+
+const TopProducts = ({ data }) => (
+  <Frame>
+    <BarChart data={data.products.map((product, i) => ({ product, frequency: data.frequency[i] }))}>
+      <CartesianGrid strokeDasharray="3 3" />
+      <XAxis dataKey="product" />
+      <YAxis />
+      <Tooltip />
+      <Bar dataKey="frequency" name="出现次数" fill={COLORS[3]} />
+    </BarChart>
+  </Frame>
+);
+
+// 关联网络：节点位置由后端布局给出，用SVG直接绘制
+const NetworkChart = ({ data }) => {
+  if (data.nodes.length === 0) return null;
+  const xs = data.nodes.map((node) => node.x);
+  const ys = data.nodes.map((node) => node.y);
+  const [minX, maxX, minY, maxY] = [Math.min(...xs), Math.max(...xs), Math.min(...ys), Math.max(...ys)];
+  const scale = (value, min, max) => 40 + 520 * (max > min ? (value - min) / (max - min) : 0.5);
+  const positions = {};
+  data.nodes.forEach((node) => {
+    positions[node.id] = [scale(node.x, minX, maxX), scale(node.y, minY, maxY)];
+  });
+  return (
+    <div className="border rounded-lg bg-white">
+      <svg viewBox="0 0 600 600" className="w-full h-auto">
+        {data.edges.map((edge, i) => (
+          <line key={i} x1={positions[edge.source][0]} y1={positions[edge.source][1]}
+            x2={positions[edge.target][0]} y2={positions[edge.target][1]}
+            stroke="#1e3a8a" strokeOpacity={0.5} strokeWidth={Math.min(edge.lift, 6)} />
+        ))}
+        {data.nodes.map((node) => (
+          <g key={node.id}>
+            <circle cx={positions[node.id][0]} cy={positions[node.id][1]} r={14} fill="#87CEEB" />
+            <text x={positions[node.id][0]} y={positions[node.id][1] + 28} fontSize={11} textAnchor="middle">
+              {node.id}
+            </text>
+          </g>
+        ))}
+      </svg>
+    </div>
+  );
+};
+
+// 图表名 -> 绘制组件（与后端 charts.py 中的图表对应）
+const CHART_COMPONENTS = {
+  kmeans_elbow: ElbowChart,
+  kmeans_clusters: ClusterScatter,
+  heatmap: ({ data }) => <MatrixChart rows={data.rows} columns={data.columns} values={data.values} />,
+  funnel: FunnelChart,
+  rfm_distribution: ({ data }) => (
+    <HistogramCharts data={data} titles={{ recency: '最近购买(天)', frequency: '购买频率', monetary: '消费金额' }} />
+  ),
+  rfm_segments: SegmentPie,
+  rfm_business_segments: SegmentPie,
+  rfm_elbow: ElbowChart,
+  rfm_clusters: RfmClusterScatter,
+  rfm_radar: RadarView,
+  basket_metrics: ({ data }) => (
+    <HistogramCharts data={data} titles={{ support: '支持度', confidence: '置信度', lift: '提升度' }} />
+  ),
+  basket_scatter: ({ data }) => <RuleScatter data={data} y="lift" yName="提升度" />,
+  basket_network: NetworkChart,
+  basket_top_products: TopProducts,
+  basket_cooccurrence: ({ data }) => <MatrixChart rows={data.labels} columns={data.labels} values={data.matrix} />,
+  association_network: NetworkChart,
+  association_bubble: ({ data }) => <RuleScatter data={data} y="confidence" yName="置信度" />
+};
+
+// 根据 /analyze?render=data 返回的图表数据在前端绘制图表
+const ChartView = ({ chartKey, data }) => {
+  const Component = CHART_COMPONENTS[chartKey];
+  if (!Component || !data) return null;
+  return <Component data={data} />;
+};
+
+export default ChartView;
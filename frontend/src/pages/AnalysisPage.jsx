@@ -1,43 +1,139 @@
 import React, { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import axios from 'axios';
+import AnalysisResult from '../components/AnalysisResult';
 
 const API_URL = 'http://localhost:8000';
 
+// 分析步骤说明（与后端流水线的阶段对应）
+const STEP_LABELS = {
+  clean: '数据清洗：识别并移除标记为"脏数据"的行，准备分析数据集',
+  kmeans: 'K-means聚类分析：对用户进行分群并生成可视化结果',
+  heatmap: '用户行为热力图：生成交互式热力图展示用户行为模式',
+  funnel: '转化漏斗分析：计算转化路径和各阶段转化率',
+  rfm: 'RFM分析：按最近购买时间、购买频率和消费金额对用户分层',
+  basket: '购物篮分析：挖掘经常一起购买的商品组合',
+  association: '关联规则分析：发现用户行为与商品之间的关联规则'
+};
+
+// 服务端返回本次任务的阶段列表之前显示的默认步骤
+const DEFAULT_STEPS = ['clean', 'kmeans', 'heatmap', 'funnel'];
+
+// 把已完成阶段的结果摘要合并成与 /results 相同结构的部分结果
+const mergeStageResults = (stages) => {
+  const merged = { image_urls: {}, charts: {} };
+  let hasResult = false;
+  Object.values(stages).forEach((stage) => {
+    if (!stage.result) return;
+    hasResult = true;
+    const { image_urls, charts, ...fields } = stage.result;
+    Object.assign(merged.image_urls, image_urls);
+    Object.assign(merged.charts, charts);
+    Object.assign(merged, fields);
+  });
+  return hasResult ? merged : null;
+};
+
 const AnalysisPage = () => {
   const { sessionId } = useParams();
   const navigate = useNavigate();
   const [analyzing, setAnalyzing] = useState(true);
   const [error, setError] = useState('');
   const [progress, setProgress] = useState(0);
+  const [stages, setStages] = useState({});
+  const [stepNames, setStepNames] = useState(DEFAULT_STEPS);
 
   useEffect(() => {
-    const startAnalysis = async () => {
+    let pollTimer = null;
+    let eventSource = null;
+    let cancelled = false;
+
+    const fail = (message) => {
+      setAnalyzing(false);
+      setError(message || '分析过程出错，请重试');
+    };
+
+    // 轮询任务状态（浏览器不支持 EventSource 或进度推送连接失败时使用）
+    const pollStatus = async () => {
       try {
-        // 启动分析过程
-        const response = await axios.post(`${API_URL}/analyze/${sessionId}`);
-        
-        // 分析完成，跳转到结果页面
-        navigate(`/results/${sessionId}`);
+        const response = await axios.get(`${API_URL}/results/${sessionId}`);
+        if (cancelled) return;
+        const { status, progress: jobProgress, message, stages: jobStages } = response.data;
+
+        if (status === 'done' || status === 'success') {
+          // 分析完成，跳转到结果页面
+          setProgress(100);
+          navigate(`/results/${sessionId}`);
+          return;
+        }
+        if (status === 'failed' || status === 'error') {
+          fail(message);
+          return;
+        }
+        setProgress(jobProgress || 0);
+        if (jobStages) {
+          setStages(Object.fromEntries(jobStages.map((stage) => [stage.name, stage])));
+          setStepNames(jobStages.map((stage) => stage.name));
+        }
+        pollTimer = setTimeout(pollStatus, 1000);
       } catch (err) {
-        setAnalyzing(false);
-        setError(err.response?.data?.detail || '分析过程出错，请重试');
+        if (cancelled) return;
+        fail(err.response?.data?.detail || '获取分析进度失败，请重试');
       }
     };
 
-    // 模拟进度，实际进度无法获取，这里只是提供视觉反馈
-    const progressInterval = setInterval(() => {
-      setProgress((prevProgress) => {
-        // 模拟进度，最大到95%，实际完成后会跳转
-        const newProgress = prevProgress + Math.random() * 3;
-        return newProgress > 95 ? 95 : newProgress;
+    // 订阅服务端推送的进度事件，每个阶段完成后立即展示其结果
+    const subscribe = () => {
+      eventSource = new EventSource(`${API_URL}/progress/${sessionId}`);
+      eventSource.addEventListener('stage', (event) => {
+        const stage = JSON.parse(event.data);
+        setStages((prev) => ({ ...prev, [stage.name]: stage }));
+      });
+      eventSource.addEventListener('progress', (event) => {
+        const data = JSON.parse(event.data);
+        setProgress(data.progress || 0);
+        if (data.stages && data.stages.length > 0) {
+          setStepNames(data.stages);
+        }
+      });
+      eventSource.addEventListener('done', () => {
+        eventSource.close();
+        setProgress(100);
+        navigate(`/results/${sessionId}`);
+      });
+      eventSource.addEventListener('failed', (event) => {
+        eventSource.close();
+        fail(JSON.parse(event.data).message);
       });
-    }, 500);
+      eventSource.onerror = () => {
+        // 连接中断时浏览器会自动重连；连接被拒绝（readyState 为 CLOSED）时改为轮询
+        if (eventSource.readyState === EventSource.CLOSED && !cancelled) {
+          pollStatus();
+        }
+      };
+    };
+
+    const startAnalysis = async () => {
+      try {
+        // 提交分析任务，服务端立即返回任务ID
+        await axios.post(`${API_URL}/analyze/${sessionId}`);
+        if (cancelled) return;
+        if (window.EventSource) {
+          subscribe();
+        } else {
+          pollStatus();
+        }
+      } catch (err) {
+        fail(err.response?.data?.detail || '分析过程出错，请重试');
+      }
+    };
 
     startAnalysis();
 
     return () => {
-      clearInterval(progressInterval);
+      cancelled = true;
+      clearTimeout(pollTimer);
+      if (eventSource) eventSource.close();
     };
   }, [sessionId, navigate]);
 
@@ -45,9 +141,14 @@ const AnalysisPage = () => {
     setAnalyzing(true);
     setError('');
     setProgress(0);
+    setStages({});
+    setStepNames(DEFAULT_STEPS);
     navigate('/');
   };
 
+  // 已完成阶段的结果，整体分析结束前先行展示
+  const partialResults = mergeStageResults(stages);
+
   return (
     <div className="max-w-3xl mx-auto">
       <div className="text-center mb-8">
@@ -76,38 +177,31 @@ const AnalysisPage = () => {
             <div className="bg-gray-50 p-4 rounded-md">
               <h4 className="text-sm font-medium text-gray-900 mb-2">分析步骤</h4>
               <ul className="space-y-3">
-                <li className="flex items-start">
-                  <div className={`mt-0.5 h-5 w-5 flex items-center justify-center rounded-full ${
-                    progress > 10 ? 'bg-green-500' : 'bg-gray-300'
-                  }`}>
-                    <span className="text-white text-xs">{progress > 10 ? '✓' : '1'}</span>
-                  </div>
-                  <span className="ml-2 text-sm text-gray-700">数据清洗：识别并移除标记为"脏数据"的行，准备分析数据集</span>
-                </li>
-                <li className="flex items-start">
-                  <div className={`mt-0.5 h-5 w-5 flex items-center justify-center rounded-full ${
-                    progress > 40 ? 'bg-green-500' : 'bg-gray-300'
-                  }`}>
-                    <span className="text-white text-xs">{progress > 40 ? '✓' : '2'}</span>
-                  </div>
-                  <span className="ml-2 text-sm text-gray-700">K-means聚类分析：对用户进行分群并生成可视化结果</span>
-                </li>
-                <li className="flex items-start">
-                  <div className={`mt-0.5 h-5 w-5 flex items-center justify-center rounded-full ${
-                    progress > 70 ? 'bg-green-500' : 'bg-gray-300'
-                  }`}>
-                    <span className="text-white text-xs">{progress > 70 ? '✓' : '3'}</span>
-                  </div>
-                  <span className="ml-2 text-sm text-gray-700">用户行为热力图：生成交互式热力图展示用户行为模式</span>
-                </li>
-                <li className="flex items-start">
-                  <div className={`mt-0.5 h-5 w-5 flex items-center justify-center rounded-full ${
-                    progress > 90 ? 'bg-green-500' : 'bg-gray-300'
-                  }`}>
-                    <span className="text-white text-xs">{progress > 90 ? '✓' : '4'}</span>
-                  </div>
-                  <span className="ml-2 text-sm text-gray-700">转化漏斗分析：计算转化路径和各阶段转化率</span>
-                </li>
+                {stepNames.map((name, index) => {
+                  const stage = stages[name] || {};
+                  const done = stage.status === 'done';
+                  const skipped = stage.status === 'skipped';
+                  return (
+                    <li key={name} className="flex items-start">
+                      <div className={`mt-0.5 h-5 w-5 flex items-center justify-center rounded-full ${
+                        done ? 'bg-green-500' : stage.status === 'running' ? 'bg-primary-400' : 'bg-gray-300'
+                      }`}>
+                        <span className="text-white text-xs">{done ? '✓' : skipped ? '–' : index + 1}</span>
+                      </div>
+                      <span className={`ml-2 text-sm ${skipped ? 'text-gray-400' : 'text-gray-700'}`}>
+                        {STEP_LABELS[name] || name}
+                        {done && stage.rows != null && (
+                          <span className="ml-2 text-xs text-gray-500">
+                            （{stage.rows} 行{stage.duration != null ? `，${stage.duration} 秒` : ''}）
+                          </span>
+                        )}
+                        {skipped && (
+                          <span className="ml-2 text-xs text-gray-400">（已跳过：{stage.reason}）</span>
+                        )}
+                      </span>
+                    </li>
+                  );
+                })}
               </ul>
             </div>
 
@@ -146,6 +240,12 @@ const AnalysisPage = () => {
           </div>
         </div>
       )}
+
+      {analyzing && partialResults && (
+        <div className="mt-8">
+          <AnalysisResult results={partialResults} />
+        </div>
+      )}
     </div>
   );
 };
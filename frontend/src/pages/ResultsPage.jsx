@@ -17,20 +17,10 @@ const ResultsPage = () => {
       try {
         const response = await axios.get(`${API_URL}/results/${sessionId}`);
         
-        if (response.data.status === 'success') {
-          // 如果只有图片URL，则需要再获取完整的分析结果
-          if (response.data.image_urls && !response.data.kmeans_results) {
-            try {
-              const detailResponse = await axios.post(`${API_URL}/analyze/${sessionId}`);
-              setResults(detailResponse.data);
-            } catch (detailErr) {
-              // 如果获取详细分析失败，至少显示图片
-              setResults(response.data);
-            }
-          } else {
-            setResults(response.data);
-          }
-        } else if (response.data.status === 'pending') {
+        const { status } = response.data;
+        if (status === 'done' || status === 'success') {
+          setResults(response.data);
+        } else if (status === 'queued' || status === 'running' || status === 'pending') {
           // 如果分析还在进行中，重定向回分析页面
           navigate(`/analysis/${sessionId}`);
         } else {
@@ -49,8 +39,9 @@ const ResultsPage = () => {
   }, [sessionId, navigate]);
 
   const handleDownloadImage = (imageUrl, imageName) => {
-    // 确保图片URL是完整的
-    const fullImageUrl = imageUrl.startsWith('http') ? imageUrl : `${API_URL}${imageUrl}`;
+    // 确保图片URL是完整的，下载时请求打印分辨率
+    const printUrl = `${imageUrl}${imageUrl.includes('?') ? '&' : '?'}size=print`;
+    const fullImageUrl = printUrl.startsWith('http') ? printUrl : `${API_URL}${printUrl}`;
     
     // 使用fetch获取图片数据
     fetch(fullImageUrl)